@@ -23,15 +23,24 @@
 
 import logging
 Logger = logging.getLogger(__name__)
-from io import BytesIO, TextIOWrapper, BufferedReader
+from os import path, stat
+from io import IOBase, BytesIO, SEEK_END
 from collections import OrderedDict
 from construct.lib import Container
-from datetime import datetime
-from functools import wraps
+from functools import wraps, partial
+from heapq import heapify, heappush, heappop
+from types import MappingProxyType
+import hashlib
 
 from .common.task import BaseTask
 from .common.patterns import RegistryMetaclassMixin
 from .utils import FileMetadataMixin, StructureProperty
+from .streams import BufferStream, MemoryMappedStream, PrefetchStream, is_buffer
+from .checkpoint import Checkpoint
+from .indexing import SignatureIndex
+from .compression import open_source, COMPRESSIONS
+from .cleaning import clean_value, clean_view, compact_value
+from .serialization import ResultWriter
 
 class ParserMeta(RegistryMetaclassMixin, type):
     '''
@@ -44,32 +53,134 @@ class ParserMeta(RegistryMetaclassMixin, type):
         '''
         @RegistryMetaclassMixin._create_class
         '''
+        declared = sorted(
+            [(key, value) for key, value in attrs.items() if isinstance(value, StructureProperty)], 
+            key=lambda pair: pair[1].idx
+        )
+        inherited = [base for base in bases if hasattr(base, '_PROPERTIES')]
+        attrs['_RECORD_NAME'] = '%sRecord'%name
+        ## NOTE: subclasses that declare no structures of their own and have a single
+        ## parser base share its property table, descriptors and dependency indexes
+        if len(declared) == 0 and len(inherited) == 1:
+            for key, prop in inherited[0]._PROPERTIES.items():
+                if key in attrs:
+                    attrs[key] = prop.descriptor
+                if key.upper() in attrs:
+                    attrs[key.upper()] = prop.name
+            return super()._create_class(name, bases, attrs)
         attrs['_PROPERTIES'] = OrderedDict()
         properties  = attrs.get('_PROPERTIES')
         current_idx = 0
-        for base in bases:
-            if hasattr(base, '_PROPERTIES'):
-                for prop in base._PROPERTIES:
-                    properties[prop] = base._PROPERTIES.get(prop)
-                    properties.get(prop).idx = current_idx
-                    current_idx += 1
-                    new_property = property(
-                        properties.get(prop).get_property,
-                        properties.get(prop).set_property
-                    )
-                    attrs[prop] = new_property
-                    attrs[prop.upper()] = properties.get(prop).name
-        for key, value in sorted(
-            [(key, value) for key, value in attrs.items() if isinstance(value, StructureProperty)], 
-            key=lambda pair: pair[1].idx
-        ):
-            new_property = property(value.get_property, value.set_property)
+        for base in inherited:
+            for key, prop in base._PROPERTIES.items():
+                properties[key] = prop
+                prop.idx = current_idx
+                current_idx += 1
+                attrs[key] = prop.descriptor
+                attrs[key.upper()] = prop.name
+        for key, value in declared:
             properties[key] = value
-            properties.get(key).idx = current_idx
+            value.idx = current_idx
             current_idx += 1
-            attrs[key] = new_property
-            attrs[key.upper()] = properties.get(key).name
+            attrs[key] = value.descriptor
+            attrs[key.upper()] = value.name
+        attrs['_PARSE_ORDER'] = cls._sort_properties(name, properties)
+        attrs['_DEPENDENCIES'] = cls._resolve_dependencies(properties, attrs['_PARSE_ORDER'])
+        attrs['_PROPERTY_BITS'], attrs['_DEPENDENCY_MASKS'], attrs['_DEPENDENTS'] = \
+            cls._index_dependencies(properties)
         return super()._create_class(name, bases, attrs)
+    @staticmethod
+    def _sort_properties(name, properties):
+        '''
+        Args:
+            name: String                                    => name of the class being created
+            properties: OrderedDict<String, StructureProperty>  => properties of the class
+        Returns:
+            Tuple<String>
+            Names of properties in topological order of their dependencies,
+            where properties without ordering constraints keep declaration order.
+            Raises ValueError if the dependencies contain a cycle.
+        Preconditions:
+            name is of type String
+        '''
+        dependents = {key: list() for key in properties}
+        remaining = dict()
+        for key, prop in properties.items():
+            deps = set(dep for dep in (prop.deps or list()) if dep != key and dep in properties)
+            remaining[key] = len(deps)
+            for dep in deps:
+                dependents[dep].append(key)
+        ready = [(prop.idx, key) for key, prop in properties.items() if remaining[key] == 0]
+        heapify(ready)
+        order = list()
+        while len(ready) > 0:
+            _, key = heappop(ready)
+            order.append(key)
+            for dependent in dependents[key]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    heappush(ready, (properties[dependent].idx, dependent))
+        if len(order) != len(properties):
+            raise ValueError('found dependency cycle in parser %s (%s)'%(
+                name,
+                ', '.join(key for key in properties if remaining[key] > 0)
+            ))
+        return tuple(order)
+    @staticmethod
+    def _resolve_dependencies(properties, order):
+        '''
+        Args:
+            properties: OrderedDict<String, StructureProperty>  => properties of the class
+            order: Tuple<String>                                => properties in topological order
+        Returns:
+            Dict<String, Tuple<String>>
+            Transitive closure of the dependencies of each property (excluding
+            the property itself), in topological order
+        Preconditions:
+            order is the result of ParserMeta._sort_properties
+        '''
+        position = {key: idx for idx, key in enumerate(order)}
+        closures = dict()
+        for key in order:
+            closure = set()
+            for dep in (properties[key].deps or list()):
+                if dep != key and dep in properties:
+                    closure.add(dep)
+                    closure.update(closures[dep])
+            closures[key] = closure
+        return MappingProxyType({
+            key: tuple(sorted(closure, key=position.get)) \
+            for key, closure in closures.items()
+        })
+    @staticmethod
+    def _index_dependencies(properties):
+        '''
+        Args:
+            properties: OrderedDict<String, StructureProperty>  => properties of the class
+        Returns:
+            Tuple<Mapping<String, Integer>, Mapping<String, Integer>, Mapping<String, FrozenSet<String>>>
+            Read-only indexes of the properties of the class:
+                bit of each property in the satisfied bitset (see StructureProperty.set_property)
+                bitmask of the direct dependencies of each property
+                direct dependents of each property (reverse dependency index)
+        Preconditions:
+            N/A
+        '''
+        bits = {key: 1 << idx for idx, key in enumerate(properties)}
+        masks = dict()
+        dependents = {key: set() for key in properties}
+        for key, prop in properties.items():
+            mask = 0
+            for dep in (prop.deps or list()):
+                if dep != key and dep in properties:
+                    mask |= bits[dep]
+                    dependents[dep].add(key)
+            masks[key] = mask
+        return (
+            MappingProxyType(bits),
+            MappingProxyType(masks),
+            MappingProxyType({key: frozenset(value) for key, value in dependents.items()})
+        )
     @classmethod
     def _add_class(cls, name, new_cls):
         pass
@@ -125,10 +236,29 @@ class BaseParser(BaseTask, metaclass=ParserMeta):
     '''
     Base class for creating parsers
     '''
-    def __init__(self, source, *args, stream=None, **kwargs):
+    ## NOTE: bitset of properties with non-None values (see ParserMeta._index_dependencies)
+    _satisfied = 0
+    ## NOTE: whether parse_structure returns read-only filtered views 
+    ## of parsed values rather than cleaned copies (see BaseParser._clean_value)
+    CLEAN_VIEW = False
+    ## NOTE: whether parse_structure returns compact __slots__-based records 
+    ## rather than Containers (see cleaning.compact_value)
+    COMPACT_RESULTS = False
+    ## NOTE: opt-in cache of parsed structures (see caching.StructureCache)
+    STRUCTURE_CACHE = None
+    ## NOTE: opt-in instrumentation of parse_structure (see profiling.ParserProfiler)
+    PROFILER = None
+    def __init__(self, source, *args, stream=None, lazy=False, checkpoint=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.source = source
         self.stream = stream
+        self.lazy = lazy
+        self.checkpoint = checkpoint
+        self.__targets = None
+        self.__attempted = set()
+        ## NOTE: exception raised by each structure that failed to parse since
+        ## the last parse or reset (under None if raised outside of any structure)
+        self.__failures = dict()
     @property
     def source(self):
         '''
@@ -140,8 +270,9 @@ class BaseParser(BaseTask, metaclass=ParserMeta):
         '''
         Setter for source
         '''
-        assert isinstance(value, (str, bytes, bytearray))
+        assert isinstance(value, str) or is_buffer(value)
         self.__source = value
+        self._fingerprint = None
     @property
     def stream(self):
         '''
@@ -153,32 +284,90 @@ class BaseParser(BaseTask, metaclass=ParserMeta):
         '''
         Setter for stream
         '''
-        assert value is None or isinstance(value, (TextIOWrapper, BufferedReader, BytesIO))
+        assert value is None or (isinstance(value, IOBase) and value.readable())
         self.__stream = value
-    def _clean_value(self, value, serialize=False):
+    @property
+    def lazy(self):
+        '''
+        Getter for lazy
+        '''
+        return self.__lazy
+    @lazy.setter
+    def lazy(self, value):
+        '''
+        Setter for lazy
+        '''
+        assert isinstance(value, bool)
+        self.__lazy = value
+    @property
+    def checkpoint(self):
+        '''
+        Getter for checkpoint
+        '''
+        return self.__checkpoint
+    @checkpoint.setter
+    def checkpoint(self, value):
+        '''
+        Setter for checkpoint
+        '''
+        assert value is None or isinstance(value, Checkpoint)
+        self.__checkpoint = value
+    @property
+    def failures(self):
+        '''
+        Getter for failures
+        '''
+        return self.__failures
+    def _clean_value(self, value, serialize=False, view=None):
         '''
         Args:
             value: Any          => value to be converted
             serialize: Boolean  => transform values recursively to be JSON-serializable
+            view: Boolean       => return a read-only filtered view instead of a copy
+                                   (defaults to self.CLEAN_VIEW)
         Returns:
             Any
-            Raw value if it is not of type Container, else recursively removes
-            any key beginning with 'Raw'
+            Raw value if it is not of type Container, else removes
+            any key beginning with 'Raw' or '_' at every level
+            (see cleaning.clean_value, cleaning.clean_view and
+            cleaning.compact_value)
         Preconditions:
             serialize is of type Boolean
+            view is None or of type Boolean
         '''
-        assert isinstance(serialize, bool)
-        cleaned = value
-        if issubclass(type(value), Container):
-            cleaned = Container()
-            for key in value.keys():
-                if not (key.startswith('Raw') or key.startswith('_')):
-                    cleaned[key] = self._clean_value(value[key], serialize)
-        elif isinstance(value, list):
-            cleaned = list(map(lambda entry: self._clean_value(entry, serialize), value))
-        elif isinstance(value, datetime) and serialize:
-            cleaned = value.strftime('%Y-%m-%d %H:%M:%S.%f%z')
-        return cleaned
+        if view is None:
+            view = self.CLEAN_VIEW
+        if view:
+            return clean_view(value, serialize)
+        elif self.COMPACT_RESULTS:
+            return compact_value(value, serialize, self._RECORD_NAME)
+        return clean_value(value, serialize)
+    def get_fingerprint(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            String
+            Fingerprint identifying the content of self.source (see 
+            BaseParser._create_fingerprint), computed once per source
+        Preconditions:
+            N/A
+        '''
+        if self._fingerprint is None:
+            self._fingerprint = self._create_fingerprint()
+        return self._fingerprint
+    def _create_fingerprint(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            String
+            New fingerprint identifying the content of self.source, 
+            or None if the source cannot be fingerprinted
+        Preconditions:
+            N/A
+        '''
+        return None
     def create_stream(self, persist=False):
         '''
         Args:
@@ -207,19 +396,15 @@ class BaseParser(BaseTask, metaclass=ParserMeta):
             isinstance(result, dict) and \
             isinstance(result.get('err'), Exception)
         ):
-            for prop in self._PROPERTIES.values():
-                if (
-                    prop.name != structure and \
-                    prop.deps is not None and \
-                    structure in prop.deps
-                ):
-                    Logger.error(
-                        'Property %s depends on %s, aborting parsing task'%(
-                            prop.name, 
-                            structure
-                        )
+            dependents = self._DEPENDENTS.get(structure)
+            if dependents:
+                Logger.error(
+                    'Property %s depends on %s, aborting parsing task'%(
+                        ', '.join(sorted(dependents)), 
+                        structure
                     )
-                    return False
+                )
+                return False
         return True
     def __enter__(self):
         '''
@@ -259,23 +444,20 @@ class BaseParser(BaseTask, metaclass=ParserMeta):
         '''
         super()._postamble()
         self.__exit__(None, None, None)
-    @contexted
-    def parse_structure(self, structure, *args, **kwargs):
+    def _parse_dependencies(self, structure, args, kwargs):
         '''
         Args:
-            structure: String   => the structure to parse
-        Returns
-            Dict<String, Any>
-            Result(s) from parsing the structure if known, raise ValueError otherwise
+            structure: String           => the structure to resolve dependencies for
+            args: Tuple<Any>            => positional arguments to parse_structure
+            kwargs: Dict<String, Any>   => keyword arguments to parse_structure
+        Procedure:
+            Parse any dependencies of structure that are not already set, and 
+            update kwargs in place with the values of any properties it names
         Preconditions:
             structure is of type String
+            args is of type Tuple<Any>
+            kwargs is of type Dict<String, Any>
         '''
-        assert isinstance(structure, str)
-        if not (structure in self._PROPERTIES):
-            raise ValueError('%s is not a valid structure'%structure)
-        parser = '_parse_%s'%structure
-        if not hasattr(self, parser):
-            raise ValueError('no parser implemented for structure %s'%structure)
         deps = self._PROPERTIES.get(structure).deps
         if deps is not None:
             for dep in deps:
@@ -296,41 +478,367 @@ class BaseParser(BaseTask, metaclass=ParserMeta):
         for kwarg in kwargs:
             if kwarg != structure and kwarg in self._PROPERTIES:
                 kwargs[kwarg] = getattr(self, kwarg)
+    @contexted
+    def parse_structure(self, structure, *args, **kwargs):
+        '''
+        Args:
+            structure: String   => the structure to parse
+        Returns
+            Dict<String, Any>
+            Result(s) from parsing the structure if known, raise ValueError otherwise
+        Preconditions:
+            structure is of type String
+        '''
+        assert isinstance(structure, str)
+        if not (structure in self._PROPERTIES):
+            raise ValueError('%s is not a valid structure'%structure)
+        parser = '_parse_%s'%structure
+        if not hasattr(self, parser):
+            raise ValueError('no parser implemented for structure %s'%structure)
+        cache_key = None
+        if self.STRUCTURE_CACHE is not None and len(args) == 0 and len(kwargs) == 0:
+            fingerprint = self.get_fingerprint()
+            if fingerprint is not None:
+                ## NOTE: the result depends on where in the stream parsing starts
+                cache_key = self.STRUCTURE_CACHE.create_key(
+                    type(self), 
+                    structure, 
+                    fingerprint, 
+                    self.stream.tell()
+                )
+                found, entry = self.STRUCTURE_CACHE.get(cache_key)
+                if found:
+                    ## NOTE: later structures are parsed from where this one ended,
+                    ## so move the stream there as if it had been parsed
+                    result, end = entry
+                    self.stream.seek(end)
+                    return result
+        profiler = self.PROFILER
+        if profiler is not None and profiler.enabled:
+            result = profiler.profile(self, structure, parser, args, kwargs)
+        else:
+            self._parse_dependencies(structure, args, kwargs)
+            result = self._clean_value(getattr(self, parser)(*args, **kwargs))
+        if cache_key is not None:
+            self.STRUCTURE_CACHE.set(cache_key, (result, self.stream.tell()))
+        return result
+    def _clear_properties(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Set all non-dynamic properties to None and forget which
+            structures have been attempted, so that the next parse starts
+            from a clean state
+        Preconditions:
+            N/A
+        '''
+        for prop in self._PROPERTIES.values():
+            if not prop.dynamic:
+                setattr(self, prop.name, None)
+        self._satisfied = 0
+        self.__attempted = set()
+        self.__failures = dict()
+    @contexted
+    def at(self, offset, structure, *args, **kwargs):
+        '''
+        Args:
+            offset: Integer     => offset in the source to parse structure at
+            structure: String   => the structure to parse
+        Returns:
+            Any
+            Cleaned result of parsing structure from self.stream at offset 
+            (see BaseParser._clean_value).  Since the result depends on offset,
+            dependencies are not parsed and neither the value of the property
+            nor the structure cache are used or updated.
+        Preconditions:
+            offset is of type Integer (>= 0)
+            structure is of type String
+        '''
+        assert isinstance(offset, int) and offset >= 0
+        assert isinstance(structure, str)
+        if not (structure in self._PROPERTIES):
+            raise ValueError('%s is not a valid structure'%structure)
+        parser = '_parse_%s'%structure
+        if not hasattr(self, parser):
+            raise ValueError('no parser implemented for structure %s'%structure)
+        self.stream.seek(offset)
         return self._clean_value(getattr(self, parser)(*args, **kwargs))
+    def reset(self, source, stream=None):
+        '''
+        Args:
+            source: Any     => new source to parse
+            stream: Any     => new stream for source (created on demand if None)
+        Returns:
+            BaseParser
+            self after closing the current stream, clearing all parsed 
+            properties and the checkpoint (which belongs to the previous 
+            source) and binding source and stream, so that one instance 
+            can be reused for many sources instead of constructing a new 
+            parser for each (see pooling.ParserInstancePool)
+        Preconditions:
+            source is valid for BaseParser.source
+            stream is valid for BaseParser.stream
+        '''
+        self.__exit__(None, None, None)
+        self._clear_properties()
+        self.checkpoint = None
+        self.source = source
+        self.stream = stream
+        return self
+    def _is_clean(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Boolean
+            Whether no property holds a parsed value, no structure has 
+            failed and no stream is bound (i.e. the state after BaseParser.reset)
+        Preconditions:
+            N/A
+        '''
+        return self._satisfied == 0 and \
+            self.stream is None and \
+            len(self.__attempted) == 0 and \
+            len(self.__failures) == 0 and \
+            all(getattr(self, '__%s'%name, None) is None for name in self._PROPERTIES)
+    def _plan_structures(self, targets=None):
+        '''
+        Args:
+            targets: Iterable<String>   => structures to parse (all if None)
+        Returns:
+            List<String>
+            Non-dynamic structures that must be parsed to obtain targets 
+            (targets plus the closure of their dependencies), in topological order
+        Preconditions:
+            targets is None or an iterable of String
+        '''
+        if targets is None:
+            required = set(self._PROPERTIES)
+        else:
+            required = set()
+            for target in targets:
+                if not (target in self._PROPERTIES):
+                    raise ValueError('%s is not a valid structure'%target)
+                required.add(target)
+                required.update(self._DEPENDENCIES.get(target))
+        return [
+            prop for prop in self._PARSE_ORDER \
+            if prop in required and not self._PROPERTIES.get(prop).dynamic
+        ]
+    def _parse_structures(self, structures):
+        '''
+        Args:
+            structures: Iterable<String>    => structures to parse, in order
+        Returns:
+            Boolean
+            Parse each structure that has not already been attempted and set
+            the result on self, returns False if parsing was aborted
+            (see BaseParser._parse_continue) and True otherwise.  If 
+            self.checkpoint is set, parsed structures are saved whenever
+            it is due (see Checkpoint.due) and once more at the end.
+        Preconditions:
+            structures is an iterable of String
+        '''
+        checkpoint = self.checkpoint
+        pending, saved = 0, 0
+        try:
+            for structure in structures:
+                if structure in self.__attempted:
+                    continue
+                self.__attempted.add(structure)
+                try:
+                    result = self.parse_structure(structure)
+                    setattr(self, structure, result)
+                except Exception as e:
+                    Logger.error('Failed to parse structure %s (%s)'%(structure, str(e)))
+                    self.__failures[structure] = e
+                    result = dict(err=e)
+                    setattr(self, structure, None)
+                if not self._parse_continue(structure, result):
+                    return False
+                if checkpoint is not None and getattr(self, '__%s'%structure, None) is not None:
+                    pending += 1
+                    offset = self.stream.tell()
+                    if checkpoint.due(pending, abs(offset - saved)):
+                        self._save_structures()
+                        pending, saved = 0, offset
+            return True
+        finally:
+            if pending > 0:
+                self._save_structures()
+    def _save_structures(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Save the values of all parsed non-dynamic structures and the 
+            current stream offset to self.checkpoint
+        Preconditions:
+            self.checkpoint is not None
+            self.stream is not None
+        '''
+        try:
+            self.checkpoint.save(
+                structures={
+                    name: getattr(self, '__%s'%name) \
+                    for name, prop in self._PROPERTIES.items() \
+                    if not prop.dynamic and getattr(self, '__%s'%name, None) is not None
+                },
+                structures_offset=self.stream.tell()
+            )
+        except Exception as e:
+            Logger.error('Failed to save checkpoint %s (%s)'%(self.checkpoint.path, str(e)))
+    def _restore_structures(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Set the values of structures saved in self.checkpoint (if it 
+            belongs to this parser and source) and mark them as attempted
+            so they are not parsed again, then seek to the offset the last 
+            of them ended at so the remaining structures are parsed from 
+            where they would have been
+        Preconditions:
+            self.checkpoint is not None
+            self.stream is not None
+        '''
+        state = self.checkpoint.load(self)
+        if state is None:
+            return
+        for name, value in state.get('structures', dict()).items():
+            prop = self._PROPERTIES.get(name)
+            if prop is not None and not prop.dynamic:
+                setattr(self, name, value)
+                self.__attempted.add(name)
+        if state.get('structures_offset') is not None:
+            self.stream.seek(state.get('structures_offset'))
+    def _parse_lazy(self, structure):
+        '''
+        Args:
+            structure: String   => structure to parse
+        Procedure:
+            Parse structure and the closure of its dependencies if they 
+            have not already been attempted.  Used when self.lazy is True to 
+            parse properties on first access (see StructureProperty.get_property).
+            NOTE: if self.stream is not set, it is created for the access and 
+            left open for later ones, so the caller is responsible for closing
+            it (i.e. by using the parser as a context manager, or calling 
+            BaseParser.__exit__ once done accessing properties).
+        Preconditions:
+            structure is of type String
+        '''
+        assert isinstance(structure, str)
+        if not (structure in self.__attempted):
+            self._parse_structures(self._plan_structures([structure]))
     def _process_task(self):
         '''
         Args:
             N/A
         Procedure:
             Attempt to parse the stream based on
-            the properites defined on the parser
+            the properites defined on the parser (or only
+            the properties requested in BaseParser.parse 
+            and their dependencies)
         Preconditions:
             N/A
         '''
         try:
-            for prop in self._PROPERTIES.values():
-                if not prop.dynamic:
-                    try:
-                        result = self.parse_structure(prop.name)
-                        setattr(self, prop.name, result)
-                    except Exception as e:
-                        Logger.error('Failed to parse structure %s (%s)'%(prop.name, str(e)))
-                        result = dict(err=e)
-                        setattr(self, prop.name, None)
-                    if not self._parse_continue(prop.name, result):
-                        break
+            if self.checkpoint is not None:
+                self._restore_structures()
+            self._parse_structures(self._plan_structures(self.__targets))
         except Exception as e:
             Logger.error('Unexpected exception while parsing %s (%s)'%(
                 type(self).__name__,
                 str(e)
             ))
+            self.__failures[None] = e
         return self
-    def parse(self):
+    def parse(self, only=None):
         '''
-        @BaseTask.run
+        Args:
+            only: Iterable<String>  => structures to parse (all if None)
+        Returns:
+            BaseParser
+            self after parsing the requested structures and the closure of 
+            their dependencies.  The stream is closed when parsing finishes,
+            but with self.lazy, accessing a structure that was not parsed 
+            reopens it (see BaseParser._parse_lazy).
+        Preconditions:
+            only is None or an iterable of String
         '''
-        self.run()
+        self.__targets = self._plan_structures(only)
+        self.__attempted = set()
+        self.__failures = dict()
+        try:
+            self.run()
+        finally:
+            self.__targets = None
         return self
+    async def aparse(self, only=None, executor=None):
+        '''
+        Args:
+            only: Iterable<String>  => structures to parse (all if None)
+            executor: Executor      => executor to parse in (default executor of the
+                                       running event loop if None)
+        Returns:
+            BaseParser
+            self after running BaseParser.parse in executor, so blocking reads 
+            do not stall the event loop.  NOTE: cancelling the awaiting task 
+            does not interrupt a parse that has already started.
+        Preconditions:
+            Called from a coroutine running in an event loop
+        '''
+        ## NOTE: asyncio is imported here rather than at package import, since 
+        ## only coroutines use it (and it is already loaded when they run)
+        import asyncio
+        await asyncio.get_running_loop().run_in_executor(executor, partial(self.parse, only))
+        return self
+    def get_results(self, serialize=False):
+        '''
+        Args:
+            serialize: Boolean  => transform values to be JSON-serializable
+        Returns:
+            Container<String, Any>
+            Cleaned values of all non-dynamic properties of this parser
+            (see BaseParser._clean_value)
+        Preconditions:
+            serialize is of type Boolean
+        '''
+        assert isinstance(serialize, bool)
+        return clean_value(self._get_values(), serialize)
+    def _get_values(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Container<String, Any>
+            Uncleaned values of all non-dynamic properties of this parser
+        Preconditions:
+            N/A
+        '''
+        return Container(
+            **{key:getattr(self, prop.name) for key,prop in self._PROPERTIES.items() if not prop.dynamic}
+        )
+    def write_results(self, fhandle, format='ndjson', fields=None):
+        '''
+        Args:
+            fhandle: TextIO         => file-like object to write to
+            format: String          => output format (see ResultWriter.FORMATS)
+            fields: List<String>    => CSV columns (see ResultWriter)
+        Returns:
+            Integer
+            Number of results written.  The results of this parser are encoded
+            straight to fhandle (see serialization.ResultWriter) without 
+            building a cleaned copy.
+        Preconditions:
+            fhandle implements write
+            format is of type String
+            fields is None or of type List<String>
+        '''
+        with ResultWriter(fhandle, format, fields) as writer:
+            writer.write(self._get_values())
+        return writer.count
     def __repr__(self):
         return '%s(%s, stream=%s)'%(
             type(self).__name__,
@@ -344,28 +852,801 @@ class BaseParser(BaseTask, metaclass=ParserMeta):
 
 class ByteParser(BaseParser):
     '''
-    Class for parsing byte streams
+    Class for parsing byte streams.  The source can be any object 
+    supporting the buffer protocol (bytes, bytearray, memoryview, mmap, ...),
+    and window restricts parsing to an (offset, length) slice of it 
+    without copying (see streams.BufferStream).
     '''
+    def __init__(self, source, *args, window=None, **kwargs):
+        self.window = window
+        super().__init__(source, *args, **kwargs)
+    @property
+    def window(self):
+        '''
+        Getter for window
+        '''
+        return self.__window
+    @window.setter
+    def window(self, value):
+        '''
+        Setter for window
+        '''
+        assert value is None or (
+            isinstance(value, tuple) and \
+            len(value) == 2 and \
+            isinstance(value[0], int) and value[0] >= 0 and \
+            (value[1] is None or (isinstance(value[1], int) and value[1] >= 0))
+        )
+        self.__window = value
+        self._fingerprint = None
+    def set_window(self, offset, length=None):
+        '''
+        Args:
+            offset: Integer => offset of the window into self.source
+            length: Integer => length of the window (defaults to remainder of source)
+        Procedure:
+            Close the current stream, clear all parsed properties and move the 
+            window, so that the same parser instance can parse consecutive
+            windows of one buffer (see parse_windows)
+        Preconditions:
+            offset is of type Integer (>= 0)
+            length is None or of type Integer (>= 0)
+        '''
+        self.__exit__(None, None, None)
+        self._clear_properties()
+        self.window = (offset, length)
+    def reset(self, source, stream=None, window=None):
+        '''
+        @BaseParser.reset
+        Args:
+            window: Tuple<Integer, Integer> => (offset, length) window into source
+        '''
+        self.window = window
+        return super().reset(source, stream)
+    def _create_fingerprint(self):
+        '''
+        @BaseParser._create_fingerprint
+        '''
+        source = self.source
+        if isinstance(source, str):
+            source = source.encode('UTF-8')
+        elif self.window is not None:
+            with BufferStream(source, *self.window) as stream:
+                return hashlib.blake2b(stream.getbuffer(), digest_size=16).hexdigest()
+        return hashlib.blake2b(source, digest_size=16).hexdigest()
     def create_stream(self, persist=False):
         '''
         @BaseParser.create_stream
         '''
         assert isinstance(persist, bool)
-        stream = BytesIO(self.source)
+        if isinstance(self.source, bytes) and self.window is None:
+            ## NOTE: BytesIO shares the buffer of a bytes object until it is written to
+            stream = BytesIO(self.source)
+        elif self.window is not None:
+            stream = BufferStream(self.source, *self.window)
+        else:
+            stream = BufferStream(self.source)
         if persist:
             self.stream = stream
         return stream
 
+def parse_windows(parser, source, windows, *args, **kwargs):
+    '''
+    Args:
+        parser: Type<ByteParser>                    => parser class to parse windows with
+        source: Any                                 => buffer to parse windows of
+        windows: Iterable<Tuple<Integer, Integer>>  => (offset, length) of each window
+        args: Tuple<Any>                            => positional arguments to parser constructor
+        kwargs: Dict<String, Any>                   => keyword arguments to parser constructor
+    Returns:
+        Generator<ByteParser>
+        Single parser instance, yielded after parsing each window in turn 
+        (see ByteParser.set_window).  NOTE: the instance is reused, so its
+        results must be consumed before advancing the generator.
+    Preconditions:
+        parser is a subclass of ByteParser
+        source supports the buffer protocol
+    '''
+    assert isinstance(parser, type) and issubclass(parser, ByteParser)
+    instance = None
+    for offset, length in windows:
+        if instance is None:
+            instance = parser(source, *args, window=(offset, length), **kwargs)
+        else:
+            instance.set_window(offset, length)
+        yield instance.parse()
+
 class FileParser(FileMetadataMixin, BaseParser):
     '''
-    Class for parsing file streams
+    Class for parsing file streams.  If memory_map is True, the stream
+    is a MemoryMappedStream and _parse_* methods can use 
+    self.stream.getbuffer() or self.stream.view(offset, length) to
+    parse structures at arbitrary offsets without copying or seeking.
+    Otherwise, if prefetch is True (or a dict of keyword arguments to
+    PrefetchStream), the stream is a PrefetchStream that reads ahead in 
+    large blocks, which suits many small reads on slow or network storage.
+    If compression is set ('auto' to detect it, see compression.COMPRESSIONS)
+    or member is the name of a member of a zip or tar archive, the stream 
+    decompresses the file (or reads the member) as it is parsed (see 
+    compression.open_source), so nothing is extracted to disk first.  
+    decompression is a dict of keyword arguments to the decompressing 
+    stream (i.e. seek_interval, see compression.DecompressingStream).
     '''
+    def __init__(self, 
+        source, 
+        *args, 
+        memory_map=False, 
+        prefetch=False, 
+        compression=None, 
+        member=None, 
+        decompression=None, 
+        **kwargs):
+        super().__init__(source, *args, **kwargs)
+        self.memory_map = memory_map
+        self.prefetch = prefetch
+        self.compression = compression
+        self.member = member
+        self.decompression = decompression
+    @property
+    def memory_map(self):
+        '''
+        Getter for memory_map
+        '''
+        return self.__memory_map
+    @memory_map.setter
+    def memory_map(self, value):
+        '''
+        Setter for memory_map
+        '''
+        assert isinstance(value, bool)
+        self.__memory_map = value
+    @property
+    def prefetch(self):
+        '''
+        Getter for prefetch
+        '''
+        return self.__prefetch
+    @prefetch.setter
+    def prefetch(self, value):
+        '''
+        Setter for prefetch
+        '''
+        assert isinstance(value, (bool, dict))
+        self.__prefetch = value
+    @property
+    def compression(self):
+        '''
+        Getter for compression
+        '''
+        return self.__compression
+    @compression.setter
+    def compression(self, value):
+        '''
+        Setter for compression
+        '''
+        assert value is None or value == 'auto' or value in COMPRESSIONS
+        self.__compression = value
+    @property
+    def decompression(self):
+        '''
+        Getter for decompression
+        '''
+        return self.__decompression
+    @decompression.setter
+    def decompression(self, value):
+        '''
+        Setter for decompression
+        '''
+        assert value is None or isinstance(value, dict)
+        self.__decompression = value
+    @property
+    def member(self):
+        '''
+        Getter for member
+        '''
+        return self.__member
+    @member.setter
+    def member(self, value):
+        '''
+        Setter for member
+        '''
+        assert value is None or isinstance(value, str)
+        self.__member = value
+        self._fingerprint = None
+    def signature_index(self, signatures, alignment=1, cache_dir=None, index_path=None, rebuild=False):
+        '''
+        Args:
+            signatures: List<Bytes> => record signatures to index
+            alignment: Integer      => alignment of records in the file
+            cache_dir: String       => directory to store the index in (next to the file if None)
+            index_path: String      => path of the index (overrides cache_dir)
+            rebuild: Boolean        => whether to rescan even if a saved index matches
+        Returns:
+            SignatureIndex
+            Index of the offsets of signatures in the file, loaded from disk if 
+            one was saved for the same fingerprint (see FileParser._create_fingerprint),
+            otherwise built by scanning the file and saved for later analyses.
+            Lookups can be done with self.at(offset) or self.records(index).
+        Preconditions:
+            signatures is of type List<Bytes>
+            alignment is of type Integer (> 0)
+            cache_dir is None or of type String
+            index_path is None or of type String
+            rebuild is of type Boolean
+        '''
+        assert isinstance(rebuild, bool)
+        if self.compression is not None or self.member is not None:
+            raise ValueError('signature indexes are only supported for uncompressed files')
+        fingerprint = self.get_fingerprint()
+        if index_path is None:
+            index_path = SignatureIndex.get_path(self.source, fingerprint, signatures, alignment, cache_dir)
+        index = None if rebuild else SignatureIndex.load(index_path, signatures, alignment, fingerprint)
+        if index is None:
+            index = SignatureIndex.build(self.source, signatures, alignment, fingerprint)
+            if fingerprint is not None:
+                try:
+                    index.save(index_path)
+                except OSError as e:
+                    Logger.error('Failed to save signature index %s (%s)'%(index_path, str(e)))
+        return index
+    def reset(self, source, stream=None):
+        '''
+        @BaseParser.reset
+        '''
+        self._clear_metadata()
+        return super().reset(source, stream)
+    def _create_fingerprint(self):
+        '''
+        @BaseParser._create_fingerprint
+        Fingerprint is based on the absolute path, size, modification 
+        time and inode of the file, and on the compression and member 
+        it is decoded with
+        '''
+        try:
+            stat_result = stat(self.source)
+        except OSError:
+            return None
+        fingerprint = '%s:%d:%d:%d'%(
+            path.abspath(self.source), 
+            stat_result.st_size, 
+            stat_result.st_mtime_ns, 
+            stat_result.st_ino
+        )
+        ## NOTE: offsets and values depend on how the file is decoded
+        if self.compression is not None:
+            fingerprint += ':%s'%self.compression
+        if self.member is not None:
+            fingerprint += ':%s'%self.member
+        return fingerprint
     def create_stream(self, persist=False):
         '''
         @BaseParser.create_stream
         '''
         assert isinstance(persist, bool)
-        stream = open(self.source, 'rb')
+        if self.compression is not None or self.member is not None:
+            stream = open_source(
+                self.source, 
+                self.compression, 
+                self.member, 
+                **(self.decompression if self.decompression is not None else dict())
+            )
+        elif self.memory_map:
+            stream = MemoryMappedStream(self.source)
+        elif self.prefetch is not False:
+            stream = PrefetchStream(self.source, **(self.prefetch if isinstance(self.prefetch, dict) else dict()))
+        else:
+            stream = open(self.source, 'rb')
         if persist:
             self.stream = stream
         return stream
+
+class RecordStreamMixin(object):
+    '''
+    Mixin class for parsing sources that are sequences of records
+    (i.e. $MFT, $UsnJrnl, event logs).  Records are read through a single
+    reusable window buffer and yielded lazily by RecordStreamMixin.records,
+    so at most one window of records is held in memory at a time.  For example:
+    class MFTParser(FileRecordParser):
+        RECORD_PARSER   = MFTEntry
+        RECORD_SIZE     = 1024
+    for offset, entry in MFTParser(filepath, skip=lambda offset, record: record[:4] != b'FILE').records():
+        ...
+    '''
+    RECORD_PARSER       = None
+    RECORD_SIZE         = None
+    RECORD_HEADER_SIZE  = 0
+    WINDOW_SIZE         = 1024 * 1024
+    TAIL_ANCHOR_SIZE    = 4096
+
+    def __init__(self, source, *args, offset=0, end=None, record_size=None, stride=None, skip=None, window_size=None, **kwargs):
+        super().__init__(source, *args, **kwargs)
+        self.offset = offset
+        self.end = end
+        self.record_size = record_size if record_size is not None else self.RECORD_SIZE
+        self.stride = stride
+        self.skip = skip
+        self.window_size = window_size if window_size is not None else self.WINDOW_SIZE
+        self.tail_state = None
+        self._next_offset = None
+    @property
+    def offset(self):
+        '''
+        Getter for offset
+        '''
+        return self.__offset
+    @offset.setter
+    def offset(self, value):
+        '''
+        Setter for offset
+        '''
+        assert isinstance(value, int) and value >= 0
+        self.__offset = value
+    @property
+    def tail_state(self):
+        '''
+        Getter for tail_state
+        '''
+        return self.__tail_state
+    @tail_state.setter
+    def tail_state(self, value):
+        '''
+        Setter for tail_state
+        '''
+        assert value is None or isinstance(value, dict)
+        self.__tail_state = value
+    @property
+    def end(self):
+        '''
+        Getter for end
+        '''
+        return self.__end
+    @end.setter
+    def end(self, value):
+        '''
+        Setter for end
+        '''
+        assert value is None or (isinstance(value, int) and value >= 0)
+        self.__end = value
+    @property
+    def record_size(self):
+        '''
+        Getter for record_size
+        '''
+        return self.__record_size
+    @record_size.setter
+    def record_size(self, value):
+        '''
+        Setter for record_size
+        '''
+        assert value is None or callable(value) or (isinstance(value, int) and value > 0)
+        self.__record_size = value
+    @property
+    def stride(self):
+        '''
+        Getter for stride
+        '''
+        return self.__stride
+    @stride.setter
+    def stride(self, value):
+        '''
+        Setter for stride
+        '''
+        assert value is None or (isinstance(value, int) and value > 0)
+        self.__stride = value
+    @property
+    def skip(self):
+        '''
+        Getter for skip
+        '''
+        return self.__skip
+    @skip.setter
+    def skip(self, value):
+        '''
+        Setter for skip
+        '''
+        assert value is None or callable(value)
+        self.__skip = value
+    @property
+    def window_size(self):
+        '''
+        Getter for window_size
+        '''
+        return self.__window_size
+    @window_size.setter
+    def window_size(self, value):
+        '''
+        Setter for window_size
+        '''
+        assert isinstance(value, int) and value > 0
+        self.__window_size = value
+    def _get_record_size(self, offset, record):
+        '''
+        Args:
+            offset: Integer     => offset of the record in the source
+            record: memoryview  => view from the start of the record to the end of the
+                                   current window (at least RECORD_HEADER_SIZE bytes 
+                                   unless the source is exhausted)
+        Returns:
+            Integer
+            Size of the record at offset, or None/0 to stop iterating.  By default 
+            uses self.record_size, calling it with (offset, record) if it is callable.
+        Preconditions:
+            offset is of type Integer
+            record is of type memoryview
+        '''
+        if callable(self.record_size):
+            return self.record_size(offset, record)
+        return self.record_size
+    def _parse_record(self, offset, record):
+        '''
+        Args:
+            offset: Integer     => offset of the record in the source
+            record: memoryview  => view over the bytes of the record (only valid 
+                                   until the next record is read)
+        Returns:
+            Any
+            Parsed record, by default an instance of RECORD_PARSER after parsing
+        Preconditions:
+            offset is of type Integer
+            record is of type memoryview
+        '''
+        if self.RECORD_PARSER is None:
+            raise NotImplementedError('_parse_record is not implemented for type %s'%(type(self).__name__))
+        return self.RECORD_PARSER(bytes(record)).parse()
+    @staticmethod
+    def _fill(stream, view):
+        '''
+        Args:
+            stream: Any         => stream to read from
+            view: memoryview    => buffer to read into
+        Returns:
+            Integer
+            Number of bytes read into view, less than len(view) only
+            if the stream is exhausted
+        Preconditions:
+            stream implements readinto
+        '''
+        total = 0
+        while total < len(view):
+            read = stream.readinto(view[total:])
+            if not read:
+                break
+            total += read
+        return total
+    def _shift_window(self, stream, view, base, position, length):
+        '''
+        Args:
+            stream: Any         => stream being iterated over
+            view: memoryview    => window buffer
+            base: Integer       => offset in the source of the start of the window
+            position: Integer   => position in the window of the next record
+            length: Integer     => number of valid bytes in the window
+        Returns:
+            Tuple<Integer, Integer>
+            New base and length of the window after moving the next record to the
+            start of the window and filling the rest of the window from stream
+        Preconditions:
+            len(view) >= length - position
+        '''
+        if position >= length:
+            stream.seek(base + position)
+            remaining = 0
+        else:
+            remaining = length - position
+            view[:remaining] = view[position:length]
+        return base + position, remaining + self._fill(stream, view[remaining:])
+    def records(self, index=None):
+        '''
+        Args:
+            index: Iterable<Integer>    => offsets of records to parse (i.e. a SignatureIndex)
+        Returns:
+            Generator<Tuple<Integer, Any>>
+            Offset and parsed value of each record at the offsets in index
+            (see RecordStreamMixin._records_at) if index is not None, otherwise 
+            of each record in the source (see RecordStreamMixin._scan_records)
+        Preconditions:
+            index is None or iterable
+        '''
+        if index is not None:
+            return self._records_at(index)
+        return self._scan_records()
+    def _get_header_size(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Integer
+            Number of bytes needed to determine the size of a record
+        Preconditions:
+            self.record_size is not None
+        '''
+        if self.record_size is None:
+            raise ValueError('no record size specified for type %s'%(type(self).__name__))
+        return max(
+            self.record_size if isinstance(self.record_size, int) else self.RECORD_HEADER_SIZE, 
+            1
+        )
+    def _records_at(self, offsets):
+        '''
+        Args:
+            offsets: Iterable<Integer>  => offsets of records to parse
+        Returns:
+            Generator<Tuple<Integer, Any>>
+            Offset and parsed value (see RecordStreamMixin._parse_record) of the record
+            at each offset, read through a single stream.  Offsets where the record 
+            size is None/0 or the record is truncated are skipped.
+        Preconditions:
+            self.record_size is not None
+        '''
+        header_size = self._get_header_size()
+        stream = self.create_stream()
+        view = memoryview(bytearray(max(self.window_size, header_size)))
+        try:
+            for offset in offsets:
+                stream.seek(offset)
+                length = self._fill(stream, view[:header_size])
+                if length == 0:
+                    continue
+                with view[:length] as record:
+                    size = self._get_record_size(offset, record)
+                if not size:
+                    continue
+                if size > len(view):
+                    window = memoryview(bytearray(size))
+                    window[:length] = view[:length]
+                    view.release()
+                    view = window
+                if size > length:
+                    length += self._fill(stream, view[length:size])
+                if length < size:
+                    Logger.error('Found truncated record at offset %d'%offset)
+                    continue
+                with view[:size] as record:
+                    yield offset, self._parse_record(offset, record)
+        finally:
+            view.release()
+            stream.close()
+    def at(self, offset, structure=None, *args, **kwargs):
+        '''
+        @BaseParser.at
+        If structure is None, returns the parsed record at offset (see 
+        RecordStreamMixin._records_at), or None if there is no record there.
+        '''
+        if structure is not None:
+            return super().at(offset, structure, *args, **kwargs)
+        for _, record in self._records_at((offset,)):
+            return record
+        return None
+    def _scan_records(self, start=None, tailing=False):
+        '''
+        Args:
+            start: Integer      => offset to start scanning from (see below if None)
+            tailing: Boolean    => whether the source is still being written to, so
+                                   a truncated record at the end is expected (logged
+                                   at DEBUG rather than ERROR)
+        Returns:
+            Generator<Tuple<Integer, Any>>
+            Offset and parsed value (see RecordStreamMixin._parse_record) of each record 
+            starting from self.offset and before self.end (or the end of the source, or 
+            until a record size of None/0), skipping records for which 
+            self.skip(offset, record) is True.  A new stream
+            is created for iteration so that self.stream is unaffected.  If 
+            start is None and self.checkpoint is set, progress is saved periodically
+            (see Checkpoint.due) and iteration resumes from the last saved offset, 
+            so records after the last save may be yielded again after a crash.
+            While iterating, self._next_offset is the offset after the last record 
+            yielded or skipped (or of a truncated record at the end of the source).
+        Preconditions:
+            self.record_size is not None
+            start is None or of type Integer (>= 0)
+            tailing is of type Boolean
+        '''
+        header_size = self._get_header_size()
+        checkpoint = self.checkpoint if start is None else None
+        start, count = self.offset if start is None else start, 0
+        if checkpoint is not None:
+            state = self.checkpoint.load(self)
+            if state is not None and state.get('offset') is not None:
+                if state.get('complete'):
+                    return
+                start, count = state.get('offset'), state.get('records', 0)
+                Logger.info('Resuming %s at offset %d'%(type(self).__name__, start))
+        pending_records = pending_bytes = 0
+        self._next_offset = start
+        stream = self.create_stream()
+        view = memoryview(bytearray(max(self.window_size, header_size)))
+        try:
+            base, length = self._shift_window(stream, view, start, 0, 0)
+            position = 0
+            while True:
+                if length - position < header_size and length == len(view):
+                    base, length = self._shift_window(stream, view, base, position, length)
+                    position = 0
+                if position >= length:
+                    break
+                offset = base + position
+                if self.end is not None and offset >= self.end:
+                    break
+                with view[position:length] as record:
+                    size = self._get_record_size(offset, record)
+                if not size:
+                    break
+                elif position + size > length:
+                    if length < len(view):
+                        if tailing:
+                            Logger.debug('Found partially written record at offset %d'%offset)
+                        else:
+                            Logger.error('Found truncated record at offset %d'%offset)
+                        break
+                    if size > len(view):
+                        remaining = length - position
+                        window = memoryview(bytearray(size))
+                        window[:remaining] = view[position:length]
+                        view.release()
+                        view = window
+                        base, length = offset, remaining + self._fill(stream, view[remaining:])
+                    else:
+                        base, length = self._shift_window(stream, view, base, position, length)
+                    position = 0
+                    continue
+                advance = self.stride if self.stride is not None else size
+                self._next_offset = offset + advance
+                with view[position:position + size] as record:
+                    if self.skip is None or not self.skip(offset, record):
+                        yield offset, self._parse_record(offset, record)
+                        count += 1
+                position += advance
+                if checkpoint is not None:
+                    pending_records += 1
+                    pending_bytes += advance
+                    if checkpoint.due(pending_records, pending_bytes):
+                        checkpoint.save(offset=base + position, records=count)
+                        pending_records = pending_bytes = 0
+            if checkpoint is not None:
+                checkpoint.save(offset=base + position, records=count, complete=True)
+        finally:
+            view.release()
+            stream.close()
+    def _get_identity(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Tuple<Integer, Integer>
+            Device and inode of the source if it is a file, otherwise None
+        Preconditions:
+            N/A
+        '''
+        if not isinstance(self.source, str):
+            return None
+        stat_result = stat(self.source)
+        return (stat_result.st_dev, stat_result.st_ino)
+    def _get_anchor(self, stream, offset):
+        '''
+        Args:
+            stream: Any     => stream of the source
+            offset: Integer => offset parsing stopped at
+        Returns:
+            String
+            Hash of the (up to) TAIL_ANCHOR_SIZE bytes before offset, used to
+            detect that the parsed part of the source was replaced
+        Preconditions:
+            stream is seekable
+            offset is of type Integer (>= self.offset)
+        '''
+        length = min(self.TAIL_ANCHOR_SIZE, offset - self.offset)
+        if length <= 0:
+            return None
+        stream.seek(offset - length)
+        return hashlib.blake2b(stream.read(length), digest_size=16).hexdigest()
+    def _check_tail(self, stream, state, size):
+        '''
+        Args:
+            stream: Any                 => stream of the source
+            state: Dict<String, Any>    => tail state from the previous run (see RecordStreamMixin.tail)
+            size: Integer               => current size of the source
+        Returns:
+            String
+            Why the source cannot be parsed from the offset in state 
+            ('rotated', 'truncated' or 'replaced'), or None if it can
+        Preconditions:
+            stream is seekable
+        '''
+        if state.get('identity') != self._get_identity():
+            return 'rotated'
+        elif size < state.get('offset'):
+            return 'truncated'
+        elif state.get('anchor') != self._get_anchor(stream, state.get('offset')):
+            return 'replaced'
+        return None
+    def reset(self, *args, **kwargs):
+        '''
+        @BaseParser.reset
+        Also forgets where iterating over and tailing the previous source stopped
+        '''
+        self.tail_state = None
+        self._next_offset = None
+        return super().reset(*args, **kwargs)
+    def tail(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Generator<Tuple<Integer, Any>>
+            Offset and parsed value of each record appended to the source since
+            the last call (see RecordStreamMixin.records), for sources that grow
+            (i.e. $UsnJrnl:$J, event logs).  Where parsing stopped is kept in
+            self.tail_state (and in self.checkpoint if it is set, so polling can
+            continue across runs), along with the identity of the file and a 
+            hash of the bytes before that offset.  If the source was rotated 
+            (different file), truncated or replaced, all records are parsed 
+            again.  A record that is only partially written is parsed once it 
+            is complete.
+        Preconditions:
+            self.record_size is not None
+        '''
+        state = self.tail_state
+        if state is None and self.checkpoint is not None:
+            saved = self.checkpoint.load(self, match_fingerprint=False)
+            state = saved.get('tail') if saved is not None else None
+        start = self.offset
+        stream = self.create_stream()
+        try:
+            size = stream.seek(0, SEEK_END)
+            if state is not None:
+                reason = self._check_tail(stream, state, size)
+                if reason is None:
+                    start = state.get('offset')
+                else:
+                    Logger.info('Source %s was %s, parsing from the start'%(repr(self.source), reason))
+        finally:
+            stream.close()
+        try:
+            if start < size:
+                yield from self._scan_records(start, tailing=True)
+            else:
+                self._next_offset = start
+        finally:
+            stream = self.create_stream()
+            try:
+                self.tail_state = dict(
+                    offset=self._next_offset,
+                    identity=self._get_identity(),
+                    anchor=self._get_anchor(stream, self._next_offset)
+                )
+            finally:
+                stream.close()
+            if self.checkpoint is not None:
+                self.checkpoint.save(tail=self.tail_state)
+    def write_results(self, fhandle, format='ndjson', fields=None):
+        '''
+        @BaseParser.write_results
+        Writes one result per record as it is parsed (see RecordStreamMixin.records),
+        with the offset of the record as the first field (and the record itself as
+        value if it is not a Container).
+        '''
+        with ResultWriter(fhandle, format, fields) as writer:
+            for offset, record in self.records():
+                if isinstance(record, BaseParser):
+                    record = record._get_values()
+                result = Container(offset=offset)
+                if isinstance(record, dict):
+                    result.update(record)
+                else:
+                    result.value = record
+                writer.write(result)
+        return writer.count
+    def __iter__(self):
+        return self.records()
+
+class ByteRecordParser(RecordStreamMixin, ByteParser):
+    '''
+    Class for parsing byte streams of records
+    '''
+    pass
+
+class FileRecordParser(RecordStreamMixin, FileParser):
+    '''
+    Class for parsing file streams of records
+    '''
+    pass
@@ -0,0 +1,250 @@
+## -*- coding: UTF-8 -*-
+## asynchronous.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+from os import cpu_count, stat
+from io import BytesIO
+from functools import partial
+from collections import deque
+from concurrent.futures import Executor
+from asyncio import get_running_loop, wait, ensure_future, FIRST_COMPLETED
+from construct.lib import Container
+
+from . import BaseParser
+from .parallel import parse_source
+
+def read_source(source, limit=None):
+    '''
+    Args:
+        source: String  => path to file to read
+        limit: Integer  => maximum size of file to read
+    Returns:
+        BytesIO
+        In-memory stream over the contents of source, or None if source
+        is larger than limit
+    Preconditions:
+        source is of type String
+        limit is None or of type Integer (> 0)
+    '''
+    assert isinstance(source, str)
+    assert limit is None or (isinstance(limit, int) and limit > 0)
+    with open(source, 'rb') as fhandle:
+        if limit is not None and stat(fhandle.fileno()).st_size > limit:
+            return None
+        return BytesIO(fhandle.read())
+
+class AsyncParserRunner(object):
+    '''
+    Class for parsing many sources with the same parser class from
+    asyncio code.  Blocking reads and parsing run in an executor with at 
+    most concurrency sources in flight, and results are yielded from an 
+    async generator as they complete (or in submission order if ordered 
+    is True).  If read_ahead is True, file sources of at most 
+    read_ahead_limit bytes are read into memory in the executor before 
+    parsing, so reads of upcoming sources overlap with parsing of earlier 
+    ones (larger files are parsed from their path), and at most about 
+    concurrency * read_ahead_limit bytes are read ahead at a time.  Since 
+    the parser is then given an in-memory stream, read_ahead cannot be 
+    combined with keyword arguments that control how FileParser opens 
+    the file (see READ_AHEAD_CONFLICTS).  Errors are captured per source 
+    (see parallel.parse_source) rather than raised.  For example:
+    runner = AsyncParserRunner(PrefetchParser, concurrency=32)
+    async for entry in runner.map(sources):
+        ...
+    Closing the generator (or cancelling the task iterating over it) cancels 
+    all sources that have not started parsing.
+    '''
+    READ_AHEAD_LIMIT = 16 * 1024 * 1024
+    ## NOTE: FileParser keyword arguments that are ignored when given a stream
+    READ_AHEAD_CONFLICTS = ('compression', 'member', 'decompression', 'memory_map', 'prefetch')
+
+    def __init__(self, 
+        parser, 
+        concurrency=None, 
+        executor=None, 
+        ordered=False, 
+        read_ahead=False, 
+        read_ahead_limit=None, 
+        args=None, 
+        kwargs=None):
+        self.parser = parser
+        self.concurrency = concurrency if concurrency is not None else (cpu_count() or 1) * 4
+        self.executor = executor
+        self.ordered = ordered
+        self.read_ahead = read_ahead
+        self.read_ahead_limit = read_ahead_limit if read_ahead_limit is not None else self.READ_AHEAD_LIMIT
+        self.args = args
+        self.kwargs = kwargs
+        if read_ahead and kwargs is not None:
+            conflicts = [name for name in self.READ_AHEAD_CONFLICTS if kwargs.get(name)]
+            if len(conflicts) > 0:
+                raise ValueError('read_ahead cannot be combined with %s'%', '.join(conflicts))
+    @property
+    def parser(self):
+        '''
+        Getter for parser
+        '''
+        return self.__parser
+    @parser.setter
+    def parser(self, value):
+        '''
+        Setter for parser
+        '''
+        assert isinstance(value, type) and issubclass(value, BaseParser)
+        self.__parser = value
+    @property
+    def concurrency(self):
+        '''
+        Getter for concurrency
+        '''
+        return self.__concurrency
+    @concurrency.setter
+    def concurrency(self, value):
+        '''
+        Setter for concurrency
+        '''
+        assert isinstance(value, int) and value > 0
+        self.__concurrency = value
+    @property
+    def executor(self):
+        '''
+        Getter for executor
+        '''
+        return self.__executor
+    @executor.setter
+    def executor(self, value):
+        '''
+        Setter for executor
+        '''
+        assert value is None or isinstance(value, Executor)
+        self.__executor = value
+    @property
+    def ordered(self):
+        '''
+        Getter for ordered
+        '''
+        return self.__ordered
+    @ordered.setter
+    def ordered(self, value):
+        '''
+        Setter for ordered
+        '''
+        assert isinstance(value, bool)
+        self.__ordered = value
+    @property
+    def read_ahead(self):
+        '''
+        Getter for read_ahead
+        '''
+        return self.__read_ahead
+    @read_ahead.setter
+    def read_ahead(self, value):
+        '''
+        Setter for read_ahead
+        '''
+        assert isinstance(value, bool)
+        self.__read_ahead = value
+    @property
+    def read_ahead_limit(self):
+        '''
+        Getter for read_ahead_limit
+        '''
+        return self.__read_ahead_limit
+    @read_ahead_limit.setter
+    def read_ahead_limit(self, value):
+        '''
+        Setter for read_ahead_limit
+        '''
+        assert isinstance(value, int) and value > 0
+        self.__read_ahead_limit = value
+    async def parse(self, source):
+        '''
+        Args:
+            source: Any => source to parse
+        Returns:
+            Container<String, Any>
+            Result of parsing source (see parallel.parse_source)
+        Preconditions:
+            Called from a coroutine running in an event loop
+        '''
+        loop = get_running_loop()
+        kwargs = dict(self.kwargs) if self.kwargs is not None else dict()
+        if self.read_ahead and isinstance(source, str):
+            try:
+                stream = await loop.run_in_executor(self.executor, read_source, source, self.read_ahead_limit)
+            except Exception as e:
+                return Container(source=source, result=None, err='%s (%s)'%(type(e).__name__, str(e)))
+            if stream is not None:
+                kwargs['stream'] = stream
+        return await loop.run_in_executor(
+            self.executor, 
+            partial(parse_source, self.parser, source, self.args, kwargs)
+        )
+    async def map(self, sources):
+        '''
+        Args:
+            sources: Iterable<Any>|AsyncIterable<Any>   => sources to parse
+        Returns:
+            AsyncGenerator<Container<String, Any>>
+            Result of parsing each source (see parallel.parse_source), in 
+            completion order or submission order if self.ordered is True
+        Preconditions:
+            Called from a coroutine running in an event loop
+        '''
+        if hasattr(sources, '__aiter__'):
+            sources = sources.__aiter__()
+            async def next_source():
+                try:
+                    return True, await sources.__anext__()
+                except StopAsyncIteration:
+                    return False, None
+        else:
+            sources = iter(sources)
+            async def next_source():
+                try:
+                    return True, next(sources)
+                except StopIteration:
+                    return False, None
+        pending = deque()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < self.concurrency:
+                    found, source = await next_source()
+                    if found:
+                        pending.append(ensure_future(self.parse(source)))
+                    else:
+                        exhausted = True
+                if len(pending) == 0:
+                    break
+                if self.ordered:
+                    yield await pending.popleft()
+                else:
+                    done, _ = await wait(pending, return_when=FIRST_COMPLETED)
+                    for task in done:
+                        pending.remove(task)
+                        yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
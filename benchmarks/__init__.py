@@ -0,0 +1,342 @@
+## -*- coding: UTF-8 -*-
+## benchmarks/__init__.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+import gc
+import json
+import platform
+import sys
+import subprocess
+import tracemalloc
+from os import path, remove, urandom
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+from datetime import datetime
+from dateutil.tz import tzutc
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from ..utils import FileHasher, WindowsTime
+from .synthetic import \
+    create_corpus, \
+    create_container, \
+    create_parser_class, \
+    SyntheticRecord, \
+    SyntheticRecordStream
+
+def get_peak_rss():
+    '''
+    Args:
+        N/A
+    Returns:
+        Integer
+        Peak resident set size of this process in bytes, 
+        or None if it cannot be determined
+    Preconditions:
+        N/A
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ## NOTE: ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if platform.system() == 'Darwin' else peak * 1024
+
+def measure(func, operations, repeat=3):
+    '''
+    Args:
+        func: Function<> -> Any => function that performs operations units of work
+        operations: Integer     => number of units of work performed by each call to func
+        repeat: Integer         => number of timed calls to func
+    Returns:
+        Dict<String, Any>
+        Measurements of func:
+            operations: units of work per call
+            seconds: best wall time of repeat calls
+            per_op: best wall time per unit of work (seconds)
+            ops_per_sec: units of work per second (based on best wall time)
+            alloc_peak: peak memory allocated by one call (bytes, via tracemalloc)
+            alloc_blocks: number of memory blocks still allocated after one call
+            peak_rss: peak resident set size of the process after the calls (bytes)
+    Preconditions:
+        func is callable
+        operations is of type Integer (> 0)
+        repeat is of type Integer (> 0)
+    '''
+    assert callable(func)
+    assert isinstance(operations, int) and operations > 0
+    assert isinstance(repeat, int) and repeat > 0
+    timings = list()
+    for _ in range(repeat):
+        gc.collect()
+        start = perf_counter()
+        func()
+        timings.append(perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        func()
+        _, alloc_peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    best = min(timings)
+    return dict(
+        operations=operations,
+        seconds=best,
+        per_op=best / operations,
+        ops_per_sec=operations / best if best > 0 else None,
+        alloc_peak=alloc_peak,
+        alloc_blocks=sum(stat.count_diff for stat in after.compare_to(before, 'filename')),
+        peak_rss=get_peak_rss()
+    )
+
+## NOTE: run in a fresh interpreter by BenchmarkSuite.bench_startup, formatted with
+## the path to the directory containing the package, its name and the number of classes
+STARTUP_SCRIPT = '''
+import sys
+sys.path.insert(0, %r)
+from %s import ByteParser, StructureProperty
+for idx in range(%d):
+    parent = type('StartupParser%%d'%%idx, (ByteParser,), {
+        'structure%%d'%%prop: StructureProperty(
+            prop, 
+            'structure%%d'%%prop, 
+            deps=['structure%%d'%%(prop - 1)] if prop > 0 else None
+        ) for prop in range(8)
+    })
+    type('StartupChildParser%%d'%%idx, (parent,), dict())
+'''
+
+class BenchmarkSuite(object):
+    '''
+    Suite of benchmarks for the hot paths of the parser framework.  All 
+    inputs are generated synthetically (see benchmarks.synthetic), so the
+    suite needs no network access or evidence files.  Each benchmark is a
+    method named bench_<name> that returns the result of measure.
+    '''
+    def __init__(self, records=10000, hash_size=64 * 1024 * 1024, repeat=3):
+        assert isinstance(records, int) and records > 0
+        assert isinstance(hash_size, int) and hash_size > 0
+        assert isinstance(repeat, int) and repeat > 0
+        self.records = records
+        self.hash_size = hash_size
+        self.repeat = repeat
+    @classmethod
+    def get_benchmarks(cls):
+        '''
+        Args:
+            N/A
+        Returns:
+            List<String>
+            Names of the benchmarks in this suite
+        Preconditions:
+            N/A
+        '''
+        return sorted(key[len('bench_'):] for key in dir(cls) if key.startswith('bench_'))
+    def bench_parser_meta(self):
+        '''
+        Class creation through ParserMeta with 32 chained properties
+        '''
+        classes = max(self.records // 100, 1)
+        return measure(
+            lambda: [create_parser_class(32, 'SyntheticParser%d'%idx) for idx in range(classes)], 
+            classes, 
+            self.repeat
+        )
+    def bench_startup(self):
+        '''
+        Cold start of a new interpreter that imports the package and creates
+        parser classes (each with 8 properties and a subclass without new ones)
+        '''
+        classes = max(self.records // 100, 1)
+        package = __package__.rpartition('.')[0]
+        script = STARTUP_SCRIPT%(
+            path.dirname(path.dirname(path.dirname(path.abspath(__file__)))),
+            package,
+            classes
+        )
+        return measure(
+            lambda: subprocess.run([sys.executable, '-c', script], check=True), 
+            classes, 
+            self.repeat
+        )
+    def bench_property_access(self):
+        '''
+        StructureProperty reads (including dependency checks) on a parsed instance
+        '''
+        parser = create_parser_class(32)(b'').parse()
+        names = list(parser._PROPERTIES)
+        def access():
+            for _ in range(self.records // len(names) + 1):
+                for name in names:
+                    getattr(parser, name)
+        return measure(access, (self.records // len(names) + 1) * len(names), self.repeat)
+    def bench_clean_value(self):
+        '''
+        BaseParser._clean_value on nested Containers
+        '''
+        parser = SyntheticRecord(b'')
+        value = create_container(2, 8)
+        iterations = max(self.records // 100, 1)
+        def clean():
+            for _ in range(iterations):
+                parser._clean_value(value, serialize=True)
+        return measure(clean, iterations, self.repeat)
+    def bench_windows_time(self):
+        '''
+        WindowsTime.parse on individual FILETIME values
+        '''
+        values = [116444736000000000 + idx * 10000019 for idx in range(self.records)]
+        def convert():
+            for value in values:
+                WindowsTime(dw_low_datetime=value & 0xFFFFFFFF, dw_high_datetime=value >> 32).parse()
+        return measure(convert, self.records, self.repeat)
+    def bench_windows_time_many(self):
+        '''
+        WindowsTime.parse_many on an array of FILETIME values
+        '''
+        values = [116444736000000000 + idx * 10000019 for idx in range(self.records)]
+        return measure(lambda: WindowsTime.parse_many(values, output='nanoseconds'), self.records, self.repeat)
+    def bench_file_hashing(self):
+        '''
+        FileHasher with md5, sha1 and sha256 (throughput in bytes)
+        '''
+        with NamedTemporaryFile(delete=False) as fhandle:
+            chunk = urandom(1024 * 1024)
+            for _ in range(self.hash_size // len(chunk) + 1):
+                fhandle.write(chunk)
+            filepath = fhandle.name
+        try:
+            hasher = FileHasher()
+            return measure(lambda: hasher.hash_file(filepath), path.getsize(filepath), self.repeat)
+        finally:
+            remove(filepath)
+    def bench_record_parse(self):
+        '''
+        Parsing records with a construct-based parser through RecordStreamMixin.records
+        '''
+        corpus = create_corpus(self.records)
+        skip = lambda offset, record: record[:4] != b'FILE'
+        def parse():
+            for _ in SyntheticRecordStream(corpus, skip=skip).records():
+                pass
+        return measure(parse, self.records, self.repeat)
+    def run(self, benchmarks=None):
+        '''
+        Args:
+            benchmarks: List<String>    => names of benchmarks to run (all if None)
+        Returns:
+            Dict<String, Any>
+            Machine-readable results:
+                created: time the suite was run (UTC, ISO 8601)
+                python: Python implementation and version
+                platform: platform description
+                config: suite configuration
+                results: results of measure keyed by benchmark name
+        Preconditions:
+            benchmarks is None or of type List<String>
+        '''
+        if benchmarks is None:
+            benchmarks = self.get_benchmarks()
+        results = dict()
+        for name in benchmarks:
+            if not hasattr(self, 'bench_%s'%name):
+                raise ValueError('%s is not a valid benchmark'%name)
+            Logger.info('Running benchmark %s'%name)
+            results[name] = getattr(self, 'bench_%s'%name)()
+        return dict(
+            created=datetime.now(tzutc()).isoformat(),
+            python='%s %s'%(platform.python_implementation(), platform.python_version()),
+            platform=platform.platform(),
+            config=dict(records=self.records, hash_size=self.hash_size, repeat=self.repeat),
+            results=results
+        )
+
+def compare_results(results, baseline, threshold=0.10):
+    '''
+    Args:
+        results: Dict<String, Any>  => results of BenchmarkSuite.run
+        baseline: Dict<String, Any> => stored results of BenchmarkSuite.run to compare against
+        threshold: Float            => relative slowdown in per_op considered a regression
+    Returns:
+        Dict<String, Dict<String, Any>>
+        Comparison of each benchmark present in both results and baseline:
+            per_op: current time per unit of work
+            baseline_per_op: baseline time per unit of work
+            ratio: per_op / baseline_per_op
+            alloc_peak_ratio: alloc_peak / baseline alloc_peak
+            regression: whether ratio exceeds 1 + threshold
+    Preconditions:
+        threshold is of type Float (>= 0)
+    '''
+    assert isinstance(threshold, float) and threshold >= 0
+    comparison = dict()
+    for name, current in results.get('results', dict()).items():
+        previous = baseline.get('results', dict()).get(name)
+        if previous is None or not previous.get('per_op'):
+            continue
+        ratio = current.get('per_op') / previous.get('per_op')
+        comparison[name] = dict(
+            per_op=current.get('per_op'),
+            baseline_per_op=previous.get('per_op'),
+            ratio=ratio,
+            alloc_peak_ratio=(
+                current.get('alloc_peak') / previous.get('alloc_peak') \
+                if previous.get('alloc_peak') else None
+            ),
+            regression=ratio > 1 + threshold
+        )
+    return comparison
+
+def load_results(filepath):
+    '''
+    Args:
+        filepath: String    => path to JSON results file
+    Returns:
+        Dict<String, Any>
+        Results previously written by write_results
+    Preconditions:
+        filepath is of type String
+    '''
+    assert isinstance(filepath, str)
+    with open(filepath, 'r') as fhandle:
+        return json.load(fhandle)
+
+def write_results(results, filepath):
+    '''
+    Args:
+        results: Dict<String, Any>  => results of BenchmarkSuite.run
+        filepath: String            => path to write JSON results to
+    Procedure:
+        Write results to filepath as JSON
+    Preconditions:
+        filepath is of type String
+    '''
+    assert isinstance(filepath, str)
+    with open(filepath, 'w') as fhandle:
+        json.dump(results, fhandle, indent=2, sort_keys=True)
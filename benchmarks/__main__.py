@@ -0,0 +1,64 @@
+## -*- coding: UTF-8 -*-
+## benchmarks/__main__.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import sys
+import json
+import logging
+from argparse import ArgumentParser
+
+from . import BenchmarkSuite, compare_results, load_results, write_results
+
+def main(argv=None):
+    '''
+    Args:
+        argv: List<String>  => command line arguments (defaults to sys.argv[1:])
+    Returns:
+        Integer
+        Exit code, 1 if a regression against the baseline was found and 0 otherwise
+    Preconditions:
+        argv is None or of type List<String>
+    '''
+    parser = ArgumentParser(description='Benchmark the hot paths of the parser framework')
+    parser.add_argument('-n', '--records', type=int, default=10000, help='number of synthetic records (default: 10000)')
+    parser.add_argument('--hash-size', type=int, default=64 * 1024 * 1024, help='size of synthetic file to hash in bytes')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='timed repetitions per benchmark (default: 3)')
+    parser.add_argument('-b', '--benchmark', action='append', choices=BenchmarkSuite.get_benchmarks(), help='benchmark to run (default: all)')
+    parser.add_argument('-o', '--output', help='path to write JSON results to')
+    parser.add_argument('--baseline', help='path to JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown considered a regression (default: 0.10)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log benchmark progress')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    results = BenchmarkSuite(args.records, args.hash_size, args.repeat).run(args.benchmark)
+    if args.output is not None:
+        write_results(results, args.output)
+    regression = False
+    if args.baseline is not None:
+        results['comparison'] = compare_results(results, load_results(args.baseline), args.threshold)
+        regression = any(entry.get('regression') for entry in results['comparison'].values())
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    return 1 if regression else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
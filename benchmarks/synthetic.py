@@ -0,0 +1,174 @@
+## -*- coding: UTF-8 -*-
+## benchmarks/synthetic.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from random import Random
+from construct import Struct, Int8ul, Int16ul, Int32ul, Int64ul, Bytes
+from construct.lib import Container
+
+from .. import ByteParser, ByteRecordParser
+from ..utils import StructureProperty
+
+RECORD_SIZE = 64
+
+## NOTE: fixed-size synthetic record similar in shape to small NTFS structures
+SyntheticHeader = Struct(
+    'Signature'     / Bytes(4),
+    'Flags'         / Int16ul,
+    'Sequence'      / Int16ul,
+    'Size'          / Int32ul,
+    'RawChecksum'   / Int32ul
+)
+SyntheticBody = Struct(
+    'CreateTime'    / Int64ul,
+    'ModifyTime'    / Int64ul,
+    'AccessTime'    / Int64ul,
+    'ParentRef'     / Int64ul,
+    'Attributes'    / Int32ul,
+    'Type'          / Int8ul,
+    'RawPadding'    / Bytes(RECORD_SIZE - 16 - 37)
+)
+
+class SyntheticRecord(ByteParser):
+    '''
+    Synthetic construct-based record parser used by the benchmarks
+    '''
+    header  = StructureProperty(0, 'header')
+    body    = StructureProperty(1, 'body', deps=['header'])
+
+    def _parse_header(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Container<String, Any>
+            Parsed record header
+        Preconditions:
+            N/A
+        '''
+        return SyntheticHeader.parse_stream(self.stream)
+    def _parse_body(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Container<String, Any>
+            Parsed record body
+        Preconditions:
+            N/A
+        '''
+        self.stream.seek(SyntheticHeader.sizeof())
+        return SyntheticBody.parse_stream(self.stream)
+
+class SyntheticRecordStream(ByteRecordParser):
+    '''
+    Synthetic record stream parser used by the benchmarks
+    '''
+    RECORD_PARSER   = SyntheticRecord
+    RECORD_SIZE     = RECORD_SIZE
+
+def create_corpus(records, seed=0):
+    '''
+    Args:
+        records: Integer    => number of records to generate
+        seed: Integer       => seed for the random number generator
+    Returns:
+        Bytes
+        Deterministic corpus of synthetic records (see SyntheticHeader 
+        and SyntheticBody), every tenth record has an invalid signature
+    Preconditions:
+        records is of type Integer (>= 0)
+        seed is of type Integer
+    '''
+    assert isinstance(records, int) and records >= 0
+    random = Random(seed)
+    corpus = bytearray()
+    for idx in range(records):
+        corpus += SyntheticHeader.build(Container(
+            Signature=b'BAAD' if idx % 10 == 9 else b'FILE',
+            Flags=random.getrandbits(16),
+            Sequence=idx & 0xFFFF,
+            Size=RECORD_SIZE,
+            RawChecksum=random.getrandbits(32)
+        ))
+        corpus += SyntheticBody.build(Container(
+            CreateTime=random.randint(116444736000000000, 133000000000000000),
+            ModifyTime=random.randint(116444736000000000, 133000000000000000),
+            AccessTime=random.randint(116444736000000000, 133000000000000000),
+            ParentRef=random.getrandbits(48),
+            Attributes=random.getrandbits(32),
+            Type=random.getrandbits(8),
+            RawPadding=bytes(RECORD_SIZE - 16 - 37)
+        ))
+    return bytes(corpus)
+
+def create_container(depth, width, seed=0):
+    '''
+    Args:
+        depth: Integer  => levels of nesting
+        width: Integer  => keys per level
+        seed: Integer   => seed for the random number generator
+    Returns:
+        Container<String, Any>
+        Nested Container resembling parsed attribute lists, where each level
+        has width scalar keys (some prefixed with Raw or _), a list of
+        width child Containers and a nested Container
+    Preconditions:
+        depth is of type Integer (>= 0)
+        width is of type Integer (> 0)
+    '''
+    random = Random(seed)
+    def build(level):
+        value = Container()
+        for idx in range(width):
+            prefix = ('Raw', '_', '', '')[idx % 4]
+            value['%sField%d'%(prefix, idx)] = random.getrandbits(32)
+        if level < depth:
+            value['Entries'] = [build(depth) for _ in range(width)]
+            value['Child'] = build(level + 1)
+        return value
+    return build(0)
+
+def create_parser_class(properties, name='SyntheticParser', base=ByteParser):
+    '''
+    Args:
+        properties: Integer     => number of structure properties
+        name: String            => name of the new class
+        base: Type<BaseParser>  => base class of the new class
+    Returns:
+        Type<BaseParser>
+        New parser class with properties chained structure properties,
+        where each property depends on the one before it
+    Preconditions:
+        properties is of type Integer (> 0)
+        name is of type String
+    '''
+    attrs = dict()
+    for idx in range(properties):
+        prop = 'structure%d'%idx
+        attrs[prop] = StructureProperty(
+            idx, 
+            prop, 
+            deps=['structure%d'%(idx - 1)] if idx > 0 else None
+        )
+        attrs['_parse_%s'%prop] = lambda self, idx=idx: Container(Value=idx, RawValue=idx)
+    return type(base)(name, (base,), attrs)
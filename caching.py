@@ -0,0 +1,267 @@
+## -*- coding: UTF-8 -*-
+## caching.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+import pickle
+import sqlite3
+from collections import OrderedDict
+from threading import Lock
+
+class StructureCache(object):
+    '''
+    Two-tier cache of parsed structure results, keyed by parser class,
+    structure name, a fingerprint of the parser source (see 
+    BaseParser.get_fingerprint) and the stream offset parsing starts at.  Values are stored pickled in an 
+    in-memory LRU tier bounded by max_bytes and, if path is provided, in
+    an on-disk sqlite tier that persists across runs.  BaseParser stores
+    each result with the stream offset its structure ended at, so a hit 
+    leaves the stream where parsing would have.  To enable caching 
+    for a parser class (and its subclasses), set its STRUCTURE_CACHE 
+    attribute:
+    PrefetchParser.STRUCTURE_CACHE = StructureCache(max_bytes=256 * 1024 * 1024, path='prefetch.cache')
+    '''
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, max_bytes=None, path=None):
+        self.max_bytes = max_bytes if max_bytes is not None else self.DEFAULT_MAX_BYTES
+        self.path = path
+        self.__lock = Lock()
+        self.__entries = OrderedDict()
+        self.__size = 0
+        self.__connection = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+    @property
+    def max_bytes(self):
+        '''
+        Getter for max_bytes
+        '''
+        return self.__max_bytes
+    @max_bytes.setter
+    def max_bytes(self, value):
+        '''
+        Setter for max_bytes
+        '''
+        assert isinstance(value, int) and value >= 0
+        self.__max_bytes = value
+    @property
+    def path(self):
+        '''
+        Getter for path
+        '''
+        return self.__path
+    @path.setter
+    def path(self, value):
+        '''
+        Setter for path
+        '''
+        assert value is None or isinstance(value, str)
+        self.__path = value
+    @property
+    def size(self):
+        '''
+        Getter for size
+        '''
+        return self.__size
+    @staticmethod
+    def create_key(parser, structure, fingerprint, offset=None):
+        '''
+        Args:
+            parser: Type<BaseParser>    => parser class
+            structure: String           => structure name
+            fingerprint: String         => fingerprint of parser source
+            offset: Integer             => stream offset parsing starts at
+        Returns:
+            String
+            Cache key for structure of parser with source fingerprint,
+            parsed from offset
+        Preconditions:
+            parser is of type Type
+            structure is of type String
+            fingerprint is of type String
+            offset is None or of type Integer
+        '''
+        key = '%s.%s:%s:%s'%(parser.__module__, parser.__qualname__, structure, fingerprint)
+        if offset is not None:
+            key += '@%d'%offset
+        return key
+    def _get_connection(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            sqlite3.Connection
+            Connection to the on-disk tier (created on first use), or None if 
+            there is no on-disk tier
+        Preconditions:
+            self.__lock is held
+        '''
+        if self.path is None:
+            return None
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.__connection.execute(
+                'CREATE TABLE IF NOT EXISTS structures (key TEXT PRIMARY KEY, value BLOB NOT NULL)'
+            )
+            self.__connection.commit()
+        return self.__connection
+    def _store_memory(self, key, data):
+        '''
+        Args:
+            key: String => cache key
+            data: Bytes => pickled value
+        Procedure:
+            Store data in the in-memory tier, evicting least recently used
+            entries until the tier fits in self.max_bytes
+        Preconditions:
+            self.__lock is held
+        '''
+        if key in self.__entries:
+            self.__size -= len(self.__entries.pop(key))
+        if len(data) > self.max_bytes:
+            return
+        self.__entries[key] = data
+        self.__size += len(data)
+        while self.__size > self.max_bytes:
+            _, evicted = self.__entries.popitem(last=False)
+            self.__size -= len(evicted)
+            self.evictions += 1
+    def get(self, key):
+        '''
+        Args:
+            key: String => cache key
+        Returns:
+            Tuple<Boolean, Any>
+            Whether key was found and, if so, the cached value
+        Preconditions:
+            key is of type String
+        '''
+        with self.__lock:
+            data = self.__entries.get(key)
+            if data is not None:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+            else:
+                connection = self._get_connection()
+                if connection is not None:
+                    try:
+                        row = connection.execute(
+                            'SELECT value FROM structures WHERE key = ?', (key,)
+                        ).fetchone()
+                    except sqlite3.Error as e:
+                        Logger.error('Failed to read from structure cache %s (%s)'%(self.path, str(e)))
+                        row = None
+                    if row is not None:
+                        data = bytes(row[0])
+                        self._store_memory(key, data)
+                        self.hits += 1
+                        self.disk_hits += 1
+                if data is None:
+                    self.misses += 1
+                    return False, None
+        return True, pickle.loads(data)
+    def set(self, key, value):
+        '''
+        Args:
+            key: String => cache key
+            value: Any  => value to cache
+        Procedure:
+            Store value in both tiers of the cache, values that cannot
+            be pickled are not cached
+        Preconditions:
+            key is of type String
+        '''
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            Logger.error('Failed to cache value for %s (%s)'%(key, str(e)))
+            return
+        with self.__lock:
+            self._store_memory(key, data)
+            connection = self._get_connection()
+            if connection is not None:
+                try:
+                    connection.execute(
+                        'INSERT OR REPLACE INTO structures (key, value) VALUES (?, ?)', 
+                        (key, sqlite3.Binary(data))
+                    )
+                    connection.commit()
+                except sqlite3.Error as e:
+                    Logger.error('Failed to write to structure cache %s (%s)'%(self.path, str(e)))
+    def clear(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Remove all entries from both tiers and reset the counters
+        Preconditions:
+            N/A
+        '''
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+            connection = self._get_connection()
+            if connection is not None:
+                connection.execute('DELETE FROM structures')
+                connection.commit()
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+    def stats(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Dict<String, Integer>
+            Counters and current state of the cache
+        Preconditions:
+            N/A
+        '''
+        return dict(
+            hits=self.hits,
+            disk_hits=self.disk_hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            entries=len(self.__entries),
+            size=self.__size
+        )
+    def close(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Close the connection to the on-disk tier if it is open
+        Preconditions:
+            N/A
+        '''
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+    def __repr__(self):
+        return '%s(max_bytes=%s, path=%s)'%(
+            type(self).__name__,
+            repr(self.max_bytes),
+            repr(self.path)
+        )
@@ -0,0 +1,160 @@
+## -*- coding: UTF-8 -*-
+## checkpoint.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+import pickle
+import tempfile
+from os import path, replace, remove, fsync
+from datetime import datetime
+from dateutil.tz import tzutc
+
+class Checkpoint(object):
+    '''
+    Persistent record of the progress of a parser on one source, so that
+    a later run can resume after the process dies.  The state (stream offset,
+    number of records, completed structures and any caller-defined values
+    such as where results were written) is pickled to path and replaced
+    atomically on every save.  Checkpoints are only restored by the same
+    parser class for a source with the same fingerprint (see 
+    BaseParser.get_fingerprint).  every_bytes and/or every_records (records
+    of a record stream, or parsed structures) control how often progress 
+    is saved (see Checkpoint.due);
+    if neither is set, progress is saved every DEFAULT_EVERY_BYTES bytes,
+    since each save pickles the whole state and syncs it to disk.
+    '''
+    DEFAULT_EVERY_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, path, every_bytes=None, every_records=None):
+        assert isinstance(path, str)
+        assert every_bytes is None or (isinstance(every_bytes, int) and every_bytes > 0)
+        assert every_records is None or (isinstance(every_records, int) and every_records > 0)
+        self.path = path
+        self.every_bytes = every_bytes
+        self.every_records = every_records
+        self.state = dict()
+    @staticmethod
+    def get_owner(parser):
+        '''
+        Args:
+            parser: BaseParser  => parser instance
+        Returns:
+            String
+            Fully qualified name of the class of parser
+        Preconditions:
+            N/A
+        '''
+        return '%s.%s'%(type(parser).__module__, type(parser).__qualname__)
+    def due(self, records, nbytes):
+        '''
+        Args:
+            records: Integer    => records (or structures) processed since the last save
+            nbytes: Integer     => bytes processed since the last save
+        Returns:
+            Boolean
+            Whether progress should be saved
+        Preconditions:
+            records is of type Integer
+            nbytes is of type Integer
+        '''
+        if self.every_bytes is None and self.every_records is None:
+            return nbytes >= self.DEFAULT_EVERY_BYTES
+        return (self.every_records is not None and records >= self.every_records) or \
+            (self.every_bytes is not None and nbytes >= self.every_bytes)
+    def load(self, parser, match_fingerprint=True):
+        '''
+        Args:
+            parser: BaseParser          => parser that wants to resume
+            match_fingerprint: Boolean  => whether the fingerprint of the source must match
+                                           (i.e. not for sources that grow)
+        Returns:
+            Dict<String, Any>
+            Saved state if the checkpoint at self.path belongs to the class of 
+            parser and the fingerprint of its source, None otherwise (the 
+            in-memory state is reset to match)
+        Preconditions:
+            parser is of type BaseParser
+            match_fingerprint is of type Boolean
+        '''
+        self.state = dict(owner=self.get_owner(parser), fingerprint=parser.get_fingerprint())
+        if not path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as fhandle:
+                state = pickle.load(fhandle)
+        except Exception as e:
+            Logger.error('Failed to load checkpoint %s (%s)'%(self.path, str(e)))
+            return None
+        if not isinstance(state, dict) or \
+            state.get('owner') != self.state.get('owner') or \
+            (match_fingerprint and (
+                state.get('fingerprint') is None or \
+                state.get('fingerprint') != self.state.get('fingerprint')
+            )):
+            Logger.info('Ignoring checkpoint %s for different parser or source'%self.path)
+            return None
+        if not match_fingerprint:
+            state['fingerprint'] = self.state.get('fingerprint')
+        self.state = state
+        return state
+    def save(self, **values):
+        '''
+        Args:
+            values: Dict<String, Any>   => values to merge into the saved state
+        Procedure:
+            Merge values into self.state and atomically write it to self.path
+        Preconditions:
+            values are picklable
+        '''
+        self.state.update(values)
+        self.state['updated'] = datetime.now(tzutc())
+        directory = path.dirname(path.abspath(self.path))
+        with tempfile.NamedTemporaryFile('wb', dir=directory, prefix='.checkpoint-', delete=False) as fhandle:
+            try:
+                pickle.dump(self.state, fhandle, protocol=pickle.HIGHEST_PROTOCOL)
+                fhandle.flush()
+                fsync(fhandle.fileno())
+            except Exception:
+                fhandle.close()
+                remove(fhandle.name)
+                raise
+        replace(fhandle.name, self.path)
+    def clear(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Delete the checkpoint at self.path and reset the in-memory state
+        Preconditions:
+            N/A
+        '''
+        self.state = dict()
+        if path.exists(self.path):
+            remove(self.path)
+    def __repr__(self):
+        return '%s(%s, every_bytes=%s, every_records=%s)'%(
+            type(self).__name__,
+            repr(self.path),
+            repr(self.every_bytes),
+            repr(self.every_records)
+        )
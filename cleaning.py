@@ -0,0 +1,391 @@
+## -*- coding: UTF-8 -*-
+## cleaning.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from collections.abc import Mapping, Sequence
+from datetime import datetime
+from keyword import iskeyword
+from threading import Lock
+from construct.lib import Container
+
+## NOTE: keys beginning with these prefixes are removed from cleaned values
+EXCLUDED_PREFIXES = ('Raw', '_')
+## NOTE: maximum number of distinct key layouts to cache filtered keys for
+KEY_CACHE_SIZE = 4096
+_KEY_CACHE = dict()
+_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f%z'
+## NOTE: types that are never cleaned, checked first to short-circuit the common case
+_SCALARS = frozenset((int, float, bool, str, bytes, type(None)))
+
+def format_datetime(value):
+    '''
+    Args:
+        value: DateTime => timestamp to format
+    Returns:
+        String
+        value formatted as '%Y-%m-%d %H:%M:%S.%f%z' (the format of serialized
+        timestamps), built from DateTime.isoformat since it is considerably 
+        faster than strftime
+    Preconditions:
+        value is of type DateTime
+    '''
+    text = value.isoformat(' ', 'microseconds')
+    if value.year < 1000:
+        return value.strftime(_DATETIME_FORMAT)
+    elif len(text) == 26:
+        return text
+    elif len(text) == 32 and text[-3] == ':':
+        return text[:-3] + text[-2:]
+    return value.strftime(_DATETIME_FORMAT)
+
+def filter_keys(keys):
+    '''
+    Args:
+        keys: Tuple<String> => keys of a Container
+    Returns:
+        Tuple<String>
+        keys without those beginning with an excluded prefix (see EXCLUDED_PREFIXES).
+        Results are cached by key layout, so Containers parsed from the same
+        structure only filter their keys once.
+    Preconditions:
+        keys is of type Tuple<String>
+    '''
+    filtered = _KEY_CACHE.get(keys)
+    if filtered is None:
+        filtered = tuple(key for key in keys if not key.startswith(EXCLUDED_PREFIXES))
+        if len(_KEY_CACHE) < KEY_CACHE_SIZE:
+            _KEY_CACHE[keys] = filtered
+    return filtered
+
+def clean_value(value, serialize=False):
+    '''
+    Args:
+        value: Any          => value to be converted
+        serialize: Boolean  => transform values to be JSON-serializable
+    Returns:
+        Any
+        Raw value if it is not of type Container or list, else a copy with 
+        any key beginning with an excluded prefix removed at every level
+        (see filter_keys).  Nested values are cleaned iteratively, so
+        deeply nested structures do not recurse.
+    Preconditions:
+        serialize is of type Boolean
+    '''
+    assert isinstance(serialize, bool)
+    if isinstance(value, _VIEWS):
+        value = value._value
+    elif isinstance(value, CompactRecord):
+        value = value.to_container()
+    if isinstance(value, Container):
+        cleaned = Container()
+    elif isinstance(value, list):
+        cleaned = [None] * len(value)
+    elif serialize and isinstance(value, datetime):
+        return format_datetime(value)
+    else:
+        return value
+    stack = [(value, cleaned)]
+    pop = stack.pop
+    push = stack.append
+    while len(stack) > 0:
+        source, target = pop()
+        if type(target) is list:
+            keys = range(len(source))
+        else:
+            keys = filter_keys(tuple(source))
+        ## NOTE: the loop body is intentionally inlined to avoid per-item call overhead
+        for key in keys:
+            child = source[key]
+            if type(child) in _SCALARS:
+                target[key] = child
+            elif isinstance(child, Container):
+                new = target[key] = Container()
+                push((child, new))
+            elif isinstance(child, list):
+                new = target[key] = [None] * len(child)
+                push((child, new))
+            elif serialize and isinstance(child, datetime):
+                target[key] = format_datetime(child)
+            elif isinstance(child, _VIEWS):
+                target[key] = clean_value(child._value, serialize)
+            elif isinstance(child, CompactRecord):
+                target[key] = clean_value(child.to_container(), serialize)
+            else:
+                target[key] = child
+    return cleaned
+
+def clean_view(value, serialize=False):
+    '''
+    Args:
+        value: Any          => value to be converted
+        serialize: Boolean  => transform values to be JSON-serializable
+    Returns:
+        Any
+        Read-only view over value (see FilteredContainerView and FilteredListView) 
+        if it is of type Container or list, otherwise the same as clean_value.
+        Nothing is copied; nested values are wrapped as they are accessed.
+    Preconditions:
+        serialize is of type Boolean
+    '''
+    if isinstance(value, (FilteredContainerView, FilteredListView)):
+        return value
+    elif issubclass(type(value), Container):
+        return FilteredContainerView(value, serialize)
+    elif isinstance(value, list):
+        return FilteredListView(value, serialize)
+    elif isinstance(value, datetime) and serialize:
+        return format_datetime(value)
+    return value
+
+class FilteredContainerView(Mapping):
+    '''
+    Read-only view over a Container that hides keys beginning
+    with an excluded prefix (see filter_keys) and cleans nested 
+    values on access (see clean_view).  Supports both item and
+    attribute access, like Container.
+    '''
+    __slots__ = ('_value', '_serialize', '_keys')
+
+    def __init__(self, value, serialize=False):
+        self._value = value
+        self._serialize = serialize
+        self._keys = None
+    def keys(self):
+        if self._keys is None:
+            self._keys = filter_keys(tuple(self._value.keys()))
+        return self._keys
+    def __getitem__(self, key):
+        if not (isinstance(key, str) and key in self._value) or key.startswith(EXCLUDED_PREFIXES):
+            raise KeyError(key)
+        return clean_view(self._value[key], self._serialize)
+    def __getattr__(self, key):
+        if key.startswith('_'):
+            raise AttributeError(key)
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+    def __iter__(self):
+        return iter(self.keys())
+    def __len__(self):
+        return len(self.keys())
+    def __reduce__(self):
+        return (clean_value, (self._value, self._serialize))
+    def __repr__(self):
+        return '%s(%s)'%(type(self).__name__, repr(clean_value(self._value, self._serialize)))
+    def __str__(self):
+        return str(clean_value(self._value, self._serialize))
+
+class FilteredListView(Sequence):
+    '''
+    Read-only view over a list that cleans its
+    values on access (see clean_view).
+    '''
+    __slots__ = ('_value', '_serialize')
+
+    def __init__(self, value, serialize=False):
+        self._value = value
+        self._serialize = serialize
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return FilteredListView(self._value[idx], self._serialize)
+        return clean_view(self._value[idx], self._serialize)
+    def __len__(self):
+        return len(self._value)
+    def __reduce__(self):
+        return (clean_value, (self._value, self._serialize))
+    def __repr__(self):
+        return '%s(%s)'%(type(self).__name__, repr(clean_value(self._value, self._serialize)))
+    def __str__(self):
+        return str(clean_value(self._value, self._serialize))
+
+class CompactRecord(object):
+    '''
+    Base class for compact, read-only parse results (see compact_value).
+    Subclasses are generated per record name and field layout (see
+    create_record_class) and store their fields in __slots__, which
+    takes a fraction of the memory of a Container.  Supports both item 
+    and attribute access, like Container.
+    '''
+    __slots__ = ()
+    _FIELDS = tuple()
+    _FIELD_SET = frozenset()
+
+    def keys(self):
+        return self._FIELDS
+    def values(self):
+        return [getattr(self, key) for key in self._FIELDS]
+    def items(self):
+        return [(key, getattr(self, key)) for key in self._FIELDS]
+    def get(self, key, default=None):
+        if key in self._FIELD_SET:
+            return getattr(self, key)
+        return default
+    def to_container(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Container<String, Any>
+            Shallow copy of this record as a Container
+        Preconditions:
+            N/A
+        '''
+        return Container(self.items())
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            return getattr(self, key)
+        raise KeyError(key)
+    def __setattr__(self, key, value):
+        raise AttributeError('%s is read-only'%type(self).__name__)
+    def __delattr__(self, key):
+        raise AttributeError('%s is read-only'%type(self).__name__)
+    def __contains__(self, key):
+        return key in self._FIELD_SET
+    def __iter__(self):
+        return iter(self._FIELDS)
+    def __len__(self):
+        return len(self._FIELDS)
+    def __eq__(self, other):
+        if isinstance(other, CompactRecord):
+            return self._FIELDS == other._FIELDS and self.values() == other.values()
+        elif isinstance(other, Mapping):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+    def __reduce__(self):
+        return (_restore_record, (type(self).__name__, self._FIELDS, tuple(self.values())))
+    def __repr__(self):
+        return '%s(%s)'%(
+            type(self).__name__,
+            ', '.join('%s=%s'%(key, repr(value)) for key, value in self.items())
+        )
+    def __str__(self):
+        return str(clean_value(self))
+
+_RECORD_CLASSES = dict()
+_RECORD_CLASSES_LOCK = Lock()
+_RESERVED_FIELDS = frozenset(dir(CompactRecord))
+
+def create_record_class(name, fields):
+    '''
+    Args:
+        name: String            => name of the record class
+        fields: Tuple<String>   => field names of the record class
+    Returns:
+        Type<CompactRecord>
+        Record class with name and fields (see CompactRecord), shared by all
+        records with the same name and field layout, or None if fields cannot
+        be stored in __slots__ (i.e. are not identifiers or clash with the
+        methods of CompactRecord)
+    Preconditions:
+        name is of type String
+        fields is of type Tuple<String>
+    '''
+    key = (name, fields)
+    record_class = _RECORD_CLASSES.get(key)
+    if record_class is None and not (key in _RECORD_CLASSES):
+        with _RECORD_CLASSES_LOCK:
+            if not (key in _RECORD_CLASSES):
+                if all(
+                    isinstance(field, str) and \
+                    field.isidentifier() and \
+                    not iskeyword(field) and \
+                    not (field in _RESERVED_FIELDS) \
+                    for field in fields
+                ):
+                    record_class = type(name, (CompactRecord,), dict(
+                        __slots__=fields,
+                        _FIELDS=fields,
+                        _FIELD_SET=frozenset(fields)
+                    ))
+                _RECORD_CLASSES[key] = record_class
+            record_class = _RECORD_CLASSES.get(key)
+    return record_class
+
+def _restore_record(name, fields, values):
+    '''
+    Args:
+        name: String            => name of the record class
+        fields: Tuple<String>   => field names of the record class
+        values: Tuple<Any>      => field values
+    Returns:
+        CompactRecord
+        Record with values (used to unpickle records)
+    Preconditions:
+        len(fields) == len(values)
+    '''
+    record = object.__new__(create_record_class(name, fields))
+    for field, value in zip(fields, values):
+        object.__setattr__(record, field, value)
+    return record
+
+def compact_value(value, serialize=False, name='Record'):
+    '''
+    Args:
+        value: Any          => value to be converted
+        serialize: Boolean  => transform values to be JSON-serializable
+        name: String        => name of generated record classes
+    Returns:
+        Any
+        Same as clean_value, except that every Container is converted to a 
+        CompactRecord (see create_record_class).  Containers whose keys 
+        cannot be stored in __slots__ are left as Containers.
+    Preconditions:
+        serialize is of type Boolean
+        name is of type String
+    '''
+    assert isinstance(serialize, bool)
+    cleaned = clean_value(value, serialize)
+    if not isinstance(cleaned, (Container, list)):
+        return cleaned
+    ## NOTE: convert bottom-up, leaves are converted before the values that contain them
+    order = list()
+    stack = [cleaned]
+    while len(stack) > 0:
+        current = stack.pop()
+        order.append(current)
+        for child in (current.values() if isinstance(current, Container) else current):
+            if isinstance(child, (Container, list)):
+                stack.append(child)
+    converted = dict()
+    setattr_ = object.__setattr__
+    for current in reversed(order):
+        if isinstance(current, Container):
+            record_class = create_record_class(name, tuple(current))
+            if record_class is None:
+                for key, child in current.items():
+                    if id(child) in converted:
+                        current[key] = converted.get(id(child))
+                result = current
+            else:
+                result = object.__new__(record_class)
+                for key, child in current.items():
+                    setattr_(result, key, converted.get(id(child), child) if isinstance(child, (Container, list)) else child)
+        else:
+            result = [
+                converted.get(id(child), child) if isinstance(child, (Container, list)) else child \
+                for child in current
+            ]
+        converted[id(current)] = result
+    return converted[id(cleaned)]
+
+_VIEWS = (FilteredContainerView, FilteredListView)
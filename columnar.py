@@ -0,0 +1,415 @@
+## -*- coding: UTF-8 -*-
+## columnar.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from construct.lib import Container
+
+from .lazy import lazy_import
+np = lazy_import('numpy', optional=True)
+pa = lazy_import('pyarrow', optional=True)
+
+from . import BaseParser
+from .utils import WindowsTime
+from .cleaning import CompactRecord, clean_value
+
+class Column(object):
+    '''
+    Typed, append-only column buffer.  Values are stored in fixed-width
+    arrays (int64/uint64, float64, bool), timestamps as int64 FILETIME 
+    values, and strings/bytes as int64 offsets plus a contiguous data 
+    buffer, with a per-row validity buffer for nulls.  The type of the
+    column is inferred from its first non-null value; values of any
+    other type are stored as null and counted in conflicts.
+    '''
+    INT         = 'int'
+    UINT        = 'uint'
+    FLOAT       = 'float'
+    BOOL        = 'bool'
+    TIMESTAMP   = 'timestamp'
+    STRING      = 'string'
+    BINARY      = 'binary'
+
+    def __init__(self, name, length=0):
+        self.name = name
+        self.kind = None
+        self.values = None
+        self.offsets = None
+        self.validity = bytearray(length)
+        self.conflicts = 0
+        self.__pending = length
+    def __len__(self):
+        return len(self.validity)
+    def _initialize(self, value):
+        '''
+        Args:
+            value: Any  => first non-null value of the column
+        Procedure:
+            Infer the type of the column from value and create its buffers,
+            including any null rows appended before value
+        Preconditions:
+            value is not None
+        '''
+        if isinstance(value, bool):
+            self.kind, self.values = self.BOOL, array('b')
+        elif isinstance(value, int):
+            self.kind, self.values = (self.INT, array('q')) if value < 2 ** 63 else (self.UINT, array('Q'))
+        elif isinstance(value, float):
+            self.kind, self.values = self.FLOAT, array('d')
+        elif isinstance(value, datetime):
+            self.kind, self.values = self.TIMESTAMP, array('q')
+        elif isinstance(value, str):
+            self.kind, self.values, self.offsets = self.STRING, bytearray(), array('q', [0])
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            self.kind, self.values, self.offsets = self.BINARY, bytearray(), array('q', [0])
+        else:
+            raise TypeError('unsupported column type %s'%type(value).__name__)
+        for _ in range(self.__pending):
+            self._append_null()
+        self.__pending = 0
+    def _append_null(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Append an empty slot to the value buffers
+        Preconditions:
+            self.kind is not None
+        '''
+        if self.offsets is not None:
+            self.offsets.append(len(self.values))
+        else:
+            self.values.append(0)
+    def append(self, value):
+        '''
+        Args:
+            value: Any  => value to append (None for null)
+        Procedure:
+            Append value to the column, converting timestamps to FILETIME
+            and strings to UTF-8
+        Preconditions:
+            N/A
+        '''
+        if value is not None and self.kind is None:
+            try:
+                self._initialize(value)
+            except TypeError:
+                self.conflicts += 1
+                value = None
+        if self.kind is None:
+            self.__pending += 1
+            self.validity.append(0)
+            return
+        try:
+            if value is None:
+                valid = 0
+            elif self.kind == self.STRING:
+                valid = isinstance(value, str)
+                if valid:
+                    self.values += value.encode('UTF-8', 'surrogateescape')
+            elif self.kind == self.BINARY:
+                valid = isinstance(value, (bytes, bytearray, memoryview))
+                if valid:
+                    self.values += value
+            elif self.kind == self.TIMESTAMP:
+                valid = isinstance(value, datetime)
+                if valid:
+                    self.values.append(WindowsTime.to_filetime(value))
+            elif self.kind == self.BOOL:
+                valid = isinstance(value, bool)
+                if valid:
+                    self.values.append(value)
+            elif self.kind == self.FLOAT:
+                valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if valid:
+                    self.values.append(value)
+            else:
+                valid = isinstance(value, int) and not isinstance(value, bool)
+                if valid:
+                    try:
+                        self.values.append(value)
+                    except OverflowError:
+                        if not (self.kind == self.INT and value >= 2 ** 63 and min(self.values, default=0) >= 0):
+                            raise
+                        self.kind, self.values = self.UINT, array('Q', self.values)
+                        self.values.append(value)
+        except (OverflowError, ValueError):
+            valid = False
+        if not valid:
+            if value is not None:
+                self.conflicts += 1
+            self._append_null()
+            self.validity.append(0)
+        else:
+            if self.offsets is not None:
+                self.offsets.append(len(self.values))
+            self.validity.append(1)
+    @property
+    def null_count(self):
+        '''
+        Getter for null_count
+        '''
+        return len(self.validity) - sum(self.validity)
+
+class ColumnarBatch(object):
+    '''
+    Class for accumulating the results of many parsed instances of 
+    the same parser class into typed column buffers (see Column), for 
+    export to NumPy arrays or Arrow record batches/IPC without creating 
+    per-row Python objects.  Nested structures are flattened into columns
+    named by their dotted path (i.e. header.Signature), and list values
+    are not stored.  Exported arrays share memory with the column buffers
+    (which cannot be resized while they are exported), so exporting the 
+    batch (to_numpy, to_arrow or write_ipc) freezes it: later appends 
+    raise ValueError until the batch is cleared.  For example:
+    batch = ColumnarBatch(MFTEntry)
+    for entry in entries:
+        batch.append(entry)
+    batch.write_ipc('mft.arrow')
+    '''
+    def __init__(self, parser, timestamps='datetime64'):
+        assert isinstance(parser, type) and issubclass(parser, BaseParser)
+        assert timestamps in ('filetime', 'datetime64')
+        self.parser = parser
+        self.timestamps = timestamps
+        self.columns = OrderedDict()
+        self.length = 0
+        self.frozen = False
+    def __len__(self):
+        return self.length
+    @staticmethod
+    def _flatten(value):
+        '''
+        Args:
+            value: Container<String, Any>   => cleaned parse results
+        Returns:
+            List<Tuple<String, Any>>
+            Scalar leaves of value keyed by dotted path, in key order
+        Preconditions:
+            value is of type Container or CompactRecord
+        '''
+        leaves = list()
+        stack = [('', value)]
+        while len(stack) > 0:
+            prefix, current = stack.pop()
+            children = list()
+            for key in current.keys():
+                child = current[key]
+                name = prefix + key
+                if isinstance(child, (Container, CompactRecord)):
+                    children.append((name + '.', child))
+                elif not isinstance(child, list):
+                    leaves.append((name, child))
+            stack.extend(reversed(children))
+        return leaves
+    def append(self, value):
+        '''
+        Args:
+            value: BaseParser|Container<String, Any>    => parsed instance of self.parser,
+                                                           or results from BaseParser.get_results
+        Procedure:
+            Append the results of value as a new row, filling columns missing
+            from value (and new columns for previous rows) with nulls
+        Preconditions:
+            value is an instance of self.parser or of type Container
+            self.frozen is False
+        '''
+        if self.frozen:
+            raise ValueError('batch was exported and cannot be appended to until it is cleared')
+        if isinstance(value, BaseParser):
+            assert isinstance(value, self.parser)
+            value = value.get_results()
+        else:
+            value = clean_value(value)
+        seen = set()
+        for name, leaf in self._flatten(value):
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = Column(name, self.length)
+            column.append(leaf)
+            seen.add(name)
+        for name, column in self.columns.items():
+            if not (name in seen):
+                column.append(None)
+        self.length += 1
+    def extend(self, values):
+        '''
+        Args:
+            values: Iterable<BaseParser|Container<String, Any>> => values to append
+        Procedure:
+            Append each of values (see ColumnarBatch.append)
+        Preconditions:
+            N/A
+        '''
+        for value in values:
+            self.append(value)
+    def _timestamps(self, column):
+        '''
+        Args:
+            column: Column  => timestamp column
+        Returns:
+            numpy.ndarray
+            Values of column as int64 FILETIME or datetime64[ns] (see self.timestamps)
+        Preconditions:
+            NumPy is available
+        '''
+        values = np.frombuffer(column.values, dtype=np.int64)
+        if self.timestamps == 'filetime':
+            return values
+        return WindowsTime.parse_many(values.view(np.uint64), output='datetime64')
+    def to_numpy(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            OrderedDict<String, Any>
+            Arrays keyed by column name.  Fixed-width columns are NumPy arrays 
+            (numpy.ma.MaskedArray if they contain nulls, timestamp nulls are NaT),
+            string and binary columns are (offsets, data) pairs of int64 and uint8 
+            arrays, and columns with only nulls are None.  Buffers are shared with 
+            the batch rather than copied, so the batch is frozen (see ColumnarBatch).
+        Preconditions:
+            NumPy is available
+        '''
+        if np is None:
+            raise ImportError('NumPy is required to export columnar batches to NumPy')
+        self.frozen = True
+        arrays = OrderedDict()
+        for name, column in self.columns.items():
+            if column.kind is None:
+                arrays[name] = None
+                continue
+            if column.kind in (Column.STRING, Column.BINARY):
+                arrays[name] = (
+                    np.frombuffer(column.offsets, dtype=np.int64),
+                    np.frombuffer(column.values, dtype=np.uint8)
+                )
+                continue
+            elif column.kind == Column.TIMESTAMP:
+                values = self._timestamps(column)
+            elif column.kind == Column.BOOL:
+                values = np.frombuffer(column.values, dtype=np.int8).view(np.bool_)
+            else:
+                values = np.frombuffer(column.values, dtype={
+                    Column.INT: np.int64,
+                    Column.UINT: np.uint64,
+                    Column.FLOAT: np.float64
+                }.get(column.kind))
+            if column.null_count > 0:
+                mask = np.frombuffer(column.validity, dtype=np.uint8) == 0
+                if column.kind == Column.TIMESTAMP and self.timestamps == 'datetime64':
+                    values = values.copy()
+                    values[mask] = np.datetime64('NaT')
+                else:
+                    values = np.ma.MaskedArray(values, mask=mask)
+            arrays[name] = values
+        return arrays
+    def to_arrow(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            pyarrow.RecordBatch
+            Arrow record batch with one array per column, built directly from
+            the column buffers, so the batch is frozen (see ColumnarBatch)
+        Preconditions:
+            pyarrow and NumPy are available
+        '''
+        if pa is None or np is None:
+            raise ImportError('pyarrow and NumPy are required to export columnar batches to Arrow')
+        self.frozen = True
+        arrays = list()
+        names = list()
+        for name, column in self.columns.items():
+            validity = None
+            if column.null_count > 0:
+                validity = pa.py_buffer(np.packbits(
+                    np.frombuffer(column.validity, dtype=np.uint8), 
+                    bitorder='little'
+                ))
+            if column.kind is None:
+                array_ = pa.nulls(len(column))
+            elif column.kind in (Column.STRING, Column.BINARY):
+                array_ = pa.Array.from_buffers(
+                    pa.large_string() if column.kind == Column.STRING else pa.large_binary(),
+                    len(column),
+                    [validity, pa.py_buffer(column.offsets), pa.py_buffer(column.values)]
+                )
+            elif column.kind == Column.BOOL:
+                array_ = pa.Array.from_buffers(
+                    pa.bool_(), 
+                    len(column), 
+                    [validity, pa.py_buffer(np.packbits(
+                        np.frombuffer(column.values, dtype=np.uint8), 
+                        bitorder='little'
+                    ))]
+                )
+            elif column.kind == Column.TIMESTAMP:
+                values = self._timestamps(column)
+                if self.timestamps == 'datetime64':
+                    array_type = pa.timestamp('ns', tz='UTC')
+                    values = values.view(np.int64)
+                else:
+                    array_type = pa.int64()
+                array_ = pa.Array.from_buffers(array_type, len(column), [validity, pa.py_buffer(values)])
+            else:
+                array_ = pa.Array.from_buffers(
+                    {
+                        Column.INT: pa.int64(), 
+                        Column.UINT: pa.uint64(), 
+                        Column.FLOAT: pa.float64()
+                    }.get(column.kind), 
+                    len(column), 
+                    [validity, pa.py_buffer(column.values)]
+                )
+            names.append(name)
+            arrays.append(array_)
+        return pa.RecordBatch.from_arrays(arrays, names=names)
+    def write_ipc(self, sink):
+        '''
+        Args:
+            sink: String|Any    => path or writable file-like object
+        Procedure:
+            Write the batch to sink in the Arrow IPC file format
+        Preconditions:
+            pyarrow and NumPy are available
+        '''
+        batch = self.to_arrow()
+        with pa.ipc.new_file(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+    def clear(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Remove all rows and columns from the batch and unfreeze it (exported
+            arrays keep the previous buffers)
+        Preconditions:
+            N/A
+        '''
+        self.columns = OrderedDict()
+        self.length = 0
+        self.frozen = False
@@ -0,0 +1,615 @@
+## -*- coding: UTF-8 -*-
+## compression.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+import zlib
+import bz2
+import lzma
+import struct
+import tarfile
+import zipfile
+from io import RawIOBase, BufferedIOBase, BufferedReader, SEEK_SET, SEEK_CUR, SEEK_END
+from bisect import bisect_right
+
+from .lazy import lazy_import
+zstandard = lazy_import('zstandard', optional=True)
+lz4_frame = lazy_import('lz4.frame', optional=True)
+
+## NOTE: magic numbers of supported compression formats
+MAGIC_NUMBERS = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+    (b'\x04\x22\x4d\x18', 'lz4'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+)
+COMPRESSIONS = ('gzip', 'zlib', 'deflate', 'zstd', 'lz4', 'bz2', 'xz')
+
+def detect_compression(fhandle):
+    '''
+    Args:
+        fhandle: BinaryIO   => seekable stream positioned at the start of the data
+    Returns:
+        String
+        Compression format of the data (see COMPRESSIONS) based on its 
+        magic number, or None if it is not compressed (or not recognized).
+        The position of fhandle is restored.
+    Preconditions:
+        fhandle is seekable
+    '''
+    position = fhandle.tell()
+    header = fhandle.read(6)
+    fhandle.seek(position)
+    for magic, compression in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return compression
+    return None
+
+class RangeReader(RawIOBase):
+    '''
+    Raw read-only stream over the length bytes at offset in another 
+    seekable binary stream (i.e. a member stored in an archive).  Every read 
+    seeks the underlying stream, so it can be shared, and should be wrapped 
+    in a BufferedReader to avoid small reads.
+    '''
+    def __init__(self, fhandle, offset, length, close_fhandle=False):
+        assert isinstance(offset, int) and offset >= 0
+        assert isinstance(length, int) and length >= 0
+        super().__init__()
+        self.__fhandle = fhandle
+        self.__offset = offset
+        self.__length = length
+        self.__position = 0
+        self.__close_fhandle = close_fhandle
+    def readable(self):
+        '''
+        @RawIOBase.readable
+        '''
+        return True
+    def seekable(self):
+        '''
+        @RawIOBase.seekable
+        '''
+        return True
+    def readinto(self, buffer):
+        '''
+        @RawIOBase.readinto
+        '''
+        self._checkClosed()
+        with memoryview(buffer) as target:
+            target = target.cast('B')
+            size = min(len(target), self.__length - self.__position)
+            if size <= 0:
+                return 0
+            self.__fhandle.seek(self.__offset + self.__position)
+            read = self.__fhandle.readinto(target[:size])
+            self.__position += read
+            return read
+    def seek(self, offset, whence=SEEK_SET):
+        '''
+        @RawIOBase.seek
+        '''
+        self._checkClosed()
+        if whence == SEEK_SET:
+            position = offset
+        elif whence == SEEK_CUR:
+            position = self.__position + offset
+        elif whence == SEEK_END:
+            position = self.__length + offset
+        else:
+            raise ValueError('invalid whence (%s, should be 0, 1 or 2)'%repr(whence))
+        if position < 0:
+            raise ValueError('negative seek position %d'%position)
+        self.__position = position
+        return position
+    def tell(self):
+        '''
+        @RawIOBase.tell
+        '''
+        self._checkClosed()
+        return self.__position
+    def close(self):
+        '''
+        @RawIOBase.close
+        '''
+        if not self.closed:
+            try:
+                if self.__close_fhandle:
+                    self.__fhandle.close()
+            finally:
+                super().close()
+
+class ZlibDecoder(object):
+    '''
+    Incremental decoder for gzip, zlib and raw deflate data, whose
+    state can be captured at any point (see ZlibDecoder.checkpoint) to 
+    resume decompression from there later.  Concatenated gzip members 
+    are decoded as one stream.
+    '''
+    WBITS = dict(gzip=31, zlib=15, deflate=-15)
+
+    def __init__(self, raw, compression, chunk_size):
+        self.raw = raw
+        self.wbits = self.WBITS[compression]
+        self.chunk_size = chunk_size
+        self.start = raw.tell()
+        self.reset()
+    def reset(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Restart decompression from the start of the data
+        Preconditions:
+            N/A
+        '''
+        self.raw.seek(self.start)
+        self.decompressor = zlib.decompressobj(self.wbits)
+        self.pending = b''
+    def read(self, size):
+        '''
+        Args:
+            size: Integer   => maximum number of bytes to decompress
+        Returns:
+            Bytes
+            Next decompressed bytes (empty at the end of the data)
+        Preconditions:
+            size is of type Integer (> 0)
+        '''
+        while True:
+            if self.decompressor.eof:
+                ## NOTE: only gzip allows concatenated members
+                if self.wbits != self.WBITS['gzip']:
+                    return b''
+                if len(self.pending) == 0:
+                    self.pending = self.raw.read(self.chunk_size)
+                    if len(self.pending) == 0:
+                        return b''
+                self.decompressor = zlib.decompressobj(self.wbits)
+            if len(self.pending) == 0:
+                self.pending = self.raw.read(self.chunk_size)
+                if len(self.pending) == 0:
+                    return b''
+            output = self.decompressor.decompress(self.pending, size)
+            self.pending = self.decompressor.unused_data if self.decompressor.eof else self.decompressor.unconsumed_tail
+            if len(output) > 0:
+                return output
+    def checkpoint(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Tuple<Integer, Bytes, Decompress>
+            State of decompression to resume from (see ZlibDecoder.restore)
+        Preconditions:
+            N/A
+        '''
+        return (self.raw.tell(), self.pending, self.decompressor.copy())
+    def restore(self, state):
+        '''
+        Args:
+            state: Tuple<Integer, Bytes, Decompress>    => result of ZlibDecoder.checkpoint
+        Procedure:
+            Resume decompression from state
+        Preconditions:
+            state was created by this decoder
+        '''
+        position, self.pending, decompressor = state
+        self.raw.seek(position)
+        self.decompressor = decompressor.copy()
+
+class StreamDecoder(object):
+    '''
+    Incremental decoder for formats whose decompressors follow the
+    bz2/lzma interface (decompress(data, max_length), needs_input, eof 
+    and unused_data), i.e. bz2, xz and lz4 frames.  Decompression state 
+    cannot be captured, so StreamDecoder.checkpoint returns None.
+    '''
+    def __init__(self, raw, factory, chunk_size):
+        self.raw = raw
+        self.factory = factory
+        self.chunk_size = chunk_size
+        self.start = raw.tell()
+        self.reset()
+    def reset(self):
+        '''
+        @ZlibDecoder.reset
+        '''
+        self.raw.seek(self.start)
+        self.decompressor = self.factory()
+        self.pending = b''
+    def read(self, size):
+        '''
+        @ZlibDecoder.read
+        '''
+        while True:
+            if self.decompressor.eof:
+                self.pending = self.decompressor.unused_data or self.raw.read(self.chunk_size)
+                if len(self.pending) == 0:
+                    return b''
+                self.decompressor = self.factory()
+            data = b''
+            if self.decompressor.needs_input:
+                data = self.pending or self.raw.read(self.chunk_size)
+                self.pending = b''
+                if len(data) == 0:
+                    return b''
+            output = self.decompressor.decompress(data, size)
+            if len(output) > 0:
+                return output
+    def checkpoint(self):
+        '''
+        @ZlibDecoder.checkpoint
+        '''
+        return None
+
+class ReaderDecoder(object):
+    '''
+    Decoder for formats only available as a streaming reader over the
+    raw data (i.e. zstd through zstandard.ZstdDecompressor.stream_reader).
+    Decompression state cannot be captured.
+    '''
+    def __init__(self, raw, factory):
+        self.raw = raw
+        self.factory = factory
+        self.start = raw.tell()
+        self.reader = None
+        self.reset()
+    def reset(self):
+        '''
+        @ZlibDecoder.reset
+        '''
+        self.raw.seek(self.start)
+        self.reader = self.factory(self.raw)
+    def read(self, size):
+        '''
+        @ZlibDecoder.read
+        '''
+        return self.reader.read(size)
+    def checkpoint(self):
+        '''
+        @ZlibDecoder.checkpoint
+        '''
+        return None
+
+def create_decoder(raw, compression, chunk_size):
+    '''
+    Args:
+        raw: BinaryIO       => seekable stream of compressed data
+        compression: String => compression format (see COMPRESSIONS)
+        chunk_size: Integer => number of compressed bytes to read at a time
+    Returns:
+        Any
+        Decoder for compression over raw (see ZlibDecoder)
+    Preconditions:
+        raw is positioned at the start of the compressed data
+        compression is one of COMPRESSIONS
+    '''
+    if compression in ZlibDecoder.WBITS:
+        return ZlibDecoder(raw, compression, chunk_size)
+    elif compression == 'bz2':
+        return StreamDecoder(raw, bz2.BZ2Decompressor, chunk_size)
+    elif compression == 'xz':
+        return StreamDecoder(raw, lzma.LZMADecompressor, chunk_size)
+    elif compression == 'lz4':
+        if lz4_frame is None:
+            raise ImportError('lz4 is required to decompress lz4 sources')
+        return StreamDecoder(raw, lz4_frame.LZ4FrameDecompressor, chunk_size)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('zstandard is required to decompress zstd sources')
+        return ReaderDecoder(
+            raw, 
+            lambda raw: zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=False)
+        )
+    raise ValueError('%s is not a supported compression format'%repr(compression))
+
+class DecompressingStream(BufferedIOBase):
+    '''
+    Read-only, seekable binary stream over compressed data that is 
+    decompressed incrementally as it is read.  The last history_size 
+    decompressed bytes are kept so that short backward seeks are served 
+    from memory, and for gzip/zlib/deflate data the decompressor state is 
+    saved every seek_interval decompressed bytes (a seek-point index), so
+    longer backward seeks resume from the nearest seek point instead of
+    restarting from the beginning.  Other formats restart decompression 
+    for seeks before the history (counted in restarts).  Seeking relative
+    to the end decompresses the rest of the data once to find its size.
+    '''
+    CHUNK_SIZE      = 64 * 1024
+    SEEK_INTERVAL   = 4 * 1024 * 1024
+    HISTORY_SIZE    = 1024 * 1024
+
+    def __init__(self, raw, compression, seek_interval=None, history_size=None, name=None, close_raw=True):
+        assert compression in COMPRESSIONS
+        assert seek_interval is None or (isinstance(seek_interval, int) and seek_interval > 0)
+        assert history_size is None or (isinstance(history_size, int) and history_size >= 0)
+        super().__init__()
+        self.compression = compression
+        self.seek_interval = seek_interval if seek_interval is not None else self.SEEK_INTERVAL
+        self.history_size = history_size if history_size is not None else self.HISTORY_SIZE
+        self.name = name if name is not None else getattr(raw, 'name', None)
+        self.restarts = 0
+        self.seek_point_hits = 0
+        self.__raw = raw
+        self.__close_raw = close_raw
+        self.__decoder = create_decoder(raw, compression, self.CHUNK_SIZE)
+        self.__buffer = bytearray()
+        self.__buffer_start = 0
+        self.__position = 0
+        self.__size = None
+        self.__offsets = list()
+        self.__points = list()
+    def readable(self):
+        '''
+        @BufferedIOBase.readable
+        '''
+        return True
+    def seekable(self):
+        '''
+        @BufferedIOBase.seekable
+        '''
+        return True
+    def _decode(self, keep):
+        '''
+        Args:
+            keep: Integer   => offset of the first decompressed byte still needed
+        Returns:
+            Boolean
+            Whether more data was decompressed (False at the end of the data).
+            Decompressed bytes more than self.history_size before keep are 
+            discarded, and a seek point is saved every self.seek_interval bytes.
+        Preconditions:
+            keep is of type Integer (>= 0)
+        '''
+        output = self.__decoder.read(max(self.CHUNK_SIZE, 1))
+        end = self.__buffer_start + len(self.__buffer)
+        if len(output) == 0:
+            self.__size = end
+            return False
+        self.__buffer += output
+        end += len(output)
+        cut = min(keep, end) - self.history_size - self.__buffer_start
+        ## NOTE: trim in large steps so the buffer is not shifted on every call
+        if cut > max(self.history_size, self.CHUNK_SIZE):
+            del self.__buffer[:cut]
+            self.__buffer_start += cut
+        if end - (self.__offsets[-1] if len(self.__offsets) > 0 else 0) >= self.seek_interval:
+            state = self.__decoder.checkpoint()
+            if state is not None:
+                self.__offsets.append(end)
+                self.__points.append(state)
+        return True
+    def _rewind(self, position):
+        '''
+        Args:
+            position: Integer   => offset to decompress from
+        Procedure:
+            Restore the decoder to the last seek point at or before position,
+            or restart decompression if there is none
+        Preconditions:
+            position < self.__buffer_start
+        '''
+        idx = bisect_right(self.__offsets, position)
+        if idx > 0:
+            self.__decoder.restore(self.__points[idx - 1])
+            self.__buffer_start = self.__offsets[idx - 1]
+            self.seek_point_hits += 1
+        else:
+            self.__decoder.reset()
+            self.__buffer_start = 0
+            self.restarts += 1
+        self.__buffer = bytearray()
+    def _fill(self, start, end):
+        '''
+        Args:
+            start: Integer  => offset of the first byte to read
+            end: Integer    => offset after the last byte to read (None for the end of the data)
+        Returns:
+            memoryview
+            Decompressed bytes from start to end (or the end of the data)
+        Preconditions:
+            start is of type Integer (>= 0)
+        '''
+        if start < self.__buffer_start:
+            self._rewind(start)
+        while (end is None or self.__buffer_start + len(self.__buffer) < end) and self._decode(start):
+            pass
+        view = memoryview(self.__buffer)
+        return view[
+            max(start - self.__buffer_start, 0):
+            len(view) if end is None else max(end - self.__buffer_start, 0)
+        ]
+    def read(self, size=-1):
+        '''
+        @BufferedIOBase.read
+        '''
+        self._checkClosed()
+        start = self.__position
+        end = None if size is None or size < 0 else start + size
+        with self._fill(start, end) as view:
+            chunk = bytes(view)
+        self.__position += len(chunk)
+        return chunk
+    def read1(self, size=-1):
+        '''
+        @BufferedIOBase.read1
+        '''
+        return self.read(size)
+    def readinto(self, buffer):
+        '''
+        @BufferedIOBase.readinto
+        '''
+        self._checkClosed()
+        with memoryview(buffer) as target:
+            target = target.cast('B')
+            with self._fill(self.__position, self.__position + len(target)) as view:
+                target[:len(view)] = view
+                self.__position += len(view)
+                return len(view)
+    def _get_size(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Integer
+            Size of the decompressed data
+        Preconditions:
+            N/A
+        '''
+        if self.__size is None:
+            if self.__position < self.__buffer_start:
+                self._rewind(self.__position)
+            while self._decode(self.__buffer_start + len(self.__buffer)):
+                pass
+        return self.__size
+    def seek(self, offset, whence=SEEK_SET):
+        '''
+        @BufferedIOBase.seek
+        '''
+        self._checkClosed()
+        if whence == SEEK_SET:
+            position = offset
+        elif whence == SEEK_CUR:
+            position = self.__position + offset
+        elif whence == SEEK_END:
+            position = self._get_size() + offset
+        else:
+            raise ValueError('invalid whence (%s, should be 0, 1 or 2)'%repr(whence))
+        if position < 0:
+            raise ValueError('negative seek position %d'%position)
+        self.__position = position
+        return position
+    def tell(self):
+        '''
+        @BufferedIOBase.tell
+        '''
+        self._checkClosed()
+        return self.__position
+    def close(self):
+        '''
+        @BufferedIOBase.close
+        '''
+        if not self.closed:
+            try:
+                self.__buffer = bytearray()
+                self.__points = list()
+                if self.__close_raw:
+                    self.__raw.close()
+            finally:
+                super().close()
+    def __repr__(self):
+        return '%s(%s, %s)'%(type(self).__name__, repr(self.name), repr(self.compression))
+
+def _open_zip_member(filepath, fhandle, member, **kwargs):
+    '''
+    Args:
+        filepath: String    => path of the zip archive
+        fhandle: BinaryIO   => seekable stream of the zip archive
+        member: String      => name of the member to open
+        kwargs: Dict<String, Any>   => keyword arguments to DecompressingStream
+    Returns:
+        BinaryIO
+        Stream of the member: stored members are read in place, deflated 
+        members through a DecompressingStream (with seek points) and other
+        members through zipfile
+    Preconditions:
+        fhandle is seekable
+    '''
+    archive = zipfile.ZipFile(fhandle)
+    info = archive.getinfo(member)
+    if info.flag_bits & 0x1:
+        raise ValueError('encrypted zip member %s is not supported'%repr(member))
+    if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        fhandle.close()
+        archive = zipfile.ZipFile(filepath)
+        try:
+            return archive.open(member)
+        finally:
+            ## NOTE: the member stream keeps the file open until it is closed
+            archive.close()
+    fhandle.seek(info.header_offset)
+    header = struct.unpack('<4s5H3L2H', fhandle.read(30))
+    if header[0] != b'PK\x03\x04':
+        raise ValueError('invalid local header for zip member %s'%repr(member))
+    offset = info.header_offset + 30 + header[9] + header[10]
+    raw = BufferedReader(RangeReader(fhandle, offset, info.compress_size, close_fhandle=True))
+    if info.compress_type == zipfile.ZIP_STORED:
+        return raw
+    return DecompressingStream(raw, 'deflate', name=member, **kwargs)
+
+def _open_tar_member(fhandle, member):
+    '''
+    Args:
+        fhandle: BinaryIO   => seekable stream of a (decompressed) tar archive
+        member: String      => name of the member to open
+    Returns:
+        BinaryIO
+        Stream of the member, read in place from fhandle
+    Preconditions:
+        fhandle is seekable
+    '''
+    archive = tarfile.open(fileobj=fhandle, mode='r:')
+    info = archive.getmember(member)
+    if not info.isreg() or info.issparse():
+        raise ValueError('tar member %s is not a regular file'%repr(member))
+    return BufferedReader(RangeReader(fhandle, info.offset_data, info.size, close_fhandle=True))
+
+def open_source(filepath, compression='auto', member=None, **kwargs):
+    '''
+    Args:
+        filepath: String    => path of (possibly compressed) file or archive
+        compression: String => compression format (see COMPRESSIONS), 'auto' to 
+                               detect it from the magic number or None if the 
+                               file is not compressed
+        member: String      => name of member to open if filepath is a zip or tar archive
+        kwargs: Dict<String, Any>   => keyword arguments to DecompressingStream
+    Returns:
+        BinaryIO
+        Seekable stream of the decompressed contents of filepath (or of member)
+    Preconditions:
+        filepath is of type String
+        compression is None, 'auto' or one of COMPRESSIONS
+        member is None or of type String
+    '''
+    assert isinstance(filepath, str)
+    assert compression is None or compression == 'auto' or compression in COMPRESSIONS
+    assert member is None or isinstance(member, str)
+    stream = open(filepath, 'rb')
+    try:
+        if member is not None and compression in (None, 'auto') and \
+            stream.read(4) == b'PK\x03\x04':
+            stream.seek(0)
+            return _open_zip_member(filepath, stream, member, **kwargs)
+        stream.seek(0)
+        if compression == 'auto':
+            compression = detect_compression(stream)
+        if compression is not None:
+            stream = DecompressingStream(stream, compression, name=filepath, **kwargs)
+        if member is not None:
+            return _open_tar_member(stream, member)
+        return stream
+    except Exception:
+        stream.close()
+        raise
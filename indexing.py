@@ -0,0 +1,285 @@
+## -*- coding: UTF-8 -*-
+## indexing.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+import sys
+import json
+import struct
+import hashlib
+import tempfile
+from os import path, replace, remove, makedirs
+from mmap import mmap, ACCESS_READ
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+
+class SignatureIndex(object):
+    '''
+    Sorted index of the offsets of record signatures (i.e. b'FILE0', 
+    b'ElfChnk\x00') in a file, built by scanning a memory mapping of the 
+    file in chunk_size pieces for each signature.  Only matches at multiples 
+    of alignment are kept, and matches may overlap (an aligned match is 
+    found even if an unaligned one starts before it).  Indexes can be saved 
+    and loaded (see SignatureIndex.save and SignatureIndex.load) and are 
+    tied to the fingerprint of the file they were built from, so that 
+    repeated analyses of the same evidence skip the scan.  Saved indexes 
+    are a JSON header followed by the raw offset arrays, so loading one
+    never executes code from the file.  Offsets are iterated in ascending 
+    order, i.e.:
+    index = SignatureIndex.build(filepath, [b'FILE0'], alignment=1024)
+    for offset in index:
+        ...
+    '''
+    CHUNK_SIZE = 64 * 1024 * 1024
+    EXTENSION = '.sigidx'
+    MAGIC = b'SIGIDX01'
+    HEADER_SIZE = struct.Struct('<I')
+
+    def __init__(self, signatures, alignment=1, fingerprint=None, offsets=None):
+        assert isinstance(signatures, (list, tuple)) and len(signatures) > 0
+        assert all(isinstance(signature, bytes) and len(signature) > 0 for signature in signatures)
+        assert isinstance(alignment, int) and alignment > 0
+        assert fingerprint is None or isinstance(fingerprint, str)
+        self.signatures = tuple(signatures)
+        self.alignment = alignment
+        self.fingerprint = fingerprint
+        self.offsets = offsets if offsets is not None else {
+            signature: array('Q') for signature in self.signatures
+        }
+        self.__merged = None
+    @classmethod
+    def build(cls, filepath, signatures, alignment=1, fingerprint=None, chunk_size=None):
+        '''
+        Args:
+            filepath: String            => path of file to scan
+            signatures: List<Bytes>     => record signatures to index
+            alignment: Integer          => alignment of records in the file
+            fingerprint: String         => fingerprint of the file (see BaseParser.get_fingerprint)
+            chunk_size: Integer         => number of bytes to scan at a time
+        Returns:
+            SignatureIndex
+            Index of every aligned occurrence of signatures in filepath
+        Preconditions:
+            filepath is of type String
+            chunk_size is None or of type Integer (> 0)
+        '''
+        assert isinstance(filepath, str)
+        assert chunk_size is None or (isinstance(chunk_size, int) and chunk_size > 0)
+        index = cls(signatures, alignment, fingerprint)
+        chunk_size = chunk_size if chunk_size is not None else cls.CHUNK_SIZE
+        with open(filepath, 'rb') as fhandle:
+            try:
+                mapping = mmap(fhandle.fileno(), 0, access=ACCESS_READ)
+            except ValueError:
+                ## NOTE: empty files cannot be mapped
+                return index
+            with mapping:
+                size = len(mapping)
+                for start in range(0, size, chunk_size):
+                    end = min(start + chunk_size, size)
+                    for signature in index.signatures:
+                        offsets = index.offsets[signature]
+                        ## NOTE: matches may extend past the chunk, but must start in it
+                        limit = min(end + len(signature) - 1, size)
+                        offset = mapping.find(signature, start, limit)
+                        while offset != -1:
+                            if offset % alignment == 0:
+                                offsets.append(offset)
+                                offset += alignment
+                            else:
+                                ## NOTE: resume at the next aligned offset, which may be
+                                ## inside this (unaligned) match
+                                offset += alignment - offset % alignment
+                            offset = mapping.find(signature, offset, limit)
+        return index
+    @classmethod
+    def get_path(cls, filepath, fingerprint, signatures, alignment=1, cache_dir=None):
+        '''
+        Args:
+            filepath: String            => path of indexed file
+            fingerprint: String         => fingerprint of the file
+            signatures: List<Bytes>     => record signatures of the index
+            alignment: Integer          => alignment of records in the file
+            cache_dir: String           => directory to store indexes in
+        Returns:
+            String
+            Path of the index file: in cache_dir, named after a hash of the 
+            fingerprint and signatures, or next to filepath if cache_dir is None
+        Preconditions:
+            filepath is of type String
+            fingerprint is None or of type String
+            cache_dir is None or of type String
+        '''
+        if cache_dir is None:
+            return filepath + cls.EXTENSION
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(fingerprint if fingerprint is not None else path.abspath(filepath)).encode('utf8'))
+        digest.update(repr((tuple(signatures), alignment)).encode('utf8'))
+        return path.join(cache_dir, digest.hexdigest() + cls.EXTENSION)
+    @classmethod
+    def load(cls, filepath, signatures, alignment=1, fingerprint=None):
+        '''
+        Args:
+            filepath: String            => path of saved index
+            signatures: List<Bytes>     => expected record signatures
+            alignment: Integer          => expected alignment
+            fingerprint: String         => expected fingerprint of the indexed file
+        Returns:
+            SignatureIndex
+            Saved index if it exists and matches signatures, alignment and 
+            fingerprint, otherwise None
+        Preconditions:
+            filepath is of type String
+        '''
+        if fingerprint is None or not path.exists(filepath):
+            return None
+        try:
+            with open(filepath, 'rb') as fhandle:
+                if fhandle.read(len(cls.MAGIC)) != cls.MAGIC:
+                    raise ValueError('not a signature index')
+                header_size, = cls.HEADER_SIZE.unpack(fhandle.read(cls.HEADER_SIZE.size))
+                header = json.loads(fhandle.read(header_size).decode('utf8'))
+                if header.get('fingerprint') != fingerprint or \
+                    header.get('signatures') != [signature.hex() for signature in signatures] or \
+                    header.get('alignment') != alignment:
+                    return None
+                offsets = dict()
+                for signature, count in zip(signatures, header.get('counts')):
+                    offsets[signature] = array('Q')
+                    offsets[signature].fromfile(fhandle, count)
+                    if header.get('byteorder') != sys.byteorder:
+                        offsets[signature].byteswap()
+        except Exception as e:
+            Logger.error('Failed to load signature index %s (%s)'%(filepath, str(e)))
+            return None
+        return cls(signatures, alignment, fingerprint, offsets)
+    def save(self, filepath):
+        '''
+        Args:
+            filepath: String    => path to save index to
+        Procedure:
+            Atomically write this index to filepath
+        Preconditions:
+            filepath is of type String
+        '''
+        assert isinstance(filepath, str)
+        directory = path.dirname(path.abspath(filepath))
+        makedirs(directory, exist_ok=True)
+        header = json.dumps(dict(
+            fingerprint=self.fingerprint,
+            signatures=[signature.hex() for signature in self.signatures],
+            alignment=self.alignment,
+            counts=[len(self.offsets[signature]) for signature in self.signatures],
+            byteorder=sys.byteorder
+        )).encode('utf8')
+        with tempfile.NamedTemporaryFile('wb', dir=directory, prefix='.sigidx-', delete=False) as fhandle:
+            try:
+                fhandle.write(self.MAGIC)
+                fhandle.write(self.HEADER_SIZE.pack(len(header)))
+                fhandle.write(header)
+                for signature in self.signatures:
+                    self.offsets[signature].tofile(fhandle)
+            except Exception:
+                fhandle.close()
+                remove(fhandle.name)
+                raise
+        replace(fhandle.name, filepath)
+    def _get_merged(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            array<Integer>
+            Offsets of all signatures in ascending order
+        Preconditions:
+            N/A
+        '''
+        if self.__merged is None:
+            if len(self.offsets) == 1:
+                self.__merged = next(iter(self.offsets.values()))
+            else:
+                ## NOTE: a signature that is a prefix of another matches at the same offset
+                self.__merged = array('Q')
+                for offset in merge(*self.offsets.values()):
+                    if len(self.__merged) == 0 or self.__merged[-1] != offset:
+                        self.__merged.append(offset)
+        return self.__merged
+    def get_offsets(self, signature=None):
+        '''
+        Args:
+            signature: Bytes    => signature to get offsets of (all if None)
+        Returns:
+            array<Integer>
+            Offsets of signature in ascending order
+        Preconditions:
+            signature is None or one of self.signatures
+        '''
+        if signature is None:
+            return self._get_merged()
+        return self.offsets[signature]
+    def find(self, offset):
+        '''
+        Args:
+            offset: Integer => offset into the indexed file
+        Returns:
+            Integer
+            Offset of the last indexed record starting at or before offset,
+            or None if there is none (i.e. to find the record containing offset)
+        Preconditions:
+            offset is of type Integer
+        '''
+        merged = self._get_merged()
+        idx = bisect_right(merged, offset)
+        return merged[idx - 1] if idx > 0 else None
+    def between(self, start, end):
+        '''
+        Args:
+            start: Integer  => first offset (inclusive)
+            end: Integer    => last offset (exclusive)
+        Returns:
+            array<Integer>
+            Indexed offsets in [start, end)
+        Preconditions:
+            start is of type Integer
+            end is of type Integer
+        '''
+        merged = self._get_merged()
+        return merged[bisect_left(merged, start):bisect_left(merged, end)]
+    def __contains__(self, offset):
+        merged = self._get_merged()
+        idx = bisect_left(merged, offset)
+        return idx < len(merged) and merged[idx] == offset
+    def __getitem__(self, idx):
+        return self._get_merged()[idx]
+    def __iter__(self):
+        return iter(self._get_merged())
+    def __len__(self):
+        return len(self._get_merged())
+    def __repr__(self):
+        return '%s(%s, alignment=%d, <%d offsets>)'%(
+            type(self).__name__,
+            repr(self.signatures),
+            self.alignment,
+            len(self)
+        )
@@ -0,0 +1,440 @@
+## -*- coding: UTF-8 -*-
+## isolation.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+import multiprocessing
+from os import cpu_count
+from time import monotonic
+from multiprocessing.connection import wait
+from construct.lib import Container
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from . import BaseParser
+from .parallel import parse_source
+
+def run_worker(connection, memory_limit=None):
+    '''
+    Args:
+        connection: Connection  => connection to the parent process
+        memory_limit: Integer   => maximum address space of this process in bytes
+    Procedure:
+        Apply memory_limit (RLIMIT_AS) to this process, then receive 
+        (parser, source, args, kwargs) tasks from connection and send back 
+        the result of parse_source for each until None is received or the 
+        connection is closed
+    Preconditions:
+        connection is a Connection
+        memory_limit is None or of type Integer (> 0)
+    '''
+    if memory_limit is not None:
+        if resource is None:
+            Logger.warning('Memory limits are not supported on this platform')
+        else:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    while True:
+        try:
+            task = connection.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        parser, source, args, kwargs = task
+        result = parse_source(parser, source, args, kwargs)
+        try:
+            connection.send(result)
+        except Exception as e:
+            ## NOTE: i.e. the result could not be pickled or allocated
+            connection.send(Container(source=source, result=None, err='%s (%s)'%(type(e).__name__, str(e))))
+
+class IsolatedWorker(object):
+    '''
+    Handle for one long-lived worker process of an IsolatedParserPool
+    and the task it is currently running (if any)
+    '''
+    def __init__(self, context, memory_limit=None):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=run_worker, args=(child, memory_limit), daemon=True)
+        self.process.start()
+        child.close()
+        self.tasks = 0
+        self.task = None
+        self.started = None
+    def submit(self, task, parser, source, args, kwargs):
+        '''
+        Args:
+            task: Integer   => sequence number of the task
+            parser: Type<BaseParser>    => parser class to parse source with
+            source: Any                 => source to parse
+            args: Tuple<Any>            => positional arguments to parser constructor
+            kwargs: Dict<String, Any>   => keyword arguments to parser constructor
+        Procedure:
+            Send the task to the worker process
+        Preconditions:
+            self.task is None
+        '''
+        self.connection.send((parser, source, args, kwargs))
+        self.task = (task, source)
+        self.started = monotonic()
+        self.tasks += 1
+    def stop(self, kill=False):
+        '''
+        Args:
+            kill: Boolean   => whether to kill the worker rather than ask it to exit
+        Procedure:
+            Stop the worker process and close the connection to it
+        Preconditions:
+            kill is of type Boolean
+        '''
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.connection.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(None if kill else 5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+        self.process.close()
+
+class IsolatedParserPool(object):
+    '''
+    Class for parsing untrusted or malformed sources in long-lived worker
+    processes, so that a parser that crashes, exhausts memory or never 
+    returns cannot take down the caller.  Each parse is limited to timeout 
+    seconds (the worker is killed and replaced when it is exceeded), each 
+    worker's address space is limited to memory_limit bytes (RLIMIT_AS, so 
+    huge allocations raise MemoryError in the worker), and workers are 
+    recycled after max_tasks parses.  Results are Containers (see 
+    parse_source) with two additional fields:
+        status: 'ok', 'error' (the parser or any of its structures raised,
+                i.e. MemoryError once memory_limit is reached), 'timeout' or 'crashed'
+                (the worker died, i.e. it was killed by the OOM killer)
+        elapsed: wall time of the parse in seconds
+    For example:
+    with IsolatedParserPool(MFTParser, timeout=60, memory_limit=2 * 1024 ** 3) as pool:
+        for entry in pool.map(sources):
+            if entry.status != 'ok':
+                ...
+    '''
+    def __init__(self, 
+        parser, 
+        workers=None, 
+        timeout=None, 
+        memory_limit=None, 
+        max_tasks=None, 
+        ordered=False, 
+        args=None, 
+        kwargs=None, 
+        context=None):
+        self.parser = parser
+        self.workers = workers if workers is not None else (cpu_count() or 1)
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_tasks = max_tasks
+        self.ordered = ordered
+        self.args = args
+        self.kwargs = kwargs
+        self.context = multiprocessing.get_context(context)
+        self.__pool = None
+        self.__depth = 0
+    @property
+    def parser(self):
+        '''
+        Getter for parser
+        '''
+        return self.__parser
+    @parser.setter
+    def parser(self, value):
+        '''
+        Setter for parser
+        '''
+        assert isinstance(value, type) and issubclass(value, BaseParser)
+        self.__parser = value
+    @property
+    def workers(self):
+        '''
+        Getter for workers
+        '''
+        return self.__workers
+    @workers.setter
+    def workers(self, value):
+        '''
+        Setter for workers
+        '''
+        assert isinstance(value, int) and value > 0
+        self.__workers = value
+    @property
+    def timeout(self):
+        '''
+        Getter for timeout
+        '''
+        return self.__timeout
+    @timeout.setter
+    def timeout(self, value):
+        '''
+        Setter for timeout
+        '''
+        assert value is None or (isinstance(value, (int, float)) and value > 0)
+        self.__timeout = value
+    @property
+    def memory_limit(self):
+        '''
+        Getter for memory_limit
+        '''
+        return self.__memory_limit
+    @memory_limit.setter
+    def memory_limit(self, value):
+        '''
+        Setter for memory_limit
+        '''
+        assert value is None or (isinstance(value, int) and value > 0)
+        self.__memory_limit = value
+    @property
+    def max_tasks(self):
+        '''
+        Getter for max_tasks
+        '''
+        return self.__max_tasks
+    @max_tasks.setter
+    def max_tasks(self, value):
+        '''
+        Setter for max_tasks
+        '''
+        assert value is None or (isinstance(value, int) and value > 0)
+        self.__max_tasks = value
+    @property
+    def ordered(self):
+        '''
+        Getter for ordered
+        '''
+        return self.__ordered
+    @ordered.setter
+    def ordered(self, value):
+        '''
+        Setter for ordered
+        '''
+        assert isinstance(value, bool)
+        self.__ordered = value
+    @property
+    def args(self):
+        '''
+        Getter for args
+        '''
+        return self.__args
+    @args.setter
+    def args(self, value):
+        '''
+        Setter for args
+        '''
+        assert value is None or isinstance(value, tuple)
+        self.__args = value
+    @property
+    def kwargs(self):
+        '''
+        Getter for kwargs
+        '''
+        return self.__kwargs
+    @kwargs.setter
+    def kwargs(self, value):
+        '''
+        Setter for kwargs
+        '''
+        assert value is None or isinstance(value, dict)
+        self.__kwargs = value
+    def _create_worker(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            IsolatedWorker
+            New worker process
+        Preconditions:
+            N/A
+        '''
+        return IsolatedWorker(self.context, self.memory_limit)
+    def _replace(self, worker, kill=False):
+        '''
+        Args:
+            worker: IsolatedWorker  => worker to replace
+            kill: Boolean           => whether to kill the worker
+        Procedure:
+            Stop worker and replace it in the pool with a new worker
+        Preconditions:
+            worker is in the pool
+        '''
+        worker.stop(kill)
+        self.__pool[self.__pool.index(worker)] = self._create_worker()
+    def _finish(self, worker, status, result=None, err=None):
+        '''
+        Args:
+            worker: IsolatedWorker          => worker that finished its task
+            status: String                  => status of the task
+            result: Container<String, Any>  => result received from the worker
+            err: String                     => error message if no result was received
+        Returns:
+            Tuple<Integer, Container<String, Any>>
+            Sequence number and structured result of the task of worker
+        Preconditions:
+            worker.task is not None
+        '''
+        task, source = worker.task
+        elapsed = monotonic() - worker.started
+        worker.task = None
+        if result is None:
+            result = Container(source=source, result=None, err=err)
+            Logger.error('Failed to parse source %s (%s)'%(repr(source), err))
+        elif result.err is not None:
+            status = 'error'
+        result.status = status
+        result.elapsed = elapsed
+        return task, result
+    def _collect(self, busy):
+        '''
+        Args:
+            busy: List<IsolatedWorker>  => workers that are running a task
+        Returns:
+            List<Tuple<Integer, Container<String, Any>>>
+            Sequence number and structured result of each task that completed,
+            failed or timed out, waiting until at least one does
+        Preconditions:
+            len(busy) > 0
+        '''
+        timeout = None
+        if self.timeout is not None:
+            timeout = max(min(worker.started for worker in busy) + self.timeout - monotonic(), 0)
+        ready = set(wait(
+            [worker.connection for worker in busy] + [worker.process.sentinel for worker in busy], 
+            timeout
+        ))
+        now = monotonic()
+        completed = list()
+        for worker in busy:
+            if worker.connection in ready or worker.process.sentinel in ready:
+                try:
+                    completed.append(self._finish(worker, 'ok', result=worker.connection.recv()))
+                except (EOFError, OSError):
+                    worker.process.join()
+                    completed.append(self._finish(
+                        worker, 
+                        'crashed', 
+                        err='worker exited with code %s'%repr(worker.process.exitcode)
+                    ))
+                    self._replace(worker)
+                    continue
+                if self.max_tasks is not None and worker.tasks >= self.max_tasks:
+                    self._replace(worker)
+            elif self.timeout is not None and now - worker.started >= self.timeout:
+                completed.append(self._finish(
+                    worker, 
+                    'timeout', 
+                    err='parsing exceeded %s seconds'%repr(self.timeout)
+                ))
+                self._replace(worker, kill=True)
+        return completed
+    def map(self, sources):
+        '''
+        Args:
+            sources: Iterable<Any>  => sources to parse
+        Returns:
+            Generator<Container<String, Any>>
+            Structured result of parsing each source, in completion order
+            or in the order of sources if self.ordered is True
+        Preconditions:
+            sources is iterable
+        '''
+        with self:
+            sources = iter(sources)
+            exhausted = False
+            submitted = 0
+            next_task = 0
+            buffered = dict()
+            while True:
+                for worker in self.__pool:
+                    if exhausted:
+                        break
+                    if worker.task is None:
+                        try:
+                            source = next(sources)
+                        except StopIteration:
+                            exhausted = True
+                        else:
+                            worker.submit(submitted, self.parser, source, self.args, self.kwargs)
+                            submitted += 1
+                busy = [worker for worker in self.__pool if worker.task is not None]
+                if len(busy) == 0:
+                    break
+                for task, result in self._collect(busy):
+                    if not self.ordered:
+                        yield result
+                    else:
+                        buffered[task] = result
+                while next_task in buffered:
+                    yield buffered.pop(next_task)
+                    next_task += 1
+    def parse(self, source):
+        '''
+        Args:
+            source: Any => source to parse
+        Returns:
+            Container<String, Any>
+            Structured result of parsing source (see IsolatedParserPool.map)
+        Preconditions:
+            N/A
+        '''
+        for result in self.map((source,)):
+            return result
+    def __enter__(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Start the worker processes if they are not already running
+        Preconditions:
+            N/A
+        '''
+        if self.__pool is None:
+            self.__pool = [self._create_worker() for _ in range(self.workers)]
+        self.__depth += 1
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Stop the worker processes when exiting the outermost context,
+            killing any that are still running a task
+        Preconditions:
+            N/A
+        '''
+        self.__depth -= 1
+        if self.__pool is not None and self.__depth == 0:
+            for worker in self.__pool:
+                worker.stop(kill=worker.task is not None)
+            self.__pool = None
@@ -0,0 +1,97 @@
+## -*- coding: UTF-8 -*-
+## lazy.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import sys
+from types import ModuleType
+from threading import Lock
+from importlib import import_module
+from importlib.util import find_spec
+
+class LazyModule(ModuleType):
+    '''
+    Stand-in for a heavy optional dependency that imports it on first 
+    attribute access.  The import is done once under a lock, so threads 
+    that first use the module at the same time all get the same, fully 
+    initialized module.  Unlike importlib.util.LazyLoader, nothing is 
+    put in sys.modules until the real import, so other importers never 
+    see a partially loaded module, and if the import fails the original 
+    ImportError is raised on every access.
+    '''
+    def __init__(self, name):
+        super().__init__(name)
+        self.__lock = Lock()
+        self.__module = None
+    def _resolve(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Module
+            Imported module (imported on the first call)
+        Preconditions:
+            N/A
+        '''
+        module = self.__module
+        if module is None:
+            with self.__lock:
+                if self.__module is None:
+                    self.__module = import_module(self.__name__)
+                module = self.__module
+        return module
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+    def __dir__(self):
+        return dir(self._resolve())
+    def __repr__(self):
+        return '<lazy module %s>'%repr(self.__name__)
+
+def lazy_import(name, optional=False):
+    '''
+    Args:
+        name: String        => fully qualified name of module to import
+        optional: Boolean   => whether to return None rather than raise if 
+                               the module is not installed
+    Returns:
+        Module
+        LazyModule for name, which is only imported when one of its attributes
+        is first accessed, so that heavy optional dependencies (i.e. numpy) do
+        not slow down importing this package.  Modules that are already 
+        imported are returned as is.  Standard library modules should be 
+        imported normally.
+    Preconditions:
+        name is of type String
+        optional is of type Boolean
+    '''
+    assert isinstance(name, str)
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    try:
+        spec = find_spec(name)
+    except ImportError:
+        spec = None
+    if spec is None:
+        if optional:
+            return None
+        raise ModuleNotFoundError('No module named %s'%repr(name), name=name)
+    return LazyModule(name)
@@ -0,0 +1,494 @@
+## -*- coding: UTF-8 -*-
+## parallel.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+from os import cpu_count, stat
+from mmap import mmap, ACCESS_READ
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from traceback import format_exc
+from construct.lib import Container
+
+from . import BaseParser, RecordStreamMixin
+from .cleaning import clean_value
+
+def format_failures(failures):
+    '''
+    Args:
+        failures: Dict<String, Exception>   => structures that failed to parse
+                                               (see BaseParser.failures)
+    Returns:
+        String
+        One line per failed structure with the name and the exception it 
+        raised, or None if no structure failed
+    Preconditions:
+        failures is of type Dict<String, Exception>
+    '''
+    if len(failures) == 0:
+        return None
+    return '\n'.join(
+        '%s: %s (%s)'%(structure, type(e).__name__, str(e)) \
+        for structure, e in failures.items()
+    )
+
+def parse_source(parser, source, args=None, kwargs=None):
+    '''
+    Args:
+        parser: Type<BaseParser>    => parser class to parse source with
+        source: Any                 => source to parse
+        args: Tuple<Any>            => positional arguments to parser constructor
+        kwargs: Dict<String, Any>   => keyword arguments to parser constructor
+    Returns:
+        Container<String, Any>
+        Picklable result of parsing source:
+            source: the source that was parsed
+            result: serialized results of the parser (see BaseParser.get_results)
+                    or None if parsing failed
+            err: None if parsing succeeded, otherwise the error message and traceback
+                 or the structures that failed to parse (see format_failures)
+    Preconditions:
+        parser is a subclass of BaseParser
+        args is None or of type Tuple
+        kwargs is None or of type Dict<String, Any>
+    '''
+    try:
+        instance = parser(
+            source, 
+            *(args if args is not None else tuple()), 
+            **(kwargs if kwargs is not None else dict())
+        ).parse()
+        return Container(
+            source=source, 
+            result=instance.get_results(serialize=True), 
+            err=format_failures(instance.failures)
+        )
+    except Exception as e:
+        return Container(source=source, result=None, err='%s (%s)\n%s'%(
+            type(e).__name__,
+            str(e),
+            format_exc()
+        ))
+
+def parse_range(parser, source, args=None, kwargs=None):
+    '''
+    Args:
+        parser: Type<RecordStreamMixin> => record parser class to parse source with
+        source: Tuple<Any, Integer, Integer>    => source to parse, offset of the first record
+                                                   in the range and offset to stop parsing records 
+                                                   at (None for the end of the source)
+        args: Tuple<Any>                => positional arguments to parser constructor
+        kwargs: Dict<String, Any>       => keyword arguments to parser constructor
+    Returns:
+        Container<String, Any>
+        Picklable result of parsing the range:
+            source: source, start and end of the range that was parsed
+            result: List of (offset, serialized record) for each record in the range,
+                    or None if parsing failed
+            err: None if parsing succeeded, otherwise the error message and traceback
+    Preconditions:
+        parser is a subclass of RecordStreamMixin
+        source is of type Tuple<Any, Integer, Integer>
+    '''
+    source, start, end = source
+    try:
+        kwargs = dict(kwargs) if kwargs is not None else dict()
+        kwargs.update(offset=start, end=end)
+        instance = parser(source, *(args if args is not None else tuple()), **kwargs)
+        result = list()
+        for offset, record in instance.records():
+            if isinstance(record, BaseParser):
+                result.append((offset, record.get_results(serialize=True)))
+            else:
+                result.append((offset, clean_value(record, serialize=True)))
+        return Container(source=(source, start, end), result=result, err=None)
+    except Exception as e:
+        return Container(source=(source, start, end), result=None, err='%s (%s)\n%s'%(
+            type(e).__name__,
+            str(e),
+            format_exc()
+        ))
+
+class ParserPool(object):
+    '''
+    Class for parsing many sources with the same parser class across
+    a pool of worker processes.  At most max_pending sources are in flight
+    at any time, so sources can be a (possibly unbounded) generator, and 
+    results are streamed back as they complete (or in submission order if
+    ordered is True).  Errors are captured per source (see parse_source)
+    rather than raised.  For example:
+    with ParserPool(PrefetchParser, workers=8) as pool:
+        for entry in pool.map(sources):
+            if entry.err is not None:
+                ...
+    '''
+    TASK = staticmethod(parse_source)
+
+    def __init__(self, parser, workers=None, max_pending=None, ordered=False, args=None, kwargs=None):
+        self.parser = parser
+        self.workers = workers if workers is not None else (cpu_count() or 1)
+        self.max_pending = max_pending if max_pending is not None else self.workers * 4
+        self.ordered = ordered
+        self.args = args
+        self.kwargs = kwargs
+        self.__executor = None
+        self.__depth = 0
+    @property
+    def parser(self):
+        '''
+        Getter for parser
+        '''
+        return self.__parser
+    @parser.setter
+    def parser(self, value):
+        '''
+        Setter for parser
+        '''
+        assert isinstance(value, type) and issubclass(value, BaseParser)
+        self.__parser = value
+    @property
+    def workers(self):
+        '''
+        Getter for workers
+        '''
+        return self.__workers
+    @workers.setter
+    def workers(self, value):
+        '''
+        Setter for workers
+        '''
+        assert isinstance(value, int) and value > 0
+        self.__workers = value
+    @property
+    def max_pending(self):
+        '''
+        Getter for max_pending
+        '''
+        return self.__max_pending
+    @max_pending.setter
+    def max_pending(self, value):
+        '''
+        Setter for max_pending
+        '''
+        assert isinstance(value, int) and value > 0
+        self.__max_pending = value
+    @property
+    def ordered(self):
+        '''
+        Getter for ordered
+        '''
+        return self.__ordered
+    @ordered.setter
+    def ordered(self, value):
+        '''
+        Setter for ordered
+        '''
+        assert isinstance(value, bool)
+        self.__ordered = value
+    @property
+    def args(self):
+        '''
+        Getter for args
+        '''
+        return self.__args
+    @args.setter
+    def args(self, value):
+        '''
+        Setter for args
+        '''
+        assert value is None or isinstance(value, tuple)
+        self.__args = value
+    @property
+    def kwargs(self):
+        '''
+        Getter for kwargs
+        '''
+        return self.__kwargs
+    @kwargs.setter
+    def kwargs(self, value):
+        '''
+        Setter for kwargs
+        '''
+        assert value is None or isinstance(value, dict)
+        self.__kwargs = value
+    def _create_executor(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Executor
+            New executor to submit parse tasks to
+        Preconditions:
+            N/A
+        '''
+        return ProcessPoolExecutor(max_workers=self.workers)
+    def _submit(self, source):
+        '''
+        Args:
+            source: Any => source to parse
+        Returns:
+            Future<Container<String, Any>>
+            Future resolving to the result of self.TASK (parse_source by default)
+        Preconditions:
+            N/A
+        '''
+        return self.__executor.submit(self.TASK, self.parser, source, self.args, self.kwargs)
+    def _resolve(self, source, future):
+        '''
+        Args:
+            source: Any                             => source that was parsed
+            future: Future<Container<String, Any>>  => completed future for source
+        Returns:
+            Container<String, Any>
+            Result of future, or captured error if the task itself failed
+            (i.e. the worker died or the result could not be pickled)
+        Preconditions:
+            future is done
+        '''
+        try:
+            return future.result()
+        except Exception as e:
+            Logger.error('Failed to parse source %s (%s)'%(repr(source), str(e)))
+            return Container(source=source, result=None, err='%s (%s)'%(type(e).__name__, str(e)))
+    def map(self, sources):
+        '''
+        Args:
+            sources: Iterable<Any>  => sources to parse
+        Returns:
+            Generator<Container<String, Any>>
+            Result of parsing each source (see parse_source), in completion
+            order or submission order if self.ordered is True
+        Preconditions:
+            sources is iterable
+        '''
+        with self:
+            sources = iter(sources)
+            pending = deque() if self.ordered else dict()
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < self.max_pending:
+                    try:
+                        source = next(sources)
+                    except StopIteration:
+                        exhausted = True
+                    else:
+                        future = self._submit(source)
+                        if self.ordered:
+                            pending.append((source, future))
+                        else:
+                            pending[future] = source
+                if len(pending) == 0:
+                    break
+                if self.ordered:
+                    source, future = pending.popleft()
+                    yield self._resolve(source, future)
+                else:
+                    done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield self._resolve(pending.pop(future), future)
+    def __enter__(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Create the worker pool if it does not already exist
+        Preconditions:
+            N/A
+        '''
+        if self.__executor is None:
+            self.__executor = self._create_executor()
+        self.__depth += 1
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Shut down the worker pool when exiting the outermost context
+        Preconditions:
+            N/A
+        '''
+        self.__depth -= 1
+        if self.__executor is not None and self.__depth == 0:
+            self.__executor.shutdown(wait=exc_type is None, cancel_futures=exc_type is not None)
+            self.__executor = None
+
+
+class ChunkedParserPool(ParserPool):
+    '''
+    Class for parsing a single large file of records (i.e. $MFT, $UsnJrnl)
+    across a pool of worker processes.  The file is split into byte ranges
+    of at most chunk_size bytes that start on record boundaries, either 
+    caller-supplied or computed from the record size (or stride) of the 
+    parser, or discovered by scanning for a record signature.  Each range 
+    is parsed by a worker that opens its own stream (or mapping if 
+    memory_map=True is passed in kwargs), and the records of each range 
+    are yielded in offset order as soon as it completes.  Since at most 
+    max_pending ranges are in flight, at most about max_pending * chunk_size 
+    bytes of records are held in memory at a time.  For example:
+    with ChunkedParserPool(MFTParser, kwargs=dict(memory_map=True)) as pool:
+        for offset, entry in pool.records(filepath, signature=b'FILE', alignment=1024):
+            ...
+    Ranges that fail to parse are logged and collected in self.errors.
+    '''
+    TASK = staticmethod(parse_range)
+    CHUNK_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, parser, workers=None, max_pending=None, chunk_size=None, args=None, kwargs=None):
+        super().__init__(parser, workers, max_pending, True, args, kwargs)
+        self.chunk_size = chunk_size if chunk_size is not None else self.CHUNK_SIZE
+        self.errors = list()
+    @ParserPool.parser.setter
+    def parser(self, value):
+        '''
+        Setter for parser
+        '''
+        assert isinstance(value, type) and \
+            issubclass(value, BaseParser) and \
+            issubclass(value, RecordStreamMixin)
+        ParserPool.parser.fset(self, value)
+    @property
+    def chunk_size(self):
+        '''
+        Getter for chunk_size
+        '''
+        return self.__chunk_size
+    @chunk_size.setter
+    def chunk_size(self, value):
+        '''
+        Setter for chunk_size
+        '''
+        assert isinstance(value, int) and value > 0
+        self.__chunk_size = value
+    @staticmethod
+    def _scan(mapping, signature, position, alignment, base):
+        '''
+        Args:
+            mapping: mmap       => mapping of the source
+            signature: Bytes    => record signature to search for
+            position: Integer   => offset to start searching from
+            alignment: Integer  => required alignment of records relative to base
+            base: Integer       => offset of the first record
+        Returns:
+            Integer
+            Offset of the first aligned occurrence of signature at or after position, 
+            or None if there is none
+        Preconditions:
+            alignment > 0
+        '''
+        remainder = (position - base) % alignment
+        if remainder != 0:
+            position += alignment - remainder
+        while True:
+            position = mapping.find(signature, position)
+            if position == -1:
+                return None
+            remainder = (position - base) % alignment
+            if remainder == 0:
+                return position
+            position += alignment - remainder
+    def ranges(self, source, boundaries=None, signature=None, alignment=1):
+        '''
+        Args:
+            source: String          => path of file to split
+            boundaries: List<Integer>   => offsets of record boundaries to split at
+            signature: Bytes            => record signature to scan for
+            alignment: Integer          => alignment of records relative to the first
+                                           record when scanning for signature
+        Returns:
+            List<Tuple<Integer, Integer>>
+            (start, end) ranges covering source from the configured offset 
+            (end is None for the last range), split at boundaries if given, 
+            otherwise about every self.chunk_size bytes (less for small files,
+            so every worker gets a range) at the next multiple of the stride 
+            or record size of the parser, or at the next occurrence of signature
+        Preconditions:
+            source is of type String
+            boundaries is None or of type List<Integer>
+            signature is None or of type Bytes
+            alignment is of type Integer and > 0
+        '''
+        assert boundaries is None or isinstance(boundaries, (list, tuple))
+        assert signature is None or isinstance(signature, bytes)
+        assert isinstance(alignment, int) and alignment > 0
+        kwargs = self.kwargs if self.kwargs is not None else dict()
+        start = kwargs.get('offset', 0)
+        size = stat(source).st_size
+        if boundaries is None:
+            step = kwargs.get('stride', kwargs.get('record_size', self.parser.RECORD_SIZE))
+            if not isinstance(step, int) and signature is None:
+                raise ValueError('cannot split records of variable size without boundaries or signature')
+            chunk_size = max(min(self.chunk_size, -(-(size - start) // self.workers)), 1)
+            candidates = range(start + chunk_size, size, chunk_size)
+            if isinstance(step, int):
+                boundaries = [start + -(-(candidate - start) // step) * step for candidate in candidates]
+            elif size > 0:
+                boundaries = list()
+                with open(source, 'rb') as fhandle, mmap(fhandle.fileno(), 0, access=ACCESS_READ) as mapping:
+                    for candidate in candidates:
+                        boundary = self._scan(mapping, signature, candidate, alignment, start)
+                        if boundary is None:
+                            break
+                        boundaries.append(boundary)
+            else:
+                boundaries = list()
+        boundaries = sorted(set(
+            boundary for boundary in boundaries if start < boundary < size
+        ))
+        starts = [start] + boundaries
+        return list(zip(starts, boundaries + [None]))
+    def batches(self, source, boundaries=None, signature=None, alignment=1):
+        '''
+        Args:
+            source: String  => path of file to parse
+            See ChunkedParserPool.ranges
+        Returns:
+            Generator<List<Tuple<Integer, Any>>>
+            Offset and serialized value (see parse_range) of each record in 
+            each range of source that parsed, in offset order.  Each batch is 
+            yielded as soon as its range (and every range before it) completes.
+        Preconditions:
+            See ChunkedParserPool.ranges
+        '''
+        self.errors = list()
+        ranges = self.ranges(source, boundaries, signature, alignment)
+        for entry in self.map((source, start, end) for start, end in ranges):
+            if entry.err is not None:
+                Logger.error('Failed to parse range %s of %s (%s)'%(repr(entry.source[1:]), source, entry.err))
+                self.errors.append(entry)
+                continue
+            yield entry.result
+    def records(self, source, boundaries=None, signature=None, alignment=1):
+        '''
+        Args:
+            source: String  => path of file to parse
+            See ChunkedParserPool.ranges
+        Returns:
+            Generator<Tuple<Integer, Any>>
+            Offset and serialized value (see parse_range) of each record in source,
+            in offset order (see ChunkedParserPool.batches)
+        Preconditions:
+            See ChunkedParserPool.ranges
+        '''
+        for batch in self.batches(source, boundaries, signature, alignment):
+            yield from batch
@@ -0,0 +1,119 @@
+## -*- coding: UTF-8 -*-
+## pooling.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+from collections import deque
+from contextlib import contextmanager
+
+from . import BaseParser
+
+class ParserInstancePool(object):
+    '''
+    Small pool of reusable parser instances for tight loops over many
+    sources (i.e. records of one artifact).  Instances are reset (see
+    BaseParser.reset) when acquired, so no parsed state is carried between
+    sources, and at most size idle instances are kept.  For example:
+    pool = ParserInstancePool(MFTEntry)
+    for record in records:
+        with pool.lease(record) as entry:
+            entry.parse()
+            ...
+    NOTE: instances must not be used after they are released.
+    '''
+    def __init__(self, parser, size=8, args=None, kwargs=None):
+        assert isinstance(parser, type) and issubclass(parser, BaseParser)
+        assert isinstance(size, int) and size > 0
+        assert args is None or isinstance(args, tuple)
+        assert kwargs is None or isinstance(kwargs, dict)
+        self.parser = parser
+        self.size = size
+        self.args = args if args is not None else tuple()
+        self.kwargs = kwargs if kwargs is not None else dict()
+        self.__idle = deque()
+        self.created = 0
+        self.reused = 0
+    def acquire(self, source, **kwargs):
+        '''
+        Args:
+            source: Any                 => source to parse
+            kwargs: Dict<String, Any>   => keyword arguments to BaseParser.reset
+        Returns:
+            BaseParser
+            Idle instance reset to source, or a new instance if none are idle
+        Preconditions:
+            source is valid for self.parser
+        '''
+        try:
+            instance = self.__idle.pop()
+        except IndexError:
+            self.created += 1
+            return self.parser(source, *self.args, **dict(self.kwargs, **kwargs))
+        self.reused += 1
+        instance.reset(source, **kwargs)
+        return instance
+    def release(self, instance):
+        '''
+        Args:
+            instance: BaseParser    => instance previously returned by acquire
+        Procedure:
+            Close the stream of instance, clear its parsed state and return it 
+            to the pool, or discard it if the pool is full or its state could
+            not be cleared
+        Preconditions:
+            instance is of type self.parser
+        '''
+        assert type(instance) is self.parser
+        if len(self.__idle) >= self.size:
+            return
+        try:
+            instance.__exit__(None, None, None)
+            instance._clear_properties()
+        except Exception as e:
+            Logger.error('Failed to release %s to pool (%s)'%(type(instance).__name__, str(e)))
+            return
+        ## NOTE: checked explicitly (not with assert) so it also holds under python -O
+        if not instance._is_clean():
+            Logger.error('Discarding pooled %s with leaked state'%type(instance).__name__)
+            return
+        self.__idle.append(instance)
+    @contextmanager
+    def lease(self, source, **kwargs):
+        '''
+        Args:
+            source: Any                 => source to parse
+            kwargs: Dict<String, Any>   => keyword arguments to BaseParser.reset
+        Returns:
+            ContextManager<BaseParser>
+            Context manager that acquires an instance for source and 
+            releases it on exit
+        Preconditions:
+            source is valid for self.parser
+        '''
+        instance = self.acquire(source, **kwargs)
+        try:
+            yield instance
+        finally:
+            self.release(instance)
+    def __len__(self):
+        return len(self.__idle)
@@ -0,0 +1,390 @@
+## -*- coding: UTF-8 -*-
+## profiling.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+import json
+from collections import OrderedDict
+from threading import Lock, local
+from time import perf_counter
+
+class StructureStats(object):
+    '''
+    Aggregated measurements of parsing one structure of one parser class
+    '''
+    __slots__ = (
+        'calls', 
+        'failures', 
+        'total_time', 
+        'max_time', 
+        'dependency_time', 
+        'parse_time', 
+        'clean_time', 
+        'bytes_read', 
+        'self_time', 
+        'self_dependency_time', 
+        'self_parse_time', 
+        'self_bytes_read'
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.dependency_time = 0.0
+        self.parse_time = 0.0
+        self.clean_time = 0.0
+        self.bytes_read = 0
+        self.self_time = 0.0
+        self.self_dependency_time = 0.0
+        self.self_parse_time = 0.0
+        self.self_bytes_read = 0
+    def add(self, other, exclusive=False):
+        '''
+        Args:
+            other: StructureStats   => stats to add to these stats
+            exclusive: Boolean      => whether to add only the exclusive (self)
+                                       measurements of other
+        Procedure:
+            Add the measurements of other to these stats.  If exclusive is True,
+            time and bytes spent in nested parse_structure calls are left out
+            of total_time, dependency_time, parse_time and bytes_read, so 
+            stats of several structures can be summed without double-counting
+        Preconditions:
+            other is of type StructureStats
+            exclusive is of type Boolean
+        '''
+        self.calls += other.calls
+        self.failures += other.failures
+        self.max_time = max(self.max_time, other.max_time)
+        self.clean_time += other.clean_time
+        self.self_time += other.self_time
+        self.self_dependency_time += other.self_dependency_time
+        self.self_parse_time += other.self_parse_time
+        self.self_bytes_read += other.self_bytes_read
+        if exclusive:
+            self.total_time += other.self_time
+            self.dependency_time += other.self_dependency_time
+            self.parse_time += other.self_parse_time
+            self.bytes_read += other.self_bytes_read
+        else:
+            self.total_time += other.total_time
+            self.dependency_time += other.dependency_time
+            self.parse_time += other.parse_time
+            self.bytes_read += other.bytes_read
+    def to_dict(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Dict<String, Any>
+            Measurements as a dictionary, including the mean time per call
+        Preconditions:
+            N/A
+        '''
+        result = {key: getattr(self, key) for key in self.__slots__}
+        result['mean_time'] = self.total_time / self.calls if self.calls > 0 else 0.0
+        return result
+
+class ParserProfiler(object):
+    '''
+    Instrumentation for BaseParser.parse_structure.  Records per-structure
+    and per-parser-class call counts, failures, wall time (split into
+    dependency resolution, the _parse_<structure> method and _clean_value),
+    and bytes consumed from the stream.  Measurements are aggregated across 
+    all parser instances that use the profiler.  NOTE: per-structure time 
+    and bytes are inclusive of any structures parsed as a result (i.e. 
+    dependencies), which are also recorded under their own names.  The 
+    self_* measurements exclude them, and per-class totals are built from
+    the exclusive measurements only.  To enable profiling
+    for a parser class (and its subclasses), set its PROFILER attribute:
+    profiler = ParserProfiler()
+    BaseParser.PROFILER = profiler
+    ...
+    print(profiler.to_json())
+    When PROFILER is None or the profiler is disabled, parse_structure
+    only pays for a single attribute check.
+    '''
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.__lock = Lock()
+        self.__stats = OrderedDict()
+        self.__start_hooks = list()
+        self.__end_hooks = list()
+        self.__local = local()
+    @property
+    def enabled(self):
+        '''
+        Getter for enabled
+        '''
+        return self.__enabled
+    @enabled.setter
+    def enabled(self, value):
+        '''
+        Setter for enabled
+        '''
+        assert isinstance(value, bool)
+        self.__enabled = value
+    def add_hooks(self, start=None, end=None):
+        '''
+        Args:
+            start: Function<BaseParser, String> -> Any              => callback invoked before
+                                                                       parsing a structure
+            end: Function<BaseParser, String, Dict<String, Any>> -> Any => callback invoked after
+                                                                       parsing a structure with
+                                                                       its measurements
+        Procedure:
+            Register start and/or end callbacks (i.e. to feed a metrics collector).
+            The measurements passed to end contain time, dependency_time, parse_time, 
+            clean_time, bytes_read, their exclusive counterparts self_time, 
+            self_dependency_time, self_parse_time and self_bytes_read, and err (the 
+            exception raised, or None).  Exceptions raised by callbacks are logged 
+            and ignored.
+        Preconditions:
+            start is None or callable
+            end is None or callable
+        '''
+        assert start is None or callable(start)
+        assert end is None or callable(end)
+        if start is not None:
+            self.__start_hooks.append(start)
+        if end is not None:
+            self.__end_hooks.append(end)
+    def remove_hooks(self, start=None, end=None):
+        '''
+        Args:
+            start: Function<BaseParser, String> -> Any                  => start callback to remove
+            end: Function<BaseParser, String, Dict<String, Any>> -> Any => end callback to remove
+        Procedure:
+            Unregister previously registered callbacks
+        Preconditions:
+            N/A
+        '''
+        if start is not None and start in self.__start_hooks:
+            self.__start_hooks.remove(start)
+        if end is not None and end in self.__end_hooks:
+            self.__end_hooks.remove(end)
+    @staticmethod
+    def _tell(stream):
+        '''
+        Args:
+            stream: Any => stream to get position of
+        Returns:
+            Integer
+            Current position of stream, or None if it cannot be determined
+        Preconditions:
+            N/A
+        '''
+        if stream is None:
+            return None
+        try:
+            return stream.tell()
+        except Exception:
+            return None
+    def _call_hooks(self, hooks, *args):
+        '''
+        Args:
+            hooks: List<Function>   => callbacks to invoke
+            args: Tuple<Any>        => arguments to callbacks
+        Procedure:
+            Invoke each callback with args, logging and ignoring any exception
+        Preconditions:
+            N/A
+        '''
+        for hook in hooks:
+            try:
+                hook(*args)
+            except Exception as e:
+                Logger.error('Profiler hook %s failed (%s)'%(repr(hook), str(e)))
+    def _frames(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            List<Dict<String, Any>>
+            Stack of structures currently being profiled by this thread, 
+            innermost last
+        Preconditions:
+            N/A
+        '''
+        frames = getattr(self.__local, 'frames', None)
+        if frames is None:
+            frames = self.__local.frames = list()
+        return frames
+    def profile(self, parser, structure, method, args, kwargs):
+        '''
+        Args:
+            parser: BaseParser          => parser instance
+            structure: String           => structure being parsed
+            method: String              => name of the _parse_<structure> method
+            args: Tuple<Any>            => positional arguments to method
+            kwargs: Dict<String, Any>   => keyword arguments to method
+        Returns:
+            Any
+            Cleaned result of parsing structure (see BaseParser.parse_structure),
+            recording measurements of each phase
+        Preconditions:
+            parser is of type BaseParser
+            structure is of type String
+            method is of type String
+        '''
+        if len(self.__start_hooks) > 0:
+            self._call_hooks(self.__start_hooks, parser, structure)
+        ## NOTE: nested parse_structure calls (i.e. dependencies) add their time 
+        ## (and stream movement) to the phase of the enclosing frame, so the 
+        ## exclusive measurements can be derived once this call finishes
+        frames = self._frames()
+        frame = dict(phase='dependency', dependency=0.0, parse=0.0, clean=0.0, bytes=0)
+        frames.append(frame)
+        err = None
+        dependency_end = parse_start_position = parse_end = None
+        parse_end_position = None
+        start_position = self._tell(parser.stream)
+        start = perf_counter()
+        try:
+            parser._parse_dependencies(structure, args, kwargs)
+            dependency_end = perf_counter()
+            frame['phase'] = 'parse'
+            parse_start_position = self._tell(parser.stream)
+            value = getattr(parser, method)(*args, **kwargs)
+            parse_end_position = self._tell(parser.stream)
+            parse_end = perf_counter()
+            frame['phase'] = 'clean'
+            return parser._clean_value(value)
+        except Exception as e:
+            err = e
+            raise
+        finally:
+            end = perf_counter()
+            frames.pop()
+            if dependency_end is None:
+                dependency_end = end
+            if parse_end is None:
+                parse_end = end
+            bytes_read = (
+                parse_end_position - parse_start_position \
+                if parse_start_position is not None and parse_end_position is not None \
+                else 0
+            )
+            measurements = dict(
+                time=end - start,
+                dependency_time=dependency_end - start,
+                parse_time=parse_end - dependency_end,
+                clean_time=end - parse_end,
+                bytes_read=bytes_read,
+                self_time=end - start - frame['dependency'] - frame['parse'] - frame['clean'],
+                self_dependency_time=dependency_end - start - frame['dependency'],
+                self_parse_time=parse_end - dependency_end - frame['parse'],
+                self_bytes_read=bytes_read - frame['bytes'],
+                err=err
+            )
+            if len(frames) > 0:
+                parent = frames[-1]
+                parent[parent['phase']] += end - start
+                if parent['phase'] == 'parse':
+                    end_position = self._tell(parser.stream)
+                    if start_position is not None and end_position is not None:
+                        parent['bytes'] += end_position - start_position
+            self.record(type(parser).__name__, structure, measurements)
+            if len(self.__end_hooks) > 0:
+                self._call_hooks(self.__end_hooks, parser, structure, measurements)
+    def record(self, parser, structure, measurements):
+        '''
+        Args:
+            parser: String                      => name of parser class
+            structure: String                   => structure that was parsed
+            measurements: Dict<String, Any>     => measurements of one call (see ParserProfiler.profile)
+        Procedure:
+            Add measurements to the aggregated stats of structure
+        Preconditions:
+            parser is of type String
+            structure is of type String
+        '''
+        key = (parser, structure)
+        with self.__lock:
+            stats = self.__stats.get(key)
+            if stats is None:
+                stats = self.__stats[key] = StructureStats()
+            stats.calls += 1
+            if measurements.get('err') is not None:
+                stats.failures += 1
+            stats.total_time += measurements.get('time')
+            stats.max_time = max(stats.max_time, measurements.get('time'))
+            stats.dependency_time += measurements.get('dependency_time')
+            stats.parse_time += measurements.get('parse_time')
+            stats.clean_time += measurements.get('clean_time')
+            stats.bytes_read += measurements.get('bytes_read')
+            stats.self_time += measurements.get('self_time', measurements.get('time'))
+            stats.self_dependency_time += measurements.get(
+                'self_dependency_time', 
+                measurements.get('dependency_time')
+            )
+            stats.self_parse_time += measurements.get('self_parse_time', measurements.get('parse_time'))
+            stats.self_bytes_read += measurements.get('self_bytes_read', measurements.get('bytes_read'))
+    def reset(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Discard all recorded measurements
+        Preconditions:
+            N/A
+        '''
+        with self.__lock:
+            self.__stats.clear()
+    def to_dict(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Dict<String, Dict<String, Any>>
+            Measurements keyed by parser class name, each containing:
+                structures: measurements keyed by structure name (see StructureStats.to_dict)
+                totals: exclusive measurements summed over all structures of the parser
+                        class, so time spent parsing dependencies is counted once
+        Preconditions:
+            N/A
+        '''
+        with self.__lock:
+            items = list(self.__stats.items())
+        result = OrderedDict()
+        totals = dict()
+        for (parser, structure), stats in items:
+            entry = result.setdefault(parser, OrderedDict(structures=OrderedDict()))
+            entry['structures'][structure] = stats.to_dict()
+            totals.setdefault(parser, StructureStats()).add(stats, exclusive=True)
+        for parser, entry in result.items():
+            entry['totals'] = totals[parser].to_dict()
+        return result
+    def to_json(self, **kwargs):
+        '''
+        Args:
+            kwargs: Dict<String, Any>   => keyword arguments to json.dumps
+        Returns:
+            String
+            JSON representation of ParserProfiler.to_dict
+        Preconditions:
+            N/A
+        '''
+        return json.dumps(self.to_dict(), **kwargs)
@@ -0,0 +1,311 @@
+## -*- coding: UTF-8 -*-
+## serialization.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+import csv
+from collections.abc import Mapping, Sequence
+from datetime import datetime
+from json.encoder import encode_basestring_ascii
+from construct.lib import Container
+
+from .cleaning import \
+    filter_keys, \
+    format_datetime, \
+    CompactRecord, \
+    KEY_CACHE_SIZE, \
+    _VIEWS
+
+_ENCODED_KEYS = dict()
+_CONSTANTS = {True: 'true', False: 'false', None: 'null'}
+_FLOAT_CONSTANTS = {float('nan'): 'NaN', float('inf'): 'Infinity', float('-inf'): '-Infinity'}
+## NOTE: sequences that are encoded as scalars rather than arrays
+_SCALAR_SEQUENCES = (str, bytes, bytearray, memoryview)
+
+def _encode_key(key):
+    '''
+    Args:
+        key: String => key of a Container
+    Returns:
+        String
+        key encoded as a JSON object key (including the separator),
+        cached since the same keys appear in every record
+    Preconditions:
+        key is of type String
+    '''
+    encoded = _ENCODED_KEYS.get(key)
+    if encoded is None:
+        encoded = encode_basestring_ascii(str(key)) + ':'
+        if len(_ENCODED_KEYS) < KEY_CACHE_SIZE:
+            _ENCODED_KEYS[key] = encoded
+    return encoded
+
+def encode_scalar(value):
+    '''
+    Args:
+        value: Any  => non-container value to encode
+    Returns:
+        String
+        value encoded as JSON, where timestamps are formatted like serialized
+        values (see cleaning.format_datetime), binary values are hex-encoded 
+        and other unknown types are converted with str
+    Preconditions:
+        value is not a Mapping, non-string Sequence, CompactRecord or view
+        (see iter_json)
+    '''
+    if value is None or value is True or value is False:
+        return _CONSTANTS[value]
+    elif isinstance(value, str):
+        return encode_basestring_ascii(value)
+    elif isinstance(value, int):
+        return int.__repr__(value)
+    elif isinstance(value, float):
+        if value != value or value in _FLOAT_CONSTANTS:
+            return _FLOAT_CONSTANTS.get(value, 'NaN')
+        return float.__repr__(value)
+    elif isinstance(value, datetime):
+        return '"%s"'%format_datetime(value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        return '"%s"'%value.hex()
+    return encode_basestring_ascii(str(value))
+
+def _unwrap(value):
+    '''
+    Args:
+        value: Any  => value to unwrap
+    Returns:
+        Any
+        Underlying value of filtered views, otherwise value
+    Preconditions:
+        N/A
+    '''
+    return value._value if isinstance(value, _VIEWS) else value
+
+def _iter_members(value, keys):
+    '''
+    Args:
+        value: Mapping<String, Any>     => object being encoded
+        keys: Tuple<String>             => filtered keys of value
+    Returns:
+        Generator<Tuple<String, Any>>
+        Encoded key (with separator) and value of each member of value
+    Preconditions:
+        N/A
+    '''
+    separator = ''
+    for key in keys:
+        yield separator + _encode_key(key), value[key]
+        separator = ','
+
+def _iter_items(value):
+    '''
+    Args:
+        value: Sequence<Any>    => array being encoded
+    Returns:
+        Generator<Tuple<String, Any>>
+        Separator and value of each item of value
+    Preconditions:
+        N/A
+    '''
+    separator = ''
+    for item in value:
+        yield separator, item
+        separator = ','
+
+def iter_json(value):
+    '''
+    Args:
+        value: Any  => value to encode
+    Returns:
+        Generator<String>
+        Pieces of the JSON encoding of value, with keys beginning with an 
+        excluded prefix skipped at every level (see cleaning.filter_keys).  
+        Other mappings are encoded as objects with all of their keys, and 
+        other non-string sequences as arrays.  Values are encoded directly 
+        from the parsed structures without building a cleaned copy, and 
+        nested values are traversed iteratively.
+    Preconditions:
+        N/A
+    '''
+    stack = [(iter((('', value),)), '')]
+    while len(stack) > 0:
+        items, closing = stack[-1]
+        for prefix, child in items:
+            child = _unwrap(child)
+            if isinstance(child, (Container, CompactRecord)):
+                keys = filter_keys(tuple(child.keys()))
+                yield prefix + '{'
+                stack.append((_iter_members(child, keys), '}'))
+                break
+            elif isinstance(child, Mapping):
+                yield prefix + '{'
+                stack.append((_iter_members(child, tuple(child.keys())), '}'))
+                break
+            elif isinstance(child, (list, tuple)) or \
+                (isinstance(child, Sequence) and not isinstance(child, _SCALAR_SEQUENCES)):
+                yield prefix + '['
+                stack.append((_iter_items(child), ']'))
+                break
+            else:
+                yield prefix + encode_scalar(child)
+        else:
+            stack.pop()
+            yield closing
+
+def _iter_leaves(name, value):
+    '''
+    Args:
+        name: String                    => dotted name of value
+        value: Container<String, Any>   => object being flattened
+    Returns:
+        Generator<Tuple<String, Any>>
+        Dotted name and value of each member of value
+    Preconditions:
+        N/A
+    '''
+    for key in filter_keys(tuple(value.keys())):
+        yield (name + '.' + key if name else key), value[key]
+
+def iter_fields(value):
+    '''
+    Args:
+        value: Any  => value to flatten
+    Returns:
+        Generator<Tuple<String, Any>>
+        Dotted name and value of each leaf of value, skipping keys beginning 
+        with an excluded prefix (see cleaning.filter_keys).  Lists are not
+        flattened (see ResultWriter).
+    Preconditions:
+        N/A
+    '''
+    stack = [iter((('', value),))]
+    while len(stack) > 0:
+        for name, child in stack[-1]:
+            child = _unwrap(child)
+            if isinstance(child, (Container, CompactRecord)):
+                stack.append(_iter_leaves(name, child))
+                break
+            yield name, child
+        else:
+            stack.pop()
+
+class ResultWriter(object):
+    '''
+    Class for streaming parse results to a text file-like object as 
+    newline-delimited JSON (one object per line) or CSV (one row per
+    value, with nested structures flattened to dotted column names).
+    Values are encoded straight from the parsed structures (see iter_json
+    and iter_fields), and output is flushed every buffer_size characters,
+    so memory use is bounded regardless of the number of results.  For CSV,
+    the columns are fields or, if None, those of the first value written;
+    lists are written as JSON and columns not in fields are dropped.
+    '''
+    FORMATS = ('ndjson', 'csv')
+
+    def __init__(self, fhandle, format='ndjson', fields=None, buffer_size=64 * 1024):
+        assert hasattr(fhandle, 'write')
+        assert format in self.FORMATS
+        assert fields is None or isinstance(fields, (list, tuple))
+        assert isinstance(buffer_size, int) and buffer_size > 0
+        self.fhandle = fhandle
+        self.format = format
+        self.fields = tuple(fields) if fields is not None else None
+        self.buffer_size = buffer_size
+        self.count = 0
+        self.__buffer = list()
+        self.__buffered = 0
+        self.__csv = None
+    def _write(self, piece):
+        '''
+        Args:
+            piece: String   => encoded output
+        Procedure:
+            Buffer piece, flushing the buffer to self.fhandle once it
+            reaches self.buffer_size characters
+        Preconditions:
+            piece is of type String
+        '''
+        self.__buffer.append(piece)
+        self.__buffered += len(piece)
+        if self.__buffered >= self.buffer_size:
+            self.flush()
+    def _encode_cell(self, value):
+        '''
+        Args:
+            value: Any  => leaf value (see iter_fields)
+        Returns:
+            Any
+            value converted for a CSV cell
+        Preconditions:
+            N/A
+        '''
+        if value is None:
+            return ''
+        elif isinstance(value, (str, int, float)):
+            return value
+        elif isinstance(value, datetime):
+            return format_datetime(value)
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            return value.hex()
+        elif isinstance(value, (Mapping, Sequence)):
+            return ''.join(iter_json(value))
+        return str(value)
+    def write(self, value):
+        '''
+        Args:
+            value: Any  => result to write (i.e. a Container of parsed structures)
+        Procedure:
+            Encode value as one line of NDJSON or one CSV row
+        Preconditions:
+            N/A
+        '''
+        if self.format == 'ndjson':
+            for piece in iter_json(value):
+                self._write(piece)
+            self._write('\n')
+        else:
+            row = dict(iter_fields(value))
+            if self.__csv is None:
+                if self.fields is None:
+                    self.fields = tuple(row)
+                self.__csv = csv.writer(self.fhandle)
+                self.__csv.writerow(self.fields)
+            self.__csv.writerow([self._encode_cell(row.get(field)) for field in self.fields])
+        self.count += 1
+    def flush(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Write buffered output to self.fhandle
+        Preconditions:
+            N/A
+        '''
+        if len(self.__buffer) > 0:
+            self.fhandle.write(''.join(self.__buffer))
+            self.__buffer = list()
+            self.__buffered = 0
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
@@ -0,0 +1,485 @@
+## -*- coding: UTF-8 -*-
+## streams.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+Logger = logging.getLogger(__name__)
+import os
+import mmap
+from io import BufferedIOBase, SEEK_SET, SEEK_CUR, SEEK_END
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+def is_buffer(value):
+    '''
+    Args:
+        value: Any  => value to check
+    Returns:
+        Boolean
+        Whether value supports the buffer protocol
+    Preconditions:
+        N/A
+    '''
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return True
+    try:
+        memoryview(value).release()
+    except TypeError:
+        return False
+    return True
+
+class BufferStream(BufferedIOBase):
+    '''
+    Read-only binary stream over a window of any object supporting the
+    buffer protocol (bytes, bytearray, memoryview, mmap, ...).  Reads are
+    served directly from the buffer without copying it into the stream
+    first, and getbuffer/view expose zero-copy memoryview objects over 
+    the window so structures can be parsed at arbitrary offsets without 
+    seeking.  Positions are relative to the start of the window.
+    '''
+    def __init__(self, buffer, offset=0, length=None):
+        super().__init__()
+        self._open(buffer, offset, length)
+    def _open(self, buffer, offset=0, length=None):
+        '''
+        Args:
+            buffer: Any     => object supporting the buffer protocol
+            offset: Integer => offset of the window into buffer
+            length: Integer => length of the window (defaults to remainder of buffer)
+        Procedure:
+            Set the window of the stream and reset the position
+        Preconditions:
+            buffer supports the buffer protocol
+            offset is of type Integer (>= 0)
+            length is None or of type Integer (>= 0)
+        '''
+        assert isinstance(offset, int) and offset >= 0
+        assert length is None or (isinstance(length, int) and length >= 0)
+        view = memoryview(buffer)
+        if view.ndim != 1 or view.itemsize != 1:
+            view = view.cast('B')
+        if offset != 0 or length is not None:
+            view = view[offset:] if length is None else view[offset:offset + length]
+        self._view = view.toreadonly()
+        self._position = 0
+    def __len__(self):
+        return len(self._view)
+    def readable(self):
+        '''
+        @BufferedIOBase.readable
+        '''
+        return True
+    def seekable(self):
+        '''
+        @BufferedIOBase.seekable
+        '''
+        return True
+    def getbuffer(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            memoryview
+            Read-only view over the entire window (mirrors BytesIO.getbuffer)
+        Preconditions:
+            N/A
+        '''
+        self._checkClosed()
+        return self._view
+    def view(self, offset=None, length=None):
+        '''
+        Args:
+            offset: Integer => offset into the window (defaults to current position)
+            length: Integer => number of bytes in the view (defaults to remainder of window)
+        Returns:
+            memoryview
+            Read-only zero-copy view over the requested region of the window
+        Preconditions:
+            offset is None or of type Integer (>= 0)
+            length is None or of type Integer (>= 0)
+        '''
+        assert offset is None or (isinstance(offset, int) and offset >= 0)
+        assert length is None or (isinstance(length, int) and length >= 0)
+        self._checkClosed()
+        if offset is None:
+            offset = self._position
+        if length is None:
+            return self._view[offset:]
+        return self._view[offset:offset + length]
+    def read(self, size=-1):
+        '''
+        @BufferedIOBase.read
+        '''
+        self._checkClosed()
+        start = self._position
+        end = len(self._view) if size is None or size < 0 else min(start + size, len(self._view))
+        if end <= start:
+            return b''
+        self._position = end
+        return self._view[start:end].tobytes()
+    def read1(self, size=-1):
+        '''
+        @BufferedIOBase.read1
+        '''
+        return self.read(size)
+    def readinto(self, buffer):
+        '''
+        @BufferedIOBase.readinto
+        '''
+        self._checkClosed()
+        with memoryview(buffer) as target:
+            target = target.cast('B')
+            start = self._position
+            end = min(start + len(target), len(self._view))
+            if end <= start:
+                return 0
+            target[:end - start] = self._view[start:end]
+            self._position = end
+            return end - start
+    def seek(self, offset, whence=SEEK_SET):
+        '''
+        @BufferedIOBase.seek
+        '''
+        self._checkClosed()
+        if whence == SEEK_SET:
+            position = offset
+        elif whence == SEEK_CUR:
+            position = self._position + offset
+        elif whence == SEEK_END:
+            position = len(self._view) + offset
+        else:
+            raise ValueError('invalid whence (%s, should be 0, 1 or 2)'%repr(whence))
+        if position < 0:
+            raise ValueError('negative seek position %d'%position)
+        self._position = position
+        return position
+    def tell(self):
+        '''
+        @BufferedIOBase.tell
+        '''
+        self._checkClosed()
+        return self._position
+    def close(self):
+        '''
+        @BufferedIOBase.close
+        '''
+        if not self.closed:
+            try:
+                self._view.release()
+            except BufferError as e:
+                Logger.error('Failed to release buffer of %s (%s)'%(repr(self), str(e)))
+            finally:
+                super().close()
+    def __repr__(self):
+        return '%s(<%d bytes>)'%(type(self).__name__, len(self._view))
+
+class MemoryMappedStream(BufferStream):
+    '''
+    Read-only binary stream backed by a memory mapping of a file.  Reads
+    are served directly from the mapping (no read syscalls or buffered
+    copies), and getbuffer/view expose zero-copy memoryview objects over
+    the mapping (see BufferStream).  NOTE: any memoryview obtained from 
+    this stream must be released before the stream is closed.
+    '''
+    def __init__(self, filepath):
+        assert isinstance(filepath, str)
+        self.__name = filepath
+        with open(filepath, 'rb') as fhandle:
+            try:
+                self.__mapping = mmap.mmap(fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                ## NOTE: empty files cannot be mapped
+                self.__mapping = b''
+        super().__init__(self.__mapping)
+        if hasattr(self.__mapping, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            try:
+                self.__mapping.madvise(mmap.MADV_SEQUENTIAL)
+            except OSError:
+                pass
+    @property
+    def name(self):
+        '''
+        Getter for name
+        '''
+        return self.__name
+    def read(self, size=-1):
+        '''
+        @BufferedIOBase.read
+        '''
+        self._checkClosed()
+        start = self._position
+        end = len(self._view) if size is None or size < 0 else min(start + size, len(self._view))
+        if end <= start:
+            return b''
+        self._position = end
+        return self.__mapping[start:end]
+    def close(self):
+        '''
+        @BufferedIOBase.close
+        '''
+        if not self.closed:
+            try:
+                self._view.release()
+                if isinstance(self.__mapping, mmap.mmap):
+                    self.__mapping.close()
+            except BufferError as e:
+                Logger.error('Failed to close memory mapping of %s (%s)'%(self.__name, str(e)))
+            finally:
+                BufferedIOBase.close(self)
+    def __repr__(self):
+        return '%s(%s)'%(type(self).__name__, repr(self.__name))
+
+class PrefetchStream(BufferedIOBase):
+    '''
+    Read-only binary stream over a file that reads in large blocks
+    (block_size bytes) with positioned reads, so parsers that make many
+    small reads and seeks (i.e. construct parsers on network shares) pay one 
+    syscall per block rather than per read.  The kernel is told that access 
+    is sequential (posix_fadvise), the next prefetch blocks are read ahead on 
+    a background thread, and the last cache_blocks blocks are kept so that 
+    backward seeks are served from memory.  Counters of bytes read from the 
+    file, read syscalls and cache hits/misses are available from stats.
+    '''
+    def __init__(self, filepath, block_size=1024 * 1024, cache_blocks=8, prefetch=2):
+        assert isinstance(filepath, str)
+        assert isinstance(block_size, int) and block_size > 0
+        assert isinstance(cache_blocks, int) and cache_blocks > 0
+        assert isinstance(prefetch, int) and prefetch >= 0
+        super().__init__()
+        self.__name = filepath
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.prefetch = prefetch
+        self.bytes_read = 0
+        self.syscalls = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.__fd = os.open(filepath, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        self.__position = 0
+        self.__cache = OrderedDict()
+        self.__pending = dict()
+        self.__executor = ThreadPoolExecutor(max_workers=1) if prefetch > 0 else None
+        self.__lock = Lock()
+        if hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(self.__fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+    @property
+    def name(self):
+        '''
+        Getter for name
+        '''
+        return self.__name
+    def readable(self):
+        '''
+        @BufferedIOBase.readable
+        '''
+        return True
+    def seekable(self):
+        '''
+        @BufferedIOBase.seekable
+        '''
+        return True
+    def fileno(self):
+        '''
+        @BufferedIOBase.fileno
+        '''
+        self._checkClosed()
+        return self.__fd
+    def _read_block(self, idx):
+        '''
+        Args:
+            idx: Integer    => index of the block to read
+        Returns:
+            Bytes
+            Contents of block idx read from the file (shorter than 
+            self.block_size at the end of the file)
+        Preconditions:
+            idx is of type Integer (>= 0)
+        '''
+        block = os.pread(self.__fd, self.block_size, idx * self.block_size)
+        with self.__lock:
+            self.syscalls += 1
+            self.bytes_read += len(block)
+        return block
+    def _schedule(self, idx):
+        '''
+        Args:
+            idx: Integer    => index of the block that was just accessed
+        Procedure:
+            Read the next self.prefetch blocks after idx on the background 
+            thread if they are not already cached or pending, and cancel 
+            pending reads outside of that range (i.e. after a seek)
+        Preconditions:
+            idx is of type Integer (>= 0)
+        '''
+        window = range(idx + 1, idx + 1 + self.prefetch)
+        for ahead in [ahead for ahead in self.__pending if ahead not in window]:
+            self.__pending.pop(ahead).cancel()
+        for ahead in window:
+            if ahead not in self.__cache and ahead not in self.__pending:
+                if hasattr(os, 'posix_fadvise'):
+                    try:
+                        os.posix_fadvise(self.__fd, ahead * self.block_size, self.block_size, os.POSIX_FADV_WILLNEED)
+                    except OSError:
+                        pass
+                self.__pending[ahead] = self.__executor.submit(self._read_block, ahead)
+    def _get_block(self, idx):
+        '''
+        Args:
+            idx: Integer    => index of the block to get
+        Returns:
+            Bytes
+            Contents of block idx, from the cache, a pending prefetch or the file
+        Preconditions:
+            idx is of type Integer (>= 0)
+        '''
+        block = self.__cache.get(idx)
+        if block is not None:
+            self.cache_hits += 1
+            self.__cache.move_to_end(idx)
+            return block
+        future = self.__pending.pop(idx, None)
+        if future is not None:
+            self.cache_hits += 1
+            block = future.result()
+        else:
+            self.cache_misses += 1
+            block = self._read_block(idx)
+        self.__cache[idx] = block
+        while len(self.__cache) > self.cache_blocks:
+            self.__cache.popitem(last=False)
+        if self.__executor is not None and len(block) == self.block_size:
+            self._schedule(idx)
+        return block
+    def _iter_chunks(self, size):
+        '''
+        Args:
+            size: Integer   => maximum number of bytes to read (-1 for all)
+        Returns:
+            Generator<memoryview>
+            Views over cached blocks covering up to size bytes from the current 
+            position, advancing the position as they are yielded
+        Preconditions:
+            size is of type Integer
+        '''
+        while size != 0:
+            idx, start = divmod(self.__position, self.block_size)
+            block = self._get_block(idx)
+            end = len(block) if size < 0 else min(len(block), start + size)
+            if end <= start:
+                return
+            self.__position += end - start
+            if size > 0:
+                size -= end - start
+            yield memoryview(block)[start:end]
+            if len(block) < self.block_size:
+                return
+    def read(self, size=-1):
+        '''
+        @BufferedIOBase.read
+        '''
+        self._checkClosed()
+        if size is None:
+            size = -1
+        idx, start = divmod(self.__position, self.block_size)
+        if 0 <= size <= self.block_size - start:
+            block = self._get_block(idx)
+            chunk = block[start:start + size]
+            self.__position += len(chunk)
+            return chunk
+        return b''.join(self._iter_chunks(size))
+    def read1(self, size=-1):
+        '''
+        @BufferedIOBase.read1
+        '''
+        return self.read(size)
+    def readinto(self, buffer):
+        '''
+        @BufferedIOBase.readinto
+        '''
+        self._checkClosed()
+        with memoryview(buffer) as target:
+            target = target.cast('B')
+            total = 0
+            for chunk in self._iter_chunks(len(target)):
+                target[total:total + len(chunk)] = chunk
+                total += len(chunk)
+            return total
+    def seek(self, offset, whence=SEEK_SET):
+        '''
+        @BufferedIOBase.seek
+        '''
+        self._checkClosed()
+        if whence == SEEK_SET:
+            position = offset
+        elif whence == SEEK_CUR:
+            position = self.__position + offset
+        elif whence == SEEK_END:
+            position = os.fstat(self.__fd).st_size + offset
+        else:
+            raise ValueError('invalid whence (%s, should be 0, 1 or 2)'%repr(whence))
+        if position < 0:
+            raise ValueError('negative seek position %d'%position)
+        self.__position = position
+        return position
+    def tell(self):
+        '''
+        @BufferedIOBase.tell
+        '''
+        self._checkClosed()
+        return self.__position
+    def stats(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            Dict<String, Integer>
+            Counters of bytes read from the file and read syscalls (both 
+            including prefetches), and block cache hits (including completed
+            prefetches) and misses
+        Preconditions:
+            N/A
+        '''
+        return dict(
+            bytes_read=self.bytes_read,
+            syscalls=self.syscalls,
+            cache_hits=self.cache_hits,
+            cache_misses=self.cache_misses
+        )
+    def close(self):
+        '''
+        @BufferedIOBase.close
+        '''
+        if not self.closed:
+            try:
+                if self.__executor is not None:
+                    self.__executor.shutdown(wait=True, cancel_futures=True)
+                self.__pending.clear()
+                self.__cache.clear()
+                os.close(self.__fd)
+            finally:
+                super().close()
+    def __repr__(self):
+        return '%s(%s, block_size=%d)'%(type(self).__name__, repr(self.__name), self.block_size)
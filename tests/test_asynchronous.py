@@ -0,0 +1,103 @@
+## -*- coding: UTF-8 -*-
+## tests/test_asynchronous.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from .. import FileParser, StructureProperty
+from ..asynchronous import AsyncParserRunner
+
+class ContentParser(FileParser):
+    content = StructureProperty(0, 'content')
+    stream_type = StructureProperty(1, 'stream_type')
+
+    def _parse_content(self):
+        data = self.stream.read()
+        if data.startswith(b'slow'):
+            time.sleep(0.05)
+        return data.decode('utf8')
+    def _parse_stream_type(self):
+        return type(self.stream).__name__
+
+@pytest.fixture
+def sources(tmp_path):
+    filepaths = list()
+    for idx, content in enumerate([b'slow0', b'1', b'slow2', b'3']):
+        filepath = str(tmp_path / ('source%d'%idx))
+        with open(filepath, 'wb') as fhandle:
+            fhandle.write(content)
+        filepaths.append(filepath)
+    return filepaths
+
+async def _collect(runner, sources):
+    return [entry async for entry in runner.map(sources)]
+
+def test_aparse(sources):
+    parser = asyncio.run(ContentParser(sources[1]).aparse())
+    assert parser.content == '1'
+
+def test_map_ordering(sources):
+    with ThreadPoolExecutor(4) as executor:
+        ordered = asyncio.run(_collect(
+            AsyncParserRunner(ContentParser, concurrency=4, executor=executor, ordered=True), 
+            sources
+        ))
+        unordered = asyncio.run(_collect(
+            AsyncParserRunner(ContentParser, concurrency=4, executor=executor), 
+            sources
+        ))
+    assert [entry.source for entry in ordered] == sources
+    assert [entry.result.get('content') for entry in ordered] == ['slow0', '1', 'slow2', '3']
+    assert sorted(entry.source for entry in unordered) == sources
+    assert all(entry.err is None for entry in ordered + unordered)
+
+def test_read_ahead(sources):
+    entries = asyncio.run(_collect(AsyncParserRunner(ContentParser, ordered=True, read_ahead=True), sources))
+    assert [entry.result.get('stream_type') for entry in entries] == ['BytesIO'] * 4
+    entries = asyncio.run(_collect(
+        AsyncParserRunner(ContentParser, ordered=True, read_ahead=True, read_ahead_limit=4), 
+        sources
+    ))
+    assert [entry.result.get('stream_type') for entry in entries] == ['BufferedReader', 'BytesIO'] * 2
+    assert [entry.result.get('content') for entry in entries] == ['slow0', '1', 'slow2', '3']
+    with pytest.raises(ValueError):
+        AsyncParserRunner(ContentParser, read_ahead=True, kwargs=dict(compression='auto'))
+
+def test_closing_cancels_pending(sources):
+    async def first(runner):
+        entries = runner.map(sources * 4)
+        entry = await entries.__anext__()
+        await entries.aclose()
+        return entry
+    with ThreadPoolExecutor(1) as executor:
+        runner = AsyncParserRunner(ContentParser, concurrency=8, executor=executor, ordered=True)
+        started = time.monotonic()
+        entry = asyncio.run(first(runner))
+        executor.shutdown(wait=True)
+        elapsed = time.monotonic() - started
+    assert entry.result.get('content') == 'slow0'
+    ## NOTE: all 8 sources in flight would take at least 4 * 0.05 seconds
+    assert elapsed < 0.2
@@ -0,0 +1,97 @@
+## -*- coding: UTF-8 -*-
+## tests/test_caching.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import gzip
+
+from .. import ByteParser, FileParser, StructureProperty
+from ..caching import StructureCache
+
+class SequentialParser(ByteParser):
+    first = StructureProperty(0, 'first')
+    second = StructureProperty(1, 'second')
+
+    def _parse_first(self):
+        return self.stream.read(1)[0]
+    def _parse_second(self):
+        return self.stream.read(1)[0]
+
+class SequentialFileParser(FileParser):
+    first = StructureProperty(0, 'first')
+
+    def _parse_first(self):
+        return self.stream.read(4)
+
+def test_partial_hit_advances_stream():
+    SequentialParser.STRUCTURE_CACHE = StructureCache()
+    try:
+        with SequentialParser(b'\x01\x02') as parser:
+            assert parser.parse_structure('first') == 1
+        parser = SequentialParser(b'\x01\x02').parse()
+        assert (parser.first, parser.second) == (1, 2)
+        assert SequentialParser.STRUCTURE_CACHE.hits == 1
+        parser = SequentialParser(b'\x01\x02').parse()
+        assert (parser.first, parser.second) == (1, 2)
+    finally:
+        SequentialParser.STRUCTURE_CACHE = None
+
+def test_disk_tier_hit_advances_stream(tmp_path):
+    path = str(tmp_path / 'structures.cache')
+    SequentialParser.STRUCTURE_CACHE = StructureCache(path=path)
+    try:
+        with SequentialParser(b'\x03\x04') as parser:
+            parser.parse_structure('first')
+        SequentialParser.STRUCTURE_CACHE = StructureCache(path=path)
+        parser = SequentialParser(b'\x03\x04').parse()
+        assert (parser.first, parser.second) == (3, 4)
+        assert SequentialParser.STRUCTURE_CACHE.disk_hits == 1
+    finally:
+        SequentialParser.STRUCTURE_CACHE = None
+
+def test_key_depends_on_decoding(tmp_path):
+    filepath = str(tmp_path / 'source.gz')
+    with gzip.open(filepath, 'wb') as fhandle:
+        fhandle.write(b'DATA')
+    SequentialFileParser.STRUCTURE_CACHE = StructureCache()
+    try:
+        raw = SequentialFileParser(filepath).parse()
+        decoded = SequentialFileParser(filepath, compression='gzip').parse()
+        assert raw.first != b'DATA'
+        assert decoded.first == b'DATA'
+    finally:
+        SequentialFileParser.STRUCTURE_CACHE = None
+
+def test_key_depends_on_start_offset():
+    SequentialParser.STRUCTURE_CACHE = StructureCache()
+    try:
+        parser = SequentialParser(b'\x01\x02').parse(only=['second'])
+        assert parser.second == 1
+        parser = SequentialParser(b'\x01\x02').parse()
+        assert (parser.first, parser.second) == (1, 2)
+        with SequentialParser(b'\x01\x02\x03') as parser:
+            parser.stream.seek(2)
+            assert parser.parse_structure('first') == 3
+        parser = SequentialParser(b'\x01\x02\x03').parse()
+        assert (parser.first, parser.second) == (1, 2)
+        assert len(parser.failures) == 0
+    finally:
+        SequentialParser.STRUCTURE_CACHE = None
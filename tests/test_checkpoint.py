@@ -0,0 +1,107 @@
+## -*- coding: UTF-8 -*-
+## tests/test_checkpoint.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import os
+import struct
+import multiprocessing
+
+from .. import ByteParser, ByteRecordParser, StructureProperty
+from ..checkpoint import Checkpoint
+
+class HeaderParser(ByteParser):
+    first = StructureProperty(0, 'first')
+    second = StructureProperty(1, 'second')
+    third = StructureProperty(2, 'third')
+
+    def _parse_first(self):
+        return self.stream.read(1)[0]
+    def _parse_second(self):
+        return self.stream.read(1)[0]
+    def _parse_third(self):
+        if os.environ.get('KILL_BEFORE_THIRD') is not None:
+            os._exit(1)
+        return self.stream.read(1)[0]
+
+class ValueParser(ByteParser):
+    value = StructureProperty(0, 'value')
+
+    def _parse_value(self):
+        return struct.unpack('<I', self.stream.read(4))[0]
+
+class ValuesParser(ByteRecordParser):
+    RECORD_PARSER = ValueParser
+    RECORD_SIZE = 4
+
+def _parse_until_killed(path):
+    os.environ['KILL_BEFORE_THIRD'] = '1'
+    HeaderParser(b'\x01\x02\x03', checkpoint=Checkpoint(path, every_records=1)).parse()
+
+def test_structures_resume_after_kill(tmp_path):
+    path = str(tmp_path / 'header.checkpoint')
+    process = multiprocessing.get_context('fork').Process(target=_parse_until_killed, args=(path,))
+    process.start()
+    process.join()
+    assert process.exitcode == 1
+    parser = HeaderParser(b'\x01\x02\x03', checkpoint=Checkpoint(path)).parse()
+    assert (parser.first, parser.second, parser.third) == (1, 2, 3)
+
+def test_records_resume_from_saved_offset(tmp_path):
+    path = str(tmp_path / 'records.checkpoint')
+    data = b''.join(struct.pack('<I', i) for i in range(100))
+    records = ValuesParser(data, checkpoint=Checkpoint(path, every_records=10)).records()
+    for _ in range(25):
+        next(records)
+    records.close()
+    checkpoint = Checkpoint(path, every_records=10)
+    remaining = list(ValuesParser(data, checkpoint=checkpoint).records())
+    assert remaining[0][0] == 80
+    assert len(remaining) == 80
+    assert checkpoint.state.get('complete')
+
+class CountingCheckpoint(Checkpoint):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.saves = 0
+    def save(self, **values):
+        self.saves += 1
+        super().save(**values)
+
+def test_structures_are_saved_when_due(tmp_path):
+    path = str(tmp_path / 'header.checkpoint')
+    checkpoint = CountingCheckpoint(path, every_records=1)
+    HeaderParser(b'\x01\x02\x03', checkpoint=checkpoint).parse()
+    assert checkpoint.saves == 3
+    checkpoint.clear()
+    checkpoint = CountingCheckpoint(path, every_records=2)
+    HeaderParser(b'\x01\x02\x03', checkpoint=checkpoint).parse()
+    assert checkpoint.saves == 2
+    checkpoint.clear()
+    checkpoint = CountingCheckpoint(path)
+    HeaderParser(b'\x01\x02\x03', checkpoint=checkpoint).parse()
+    assert checkpoint.saves == 1
+    assert checkpoint.state.get('structures') == dict(first=1, second=2, third=3)
+
+def test_default_interval_is_not_every_record():
+    checkpoint = Checkpoint('unused')
+    assert not checkpoint.due(1, 4)
+    assert checkpoint.due(1, Checkpoint.DEFAULT_EVERY_BYTES)
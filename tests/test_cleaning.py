@@ -0,0 +1,130 @@
+## -*- coding: UTF-8 -*-
+## tests/test_cleaning.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+from collections.abc import Mapping, Sequence
+from datetime import datetime, timezone, timedelta
+import pickle
+
+import pytest
+from construct.lib import Container, ListContainer
+
+from ..cleaning import clean_value, clean_view, compact_value, CompactRecord
+
+def reference_clean_value(value, serialize=False):
+    ## NOTE: BaseParser._clean_value before it was replaced by cleaning.clean_value
+    cleaned = value
+    if issubclass(type(value), Container):
+        cleaned = Container()
+        for key in value.keys():
+            if not (key.startswith('Raw') or key.startswith('_')):
+                cleaned[key] = reference_clean_value(value[key], serialize)
+    elif isinstance(value, list):
+        cleaned = list(map(lambda entry: reference_clean_value(entry, serialize), value))
+    elif isinstance(value, datetime) and serialize:
+        cleaned = value.strftime('%Y-%m-%d %H:%M:%S.%f%z')
+    return cleaned
+
+def materialize(value):
+    if isinstance(value, CompactRecord):
+        return ('Container', [(key, materialize(value[key])) for key in value])
+    elif isinstance(value, Mapping):
+        return (type(value).__name__, [(key, materialize(value[key])) for key in value])
+    elif isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return (type(value).__name__, [materialize(entry) for entry in value])
+    return value
+
+def create_entry(idx):
+    return Container(
+        RawHeader=b'\x00' * 4,
+        _io=object(),
+        Index=idx,
+        Name='entry%d'%idx,
+        Created=datetime(2021, 1, 1, 12, 30, 15, idx, tzinfo=timezone.utc),
+        Modified=datetime(2021, 1, 1, 12, 30, 15),
+        Ancient=datetime(999, 1, 1, tzinfo=timezone(timedelta(hours=-5))),
+        Attributes=ListContainer([
+            Container(Type=idx, _flags=1, Data=b'\x01\x02', RawData=b'\x03'),
+            Container(Type=idx + 1, Nested=Container(Rawest=1, Value=[1, Container(_hidden=1, x=2)]))
+        ]),
+        Empty=Container(),
+        Values=[[], [datetime(2000, 2, 29, tzinfo=timezone.utc)], None, 1.5]
+    )
+
+VALUES = [
+    create_entry(1),
+    ListContainer([create_entry(idx) for idx in range(3)]),
+    [create_entry(4), [create_entry(5)]],
+    datetime(2021, 6, 1, tzinfo=timezone.utc),
+    b'raw',
+    None
+]
+
+@pytest.mark.parametrize('serialize', [False, True])
+@pytest.mark.parametrize('value', VALUES)
+def test_clean_value_matches_reference(value, serialize):
+    expected = reference_clean_value(value, serialize)
+    cleaned = clean_value(value, serialize)
+    assert cleaned == expected
+    assert materialize(cleaned) == materialize(expected)
+    if isinstance(value, (Container, list)):
+        assert cleaned is not value
+
+@pytest.mark.parametrize('serialize', [False, True])
+@pytest.mark.parametrize('value', VALUES)
+def test_clean_view_matches_reference(value, serialize):
+    expected = reference_clean_value(value, serialize)
+    view = clean_view(value, serialize)
+    assert materialize(clean_value(view, serialize)) == materialize(expected)
+    if isinstance(value, Container):
+        assert list(view) == list(expected)
+        assert not ('RawHeader' in view) and not ('_io' in view)
+        assert view.Attributes[1].Nested.Value[1] == expected.Attributes[1].Nested.Value[1]
+        assert view['Created'] == expected['Created']
+        with pytest.raises(KeyError):
+            view['RawHeader']
+    elif isinstance(value, list):
+        assert len(view) == len(expected)
+        assert materialize(clean_value(view[1:], serialize)) == materialize(expected[1:])
+    else:
+        assert view == expected
+
+@pytest.mark.parametrize('serialize', [False, True])
+@pytest.mark.parametrize('value', VALUES)
+def test_compact_value_matches_reference(value, serialize):
+    expected = reference_clean_value(value, serialize)
+    compacted = compact_value(value, serialize, name='EntryRecord')
+    assert materialize(compacted) == materialize(expected)
+    assert materialize(clean_value(compacted, serialize)) == materialize(expected)
+    assert materialize(pickle.loads(pickle.dumps(compacted))) == materialize(expected)
+    if isinstance(value, Container):
+        assert type(compacted).__name__ == 'EntryRecord'
+        assert compacted == expected
+        assert compacted.Attributes[1].Nested.Value[1].x == 2
+        with pytest.raises(AttributeError):
+            compacted.Index = 0
+
+def test_compact_value_keeps_invalid_fields_as_container():
+    value = Container(Valid=Container(x=1), **{'not valid': Container(keys=1, y=2)})
+    compacted = compact_value(value)
+    assert isinstance(compacted, Container)
+    assert isinstance(compacted.Valid, CompactRecord) and compacted.Valid.x == 1
+    assert isinstance(compacted['not valid'], Container)
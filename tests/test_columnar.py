@@ -0,0 +1,44 @@
+## -*- coding: UTF-8 -*-
+## tests/test_columnar.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import pytest
+from construct.lib import Container
+
+from .. import ByteParser
+from ..columnar import ColumnarBatch
+
+np = pytest.importorskip('numpy')
+
+def test_export_freezes_batch():
+    batch = ColumnarBatch(ByteParser)
+    batch.append(Container(size=1, name='a'))
+    arrays = batch.to_numpy()
+    with pytest.raises(ValueError):
+        batch.append(Container(size=2, name='b'))
+    assert len(batch) == 1
+    assert all(len(column) == 1 for column in batch.columns.values())
+    assert arrays['size'].tolist() == [1]
+    batch.clear()
+    batch.append(Container(size=3, name='c'))
+    assert batch.to_numpy()['size'].tolist() == [3]
+    assert arrays['size'].tolist() == [1]
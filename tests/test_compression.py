@@ -0,0 +1,87 @@
+## -*- coding: UTF-8 -*-
+## tests/test_compression.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import os
+import io
+import gzip
+import random
+import struct
+import zipfile
+
+from .. import FileParser, StructureProperty
+from ..compression import open_source
+
+DATA = b''.join(struct.pack('<I', value) for value in range(256 * 1024))
+
+def _check_seeks(stream, expected, count=200):
+    generator = random.Random(0)
+    reference = io.BytesIO(expected)
+    for _ in range(count):
+        offset = generator.randrange(0, len(expected))
+        size = generator.choice([1, 4, 4096, 100000])
+        stream.seek(offset)
+        reference.seek(offset)
+        assert stream.read(size) == reference.read(size)
+        assert stream.tell() == reference.tell()
+
+def _open_fds():
+    return len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else None
+
+def test_gzip_random_seeks_use_seek_points(tmp_path):
+    filepath = str(tmp_path / 'source.gz')
+    with gzip.open(filepath, 'wb') as fhandle:
+        fhandle.write(DATA)
+    with open_source(filepath, seek_interval=64 * 1024, history_size=0) as stream:
+        _check_seeks(stream, DATA)
+        assert stream.seek_point_hits > 0
+
+def test_zip_members(tmp_path):
+    filepath = str(tmp_path / 'source.zip')
+    with zipfile.ZipFile(filepath, 'w') as archive:
+        archive.writestr('deflated', DATA, compress_type=zipfile.ZIP_DEFLATED)
+        archive.writestr('stored', DATA[:4096], compress_type=zipfile.ZIP_STORED)
+        archive.writestr('bzip2', DATA[:4096], compress_type=zipfile.ZIP_BZIP2)
+    with open_source(filepath, member='deflated', seek_interval=64 * 1024) as stream:
+        assert stream.seek_interval == 64 * 1024
+        _check_seeks(stream, DATA, count=50)
+    for member in ('stored', 'bzip2'):
+        opened = _open_fds()
+        stream = open_source(filepath, member=member)
+        _check_seeks(stream, DATA[:4096], count=20)
+        stream.close()
+        assert _open_fds() == opened
+
+class FirstValueParser(FileParser):
+    first = StructureProperty(0, 'first')
+
+    def _parse_first(self):
+        return struct.unpack('<I', self.stream.read(4))[0]
+
+def test_file_parser_passes_decompression_options(tmp_path):
+    filepath = str(tmp_path / 'source.gz')
+    with gzip.open(filepath, 'wb') as fhandle:
+        fhandle.write(DATA)
+    parser = FirstValueParser(filepath, compression='auto', decompression=dict(seek_interval=1024))
+    with parser.create_stream() as stream:
+        assert stream.seek_interval == 1024
+    assert parser.parse().first == 0
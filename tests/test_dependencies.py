@@ -0,0 +1,62 @@
+## -*- coding: UTF-8 -*-
+## tests/test_dependencies.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+import pytest
+
+from .. import ByteParser, StructureProperty
+
+class HeaderParser(ByteParser):
+    first = StructureProperty(0, 'first')
+    second = StructureProperty(1, 'second', deps=['first'])
+
+    def _parse_first(self):
+        value = self.stream.read(1)[0]
+        if value == 0:
+            raise ValueError('empty header')
+        return value
+    def _parse_second(self):
+        return self.stream.read(1)[0]
+
+def test_failed_dependency():
+    parser = HeaderParser(b'\x00\x02').parse()
+    assert parser.first is None
+    assert getattr(parser, 'second', None) is None
+    assert list(parser.failures) == ['first']
+    assert isinstance(parser.failures['first'], ValueError)
+    assert parser._satisfied == 0
+    with pytest.raises(ValueError, match='failed to parse dependency first'):
+        HeaderParser(b'\x00\x02').parse_structure('second')
+
+def test_unsatisfied_dependency():
+    parser = HeaderParser(b'\x01\x02')
+    with pytest.raises(AttributeError, match='dependencies not met'):
+        parser.second
+    assert getattr(parser, 'second', None) is None
+    parser.parse(only=['first'])
+    assert parser.first == 1
+    assert parser._satisfied == HeaderParser._PROPERTY_BITS['first']
+    assert parser.second is None
+    parser.parse()
+    assert parser.second == 2
+    parser.first = None
+    assert parser._satisfied == HeaderParser._PROPERTY_BITS['second']
+    assert getattr(parser, 'second', None) is None
@@ -0,0 +1,58 @@
+## -*- coding: UTF-8 -*-
+## tests/test_indexing.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import pickle
+
+from ..indexing import SignatureIndex
+
+def _build(tmp_path, data, signatures, alignment=1, chunk_size=None):
+    filepath = str(tmp_path / 'source')
+    with open(filepath, 'wb') as fhandle:
+        fhandle.write(data)
+    return SignatureIndex.build(filepath, signatures, alignment, fingerprint='source', chunk_size=chunk_size)
+
+def test_aligned_match_after_unaligned_match(tmp_path):
+    assert list(_build(tmp_path, b'xAAA', [b'AA'], alignment=2)) == [2]
+
+def test_overlapping_matches(tmp_path):
+    assert list(_build(tmp_path, b'AAAA', [b'AA'])) == [0, 1, 2]
+    assert list(_build(tmp_path, b'xABC', [b'AB', b'ABC'])) == [1]
+
+def test_matches_across_chunks(tmp_path):
+    data = b'..FILE0...FILE0.FILE0'
+    assert list(_build(tmp_path, data, [b'FILE0'], chunk_size=4)) == [2, 10, 16]
+
+def test_save_and_load(tmp_path):
+    index = _build(tmp_path, b'FILE0BAAD' * 3, [b'FILE0', b'BAAD'])
+    filepath = str(tmp_path / 'source.sigidx')
+    index.save(filepath)
+    loaded = SignatureIndex.load(filepath, [b'FILE0', b'BAAD'], fingerprint='source')
+    assert list(loaded) == list(index) == [0, 5, 9, 14, 18, 23]
+    assert SignatureIndex.load(filepath, [b'FILE0', b'BAAD'], fingerprint='other') is None
+    assert SignatureIndex.load(filepath, [b'FILE0'], fingerprint='source') is None
+
+def test_load_ignores_pickles(tmp_path):
+    filepath = str(tmp_path / 'source.sigidx')
+    with open(filepath, 'wb') as fhandle:
+        pickle.dump(dict(fingerprint='source'), fhandle)
+    assert SignatureIndex.load(filepath, [b'FILE0'], fingerprint='source') is None
@@ -0,0 +1,61 @@
+## -*- coding: UTF-8 -*-
+## tests/test_isolation.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import os
+
+import pytest
+
+from .. import ByteParser, StructureProperty
+from ..isolation import IsolatedParserPool
+
+class CommandParser(ByteParser):
+    result = StructureProperty(0, 'result')
+
+    def _parse_result(self):
+        command = self.stream.read()
+        if command == b'oom':
+            return len(bytearray(4 * 1024 ** 3))
+        if command == b'raise':
+            raise ValueError('bad command')
+        if command == b'die':
+            os._exit(3)
+        if command == b'loop':
+            while True:
+                pass
+        return len(command)
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires fork')
+def test_statuses():
+    sources = [b'ok', b'oom', b'raise', b'die', b'loop', b'ok']
+    with IsolatedParserPool(
+        CommandParser, 
+        workers=2, 
+        timeout=2, 
+        memory_limit=1024 ** 3, 
+        ordered=True, 
+        context='fork') as pool:
+        entries = list(pool.map(sources))
+    assert [entry.status for entry in entries] == ['ok', 'error', 'error', 'crashed', 'timeout', 'ok']
+    assert entries[0].err is None
+    assert 'MemoryError' in entries[1].err
+    assert 'bad command' in entries[2].err
@@ -0,0 +1,61 @@
+## -*- coding: UTF-8 -*-
+## tests/test_lazy.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import sys
+from threading import Thread
+
+import pytest
+
+from ..lazy import lazy_import, LazyModule
+
+@pytest.fixture
+def modules(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    (tmp_path / 'lazy_target.py').write_text('import time\ntime.sleep(0.1)\nIMPORTS = [1]\n')
+    (tmp_path / 'lazy_broken.py').write_text('raise ImportError("broken dependency")\n')
+    yield
+    for name in ('lazy_target', 'lazy_broken'):
+        sys.modules.pop(name, None)
+
+def test_import_is_deferred_and_shared(modules):
+    module = lazy_import('lazy_target')
+    assert isinstance(module, LazyModule)
+    assert not ('lazy_target' in sys.modules)
+    results = list()
+    threads = [Thread(target=lambda: results.append(module.IMPORTS)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 8
+    assert all(result is sys.modules['lazy_target'].IMPORTS for result in results)
+    assert lazy_import('lazy_target') is sys.modules['lazy_target']
+
+def test_missing_and_broken_modules(modules):
+    assert lazy_import('lazy_missing', optional=True) is None
+    with pytest.raises(ImportError):
+        lazy_import('lazy_missing')
+    module = lazy_import('lazy_broken', optional=True)
+    for _ in range(2):
+        with pytest.raises(ImportError, match='broken dependency'):
+            module.anything
@@ -0,0 +1,74 @@
+## -*- coding: UTF-8 -*-
+## tests/test_parallel.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import struct
+
+from .. import ByteParser, FileRecordParser, StructureProperty
+from ..parallel import parse_source, ChunkedParserPool
+
+class FailingParser(ByteParser):
+    header = StructureProperty(0, 'header')
+    body = StructureProperty(1, 'body')
+
+    def _parse_header(self):
+        return self.stream.read(1)[0]
+    def _parse_body(self):
+        raise ValueError('bad body')
+
+class ValueParser(ByteParser):
+    value = StructureProperty(0, 'value')
+
+    def _parse_value(self):
+        return struct.unpack('<I', self.stream.read(4))[0]
+
+class ValuesParser(FileRecordParser):
+    RECORD_PARSER = ValueParser
+    RECORD_SIZE = 8
+
+def test_parse_source_reports_failed_structures():
+    entry = parse_source(FailingParser, b'\x01')
+    assert entry.result is not None
+    assert entry.err == 'body: ValueError (bad body)'
+
+def test_failures_are_cleared_by_parse():
+    parser = FailingParser(b'\x01').parse()
+    assert list(parser.failures) == ['body']
+    parser.parse(only=['header'])
+    assert len(parser.failures) == 0
+
+def test_chunked_batches_are_bounded(tmp_path):
+    filepath = str(tmp_path / 'values')
+    with open(filepath, 'wb') as fhandle:
+        for value in range(1000):
+            fhandle.write(struct.pack('<II', value, 0))
+    serial = [(offset, record.get_results(serialize=True)) for offset, record in ValuesParser(filepath).records()]
+    with ChunkedParserPool(ValuesParser, workers=2, max_pending=2, chunk_size=500) as pool:
+        ranges = pool.ranges(filepath)
+        assert len(ranges) == 16
+        assert all(start % 8 == 0 for start, _ in ranges)
+        assert all(end - start <= 504 for start, end in ranges[:-1])
+        batches = list(pool.batches(filepath))
+        assert len(batches) == len(ranges)
+        assert [record for batch in batches for record in batch] == serial
+        assert list(pool.records(filepath)) == serial
+        assert len(pool.errors) == 0
@@ -0,0 +1,93 @@
+## -*- coding: UTF-8 -*-
+## tests/test_planning.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+import pytest
+
+from .. import ByteParser, StructureProperty
+
+class OffsetParser(ByteParser):
+    ## NOTE: declared out of dependency order, so parse order must be computed
+    third = StructureProperty(0, 'third', deps=['second'])
+    first = StructureProperty(1, 'first')
+    second = StructureProperty(2, 'second', deps=['first'])
+    other = StructureProperty(3, 'other')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parsed = list()
+    def _read(self, structure, offset):
+        self.parsed.append(structure)
+        self.stream.seek(offset)
+        return self.stream.read(1)[0]
+    def _parse_first(self):
+        return self._read('first', 0)
+    def _parse_second(self):
+        return self._read('second', 1)
+    def _parse_third(self):
+        return self._read('third', 2)
+    def _parse_other(self):
+        return self._read('other', 3)
+
+def test_parse_order_and_closure():
+    assert OffsetParser._PARSE_ORDER == ('first', 'second', 'third', 'other')
+    assert OffsetParser._DEPENDENCIES['third'] == ('first', 'second')
+    assert OffsetParser._DEPENDENCIES['second'] == ('first',)
+    assert OffsetParser._DEPENDENCIES['other'] == tuple()
+
+def test_dependency_cycle_is_rejected():
+    with pytest.raises(ValueError, match='cycle') as info:
+        class CyclicParser(ByteParser):
+            first = StructureProperty(0, 'first', deps=['third'])
+            second = StructureProperty(1, 'second')
+            third = StructureProperty(2, 'third', deps=['first'])
+    assert 'first, third' in str(info.value)
+
+def test_parse_only_dependency_closure():
+    parser = OffsetParser(b'\x01\x02\x03\x04').parse(only=['third'])
+    assert parser.parsed == ['first', 'second', 'third']
+    assert (parser.first, parser.second, parser.third) == (1, 2, 3)
+    assert parser.other is None
+    with pytest.raises(ValueError):
+        OffsetParser(b'\x01').parse(only=['missing'])
+    ## NOTE: structures parsed earlier keep their values
+    parser.parse(only=['other'])
+    assert parser.parsed[3:] == ['other']
+    assert (parser.third, parser.other) == (3, 4)
+
+def test_lazy_access_parses_on_demand():
+    with OffsetParser(b'\x01\x02\x03\x04', lazy=True) as parser:
+        assert parser.second == 2
+        assert parser.parsed == ['first', 'second']
+        assert parser.third == 3 and parser.second == 2
+        assert parser.parsed == ['first', 'second', 'third']
+        assert parser.stream is not None
+    assert parser.stream is None
+
+def test_lazy_access_after_parse_reopens_stream():
+    parser = OffsetParser(b'\x01\x02\x03\x04', lazy=True).parse(only=['first'])
+    assert parser.stream is None
+    assert parser.other == 4
+    assert parser.parsed == ['first', 'other']
+    ## NOTE: the stream reopened for lazy access is closed by the caller
+    assert parser.stream is not None and not parser.stream.closed
+    parser.__exit__(None, None, None)
+    assert parser.stream is None
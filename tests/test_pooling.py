@@ -0,0 +1,79 @@
+## -*- coding: UTF-8 -*-
+## tests/test_pooling.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from .. import ByteParser, StructureProperty
+from ..caching import StructureCache
+from ..pooling import ParserInstancePool
+
+class HeaderParser(ByteParser):
+    first = StructureProperty(0, 'first')
+    second = StructureProperty(1, 'second', deps=['first'])
+
+    def _parse_first(self):
+        value = self.stream.read(1)[0]
+        if value == 0:
+            raise ValueError('empty header')
+        return value
+    def _parse_second(self):
+        return self.stream.read(1)[0]
+
+def test_pooled_instance_does_not_leak_state():
+    pool = ParserInstancePool(HeaderParser, size=1)
+    with pool.lease(b'\x00\x02') as parser:
+        parser.parse()
+        assert parser.first is None
+        assert getattr(parser, 'second', None) is None
+        assert list(parser.failures) == ['first']
+        leaked = parser
+        fingerprint = parser.get_fingerprint()
+    assert len(pool) == 1
+    with pool.lease(b'\x03\x04') as parser:
+        assert parser is leaked
+        assert parser.first is None
+        assert len(parser.failures) == 0
+        assert parser._satisfied == 0
+        assert parser.get_fingerprint() != fingerprint
+        parser.parse()
+        assert (parser.first, parser.second) == (3, 4)
+        assert len(parser.failures) == 0
+    assert pool.reused == 1
+
+def test_pooled_instance_does_not_reuse_cached_values():
+    HeaderParser.STRUCTURE_CACHE = StructureCache()
+    try:
+        pool = ParserInstancePool(HeaderParser, size=1)
+        with pool.lease(b'\x01\x02') as parser:
+            parser.parse()
+        with pool.lease(b'\x05\x06') as parser:
+            parser.parse()
+            assert (parser.first, parser.second) == (5, 6)
+    finally:
+        HeaderParser.STRUCTURE_CACHE = None
+
+def test_release_discards_dirty_instance():
+    pool = ParserInstancePool(HeaderParser, size=1)
+    parser = pool.acquire(b'\x01\x02')
+    parser._clear_properties = lambda: None
+    parser.parse()
+    pool.release(parser)
+    assert len(pool) == 0
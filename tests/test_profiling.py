@@ -0,0 +1,116 @@
+## -*- coding: UTF-8 -*-
+## tests/test_profiling.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+import json
+from time import sleep
+
+import pytest
+
+from .. import ByteParser, StructureProperty
+from ..profiling import ParserProfiler
+
+DELAY = 0.05
+
+class TimedParser(ByteParser):
+    first = StructureProperty(0, 'first')
+    second = StructureProperty(1, 'second', deps=['first'])
+    third = StructureProperty(2, 'third')
+
+    def _parse_first(self):
+        sleep(DELAY)
+        value = self.stream.read(1)[0]
+        if value == 0:
+            raise ValueError('empty header')
+        return value
+    def _parse_second(self):
+        return self.stream.read(1)[0]
+    def _parse_third(self):
+        ## NOTE: parses another structure while parsing this one
+        return self.parse_structure('first') + self.stream.read(1)[0]
+
+@pytest.fixture
+def profiler():
+    profiler = ParserProfiler()
+    TimedParser.PROFILER = profiler
+    yield profiler
+    TimedParser.PROFILER = None
+
+def test_hooks_receive_measurements(profiler):
+    started, ended = list(), list()
+    start = lambda parser, structure: started.append(structure)
+    end = lambda parser, structure, measurements: ended.append((structure, measurements))
+    profiler.add_hooks(start=start, end=end)
+    profiler.add_hooks(start=lambda parser, structure: 1 / 0)
+    parser = TimedParser(b'\x01\x02')
+    assert parser.parse_structure('second') == 2
+    assert started == ['second', 'first']
+    assert [structure for structure, _ in ended] == ['first', 'second']
+    first, second = (measurements for _, measurements in ended)
+    assert first['err'] is None and first['bytes_read'] == 1
+    assert second['dependency_time'] >= first['time']
+    profiler.remove_hooks(start=start, end=end)
+    with pytest.raises(ValueError):
+        TimedParser(b'\x00\x02').parse_structure('second')
+    assert len(started) == 2 and len(ended) == 2
+    stats = profiler.to_dict()['TimedParser']['structures']
+    assert stats['first']['failures'] == 1
+    assert stats['second']['failures'] == 1
+
+def test_nested_time_is_exclusive_in_totals(profiler):
+    parser = TimedParser(b'\x01\x02')
+    parser.parse_structure('second')
+    stats = profiler.to_dict()['TimedParser']
+    first, second = stats['structures']['first'], stats['structures']['second']
+    assert second['dependency_time'] >= DELAY
+    assert second['self_dependency_time'] < DELAY
+    assert second['self_time'] < DELAY
+    assert second['total_time'] == pytest.approx(second['self_time'] + first['total_time'], abs=1e-3)
+    totals = stats['totals']
+    assert totals['calls'] == 2
+    assert totals['total_time'] == pytest.approx(first['self_time'] + second['self_time'])
+    assert totals['total_time'] < first['total_time'] + second['total_time']
+    assert totals['bytes_read'] == 2
+
+def test_nested_parse_is_exclusive_in_totals(profiler):
+    parser = TimedParser(b'\x01\x02')
+    assert parser.parse_structure('third') == 3
+    stats = profiler.to_dict()['TimedParser']
+    first, third = stats['structures']['first'], stats['structures']['third']
+    assert third['parse_time'] >= DELAY and third['self_parse_time'] < DELAY
+    assert (third['bytes_read'], third['self_bytes_read']) == (2, 1)
+    assert stats['totals']['bytes_read'] == 2
+    assert stats['totals']['parse_time'] == pytest.approx(
+        first['self_parse_time'] + third['self_parse_time']
+    )
+
+def test_json_export(profiler):
+    TimedParser(b'\x01\x02\x03').parse()
+    exported = json.loads(profiler.to_json())
+    assert list(exported) == ['TimedParser']
+    entry = exported['TimedParser']
+    assert set(entry) == {'structures', 'totals'}
+    assert set(entry['structures']) == {'first', 'second', 'third'}
+    ## NOTE: first is parsed again while parsing third
+    assert entry['structures']['first']['calls'] == 2
+    assert entry['structures']['first']['mean_time'] >= DELAY
+    profiler.reset()
+    assert profiler.to_dict() == dict()
@@ -0,0 +1,75 @@
+## -*- coding: UTF-8 -*-
+## tests/test_records.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import struct
+
+from .. import ByteParser, FileRecordParser, StructureProperty
+from ..checkpoint import Checkpoint
+
+class ValueParser(ByteParser):
+    value = StructureProperty(0, 'value')
+
+    def _parse_value(self):
+        return struct.unpack('<I', self.stream.read(4))[0]
+
+class ValuesParser(FileRecordParser):
+    RECORD_PARSER = ValueParser
+    RECORD_SIZE = 4
+
+def _write(filepath, values):
+    with open(filepath, 'wb') as fhandle:
+        for value in values:
+            fhandle.write(struct.pack('<I', value))
+    return filepath
+
+def test_reset_reuses_instance_across_sources(tmp_path):
+    first = _write(str(tmp_path / 'first'), range(10))
+    second = _write(str(tmp_path / 'second'), range(100, 103))
+    checkpoint = Checkpoint(str(tmp_path / 'first.checkpoint'))
+    parser = ValuesParser(first, checkpoint=checkpoint)
+    assert len(list(parser.tail())) == 10
+    assert parser.tail_state.get('offset') == 40
+    parser.reset(second)
+    assert parser.tail_state is None
+    assert parser.checkpoint is None
+    assert parser._next_offset is None
+    assert [record.value for _, record in parser.tail()] == [100, 101, 102]
+    assert parser.tail_state.get('offset') == 12
+    assert checkpoint.load(ValuesParser(first), match_fingerprint=False).get('tail').get('offset') == 40
+
+def test_tail_logs_partial_record_at_debug(tmp_path, caplog):
+    filepath = _write(str(tmp_path / 'growing'), range(3))
+    with open(filepath, 'ab') as fhandle:
+        fhandle.write(b'\x01\x02')
+    parser = ValuesParser(filepath)
+    with caplog.at_level('DEBUG'):
+        assert len(list(parser.tail())) == 3
+        assert len(list(parser.tail())) == 0
+    assert not any(entry.levelname == 'ERROR' for entry in caplog.records)
+    with caplog.at_level('DEBUG'):
+        caplog.clear()
+        assert len(list(ValuesParser(filepath).records())) == 3
+    assert any(entry.levelname == 'ERROR' for entry in caplog.records)
+    with open(filepath, 'ab') as fhandle:
+        fhandle.write(b'\x03\x04')
+    assert [record.value for _, record in parser.tail()] == [0x04030201]
@@ -0,0 +1,48 @@
+## -*- coding: UTF-8 -*-
+## tests/test_serialization.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import io
+import json
+from collections import OrderedDict
+from construct.lib import Container
+
+from ..serialization import iter_json, ResultWriter
+
+def test_mappings_and_sequences_are_encoded_as_json():
+    value = Container(
+        flags=dict(archive=True, names=['a', ('b', 1)]),
+        runs=OrderedDict(first=range(2)),
+        RawData=b'\x00',
+        data=b'\x01'
+    )
+    assert json.loads(''.join(iter_json(value))) == dict(
+        flags=dict(archive=True, names=['a', ['b', 1]]),
+        runs=dict(first=[0, 1]),
+        data='01'
+    )
+
+def test_csv_cells_encode_mappings_as_json():
+    output = io.StringIO()
+    with ResultWriter(output, format='csv') as writer:
+        writer.write(Container(name='a', flags=dict(archive=True)))
+    assert output.getvalue().splitlines() == ['name,flags', 'a,"{""archive"":true}"']
@@ -0,0 +1,185 @@
+## -*- coding: UTF-8 -*-
+## tests/test_streams.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+from io import BytesIO, SEEK_CUR, SEEK_END
+import random
+
+import pytest
+
+from .. import ByteParser, FileParser, StructureProperty, parse_windows
+from ..streams import BufferStream, MemoryMappedStream, PrefetchStream
+
+DATA = bytes(range(256)) * 4
+
+class PairParser(ByteParser):
+    first = StructureProperty(0, 'first')
+    second = StructureProperty(1, 'second')
+
+    def _parse_first(self):
+        return self.stream.read(1)[0]
+    def _parse_second(self):
+        return self.stream.read(1)[0]
+
+def test_buffer_stream_window_boundaries():
+    with BufferStream(DATA, 10, 20) as stream:
+        assert len(stream) == 20
+        assert stream.read(5) == DATA[10:15]
+        assert stream.read(100) == DATA[15:30]
+        assert stream.read(1) == b'' and stream.tell() == 20
+        assert stream.seek(-3, SEEK_END) == 17
+        target = bytearray(8)
+        assert stream.readinto(target) == 3
+        assert bytes(target[:3]) == DATA[27:30]
+        assert stream.seek(50) == 50
+        assert stream.read() == b'' and stream.readinto(target) == 0
+        assert stream.seek(-45, SEEK_CUR) == 5
+        assert stream.read(2) == DATA[15:17]
+        assert bytes(stream.view(18)) == DATA[28:30]
+        assert bytes(stream.view(0, 4)) == DATA[10:14]
+        assert bytes(stream.view()) == DATA[17:30]
+        with pytest.raises(ValueError):
+            stream.seek(-1)
+    with BufferStream(DATA, len(DATA)) as stream:
+        assert len(stream) == 0 and stream.read() == b''
+
+def test_buffer_stream_is_zero_copy():
+    source = bytearray(DATA[:16])
+    with BufferStream(source, 4) as stream:
+        source[4] = 0xFF
+        assert stream.read(1) == b'\xff'
+        assert stream.getbuffer().readonly
+        view = stream.view(0, 2)
+        with pytest.raises(TypeError):
+            view[0] = 0
+        view.release()
+
+def test_memory_mapped_stream(tmp_path):
+    path = tmp_path / 'data.bin'
+    path.write_bytes(DATA)
+    with MemoryMappedStream(str(path)) as stream:
+        assert stream.seek(-2, SEEK_END) == len(DATA) - 2
+        assert stream.read(4) == DATA[-2:]
+        stream.seek(100)
+        assert stream.read(3) == DATA[100:103]
+    empty = tmp_path / 'empty.bin'
+    empty.write_bytes(b'')
+    with MemoryMappedStream(str(empty)) as stream:
+        assert stream.read() == b''
+
+def test_parse_windows():
+    windows = [(0, 2), (2, None), (len(DATA) - 1, 1), (4, 2)]
+    results = list()
+    fingerprints = list()
+    for parser in parse_windows(PairParser, memoryview(DATA), windows):
+        results.append((parser.first, parser.second))
+        fingerprints.append(parser.get_fingerprint())
+        assert parser.stream is None
+    assert results == [(0, 1), (2, 3), (255, None), (4, 5)]
+    assert len(set(fingerprints)) == 4
+
+def test_window_seek_is_relative():
+    parser = PairParser(DATA, window=(8, 8))
+    with parser:
+        parser.stream.seek(6)
+        assert parser.parse_structure('first') == 14
+        assert parser.parse_structure('second') == 15
+        with pytest.raises(IndexError):
+            parser.parse_structure('first')
+
+class HeaderFileParser(FileParser):
+    first = StructureProperty(0, 'first')
+    second = StructureProperty(1, 'second')
+
+    def _parse_first(self):
+        self.stream.seek(-2, SEEK_END)
+        return self.stream.read(2)
+    def _parse_second(self):
+        self.stream.seek(3)
+        return self.stream.read(6)
+
+@pytest.fixture
+def datafile(tmp_path):
+    path = tmp_path / 'data.bin'
+    path.write_bytes(DATA)
+    return str(path)
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_prefetch_stream_matches_file(datafile, prefetch):
+    generator = random.Random(0)
+    reference = BytesIO(DATA)
+    with PrefetchStream(datafile, block_size=16, cache_blocks=2, prefetch=prefetch) as stream:
+        for _ in range(500):
+            offset = generator.choice([
+                generator.randrange(0, len(DATA) + 32), 
+                generator.randrange(0, len(DATA) // 16) * 16, 
+                len(DATA) - 1
+            ])
+            size = generator.choice([0, 1, 15, 16, 17, 33, -1])
+            stream.seek(offset)
+            reference.seek(offset)
+            if generator.random() < 0.5:
+                assert stream.read(size) == reference.read(size)
+            else:
+                target, expected = bytearray(max(size, 0)), bytearray(max(size, 0))
+                assert stream.readinto(target) == reference.readinto(expected)
+                assert target == expected
+            assert stream.tell() == reference.tell()
+
+def test_prefetch_stream_block_boundaries(datafile):
+    with PrefetchStream(datafile, block_size=16, cache_blocks=2, prefetch=0) as stream:
+        assert stream.read(16) == DATA[:16]
+        assert stream.read(1) == DATA[16:17]
+        assert stream.cache_misses == 2
+        stream.seek(15)
+        assert stream.read(2) == DATA[15:17]
+        assert stream.stats() == dict(bytes_read=32, syscalls=2, cache_hits=2, cache_misses=2)
+        ## NOTE: only the last cache_blocks blocks are kept
+        stream.seek(32)
+        assert stream.read(1) == DATA[32:33]
+        stream.seek(0)
+        assert stream.read(1) == DATA[:1]
+        assert stream.cache_misses == 4
+        assert stream.seek(-4, SEEK_END) == len(DATA) - 4
+        assert stream.read(8) == DATA[-4:]
+        assert stream.read(8) == b''
+        stream.seek(len(DATA) + 100)
+        assert stream.read(8) == b'' and stream.tell() == len(DATA) + 100
+        with pytest.raises(ValueError):
+            stream.seek(-1)
+    with pytest.raises(ValueError):
+        stream.read(1)
+
+def test_prefetch_stream_reads_ahead(datafile):
+    with PrefetchStream(datafile, block_size=16, cache_blocks=4, prefetch=2) as stream:
+        for offset in range(0, len(DATA), 8):
+            assert stream.read(8) == DATA[offset:offset + 8]
+        stats = stream.stats()
+        assert stats['bytes_read'] == len(DATA)
+        assert stats['cache_misses'] == 1
+        ## NOTE: blocks past the end of the file may be read ahead as well
+        assert len(DATA) // 16 <= stats['syscalls'] <= len(DATA) // 16 + 2
+
+def test_file_parser_prefetch(datafile):
+    expected = HeaderFileParser(datafile).parse()
+    parser = HeaderFileParser(datafile, prefetch=dict(block_size=4, prefetch=1)).parse()
+    assert (parser.first, parser.second) == (expected.first, expected.second)
+    assert (parser.first, parser.second) == (DATA[-2:], DATA[3:9])
@@ -0,0 +1,112 @@
+## -*- coding: UTF-8 -*-
+## tests/test_utils.py
+##
+## Copyright (c) 2018 analyzeDFIR
+## 
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+## 
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+## 
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+from datetime import datetime, timedelta
+from struct import pack
+
+import pytest
+from dateutil.tz import tzutc
+
+from .. import utils
+from ..utils import WindowsTime
+
+UNIX_EPOCH = WindowsTime.UNIX_EPOCH_OFFSET
+## NOTE: 2021-01-01 00:00:00 UTC plus offsets exercising microsecond rounding
+RECENT = UNIX_EPOCH + 16094592000000000
+VALUES = [
+    0, 
+    1, 
+    5, 
+    15, 
+    UNIX_EPOCH, 
+    UNIX_EPOCH + 1, 
+    RECENT + 4, 
+    RECENT + 5, 
+    RECENT + 6, 
+    RECENT + 15, 
+    RECENT + 1234567
+]
+
+def parse(value):
+    return WindowsTime(dw_low_datetime=value & 0xFFFFFFFF, dw_high_datetime=value >> 32).parse()
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(utils, 'np', None)
+    return request.param
+
+def test_parse_rounds_to_microsecond():
+    epoch = datetime(1601, 1, 1, tzinfo=tzutc())
+    assert parse(0) == epoch
+    assert parse(5) == epoch
+    assert parse(15) == epoch + timedelta(microseconds=2)
+    recent = datetime(2021, 1, 1, tzinfo=tzutc())
+    assert parse(RECENT + 4) == recent
+    assert parse(RECENT + 6) == recent + timedelta(microseconds=1)
+    assert parse(RECENT + 1234567) == recent + timedelta(microseconds=123457)
+    assert WindowsTime.to_filetime(parse(RECENT + 1234560)) == RECENT + 1234560
+    assert parse(2 ** 64 - 1) is None
+
+def test_parse_many_agrees_with_parse(backend):
+    expected = [parse(value) for value in VALUES]
+    assert WindowsTime.parse_many(VALUES, output='datetime') == expected
+    packed = b''.join(pack('<Q', value) for value in VALUES)
+    assert WindowsTime.parse_many(packed, output='datetime') == expected
+    lazy = WindowsTime.parse_many(packed, output='lazy')
+    assert list(lazy) == expected and list(lazy[2:4]) == expected[2:4]
+
+def test_nanoseconds_are_exact(backend):
+    ## NOTE: FILETIME values before 1677 cannot be represented as int64 nanoseconds
+    values = VALUES[4:]
+    nanoseconds = [int(value) for value in WindowsTime.parse_many(values, output='nanoseconds')]
+    assert nanoseconds == [(value - UNIX_EPOCH) * 100 for value in values]
+    assert nanoseconds[1] == 100
+    for value, result in zip(values, nanoseconds):
+        delta = parse(value) - datetime(1970, 1, 1, tzinfo=tzutc())
+        microseconds = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+        assert abs(microseconds * 1000 - result) <= 500
+
+def test_out_of_range_values(backend):
+    values = [
+        WindowsTime._MIN_NS_FILETIME, 
+        WindowsTime._MAX_NS_FILETIME, 
+        WindowsTime._MAX_NS_FILETIME + 1, 
+        2 ** 64 - 1
+    ]
+    nanoseconds = WindowsTime.parse_many(values, output='nanoseconds')
+    assert [int(value) for value in nanoseconds[:2]] == [
+        (value - UNIX_EPOCH) * 100 for value in values[:2]
+    ]
+    if backend == 'numpy':
+        np = pytest.importorskip('numpy')
+        assert list(nanoseconds[2:]) == [np.iinfo(np.int64).min] * 2
+        datetimes = WindowsTime.parse_many(values, output='datetime64')
+        assert not np.isnat(datetimes[:2]).any() and np.isnat(datetimes[2:]).all()
+        assert datetimes[1] == np.datetime64(int(nanoseconds[1]), 'ns')
+    else:
+        assert nanoseconds[2:] == [None, None]
+        with pytest.raises(ImportError):
+            WindowsTime.parse_many(values, output='datetime64')
+    assert WindowsTime.parse_many(values, output='datetime')[3] is None
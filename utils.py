@@ -25,9 +25,18 @@ import logging
 Logger = logging.getLogger(__name__)
 from os import path
 import hashlib
-from datetime import datetime
+from collections import OrderedDict
+from collections.abc import Sequence
+from concurrent.futures import Future
+from threading import Thread
+from sys import byteorder
+from array import array
+from datetime import datetime, timedelta
 from dateutil.tz import tzlocal, tzutc
 
+from .lazy import lazy_import
+np = lazy_import('numpy', optional=True)
+
 class WindowsTime(object):
     '''
     Class for converting raw timestamps in MFT to python DateTime object.
@@ -35,12 +44,125 @@ class WindowsTime(object):
     100-nanosecond intervals since 01/01/1601 00:00:00 UTC. Implementation
     and design inspired by original analyzeMFT (mftutils.WindowsTime)
     '''
+    EPOCH = datetime(1601, 1, 1, tzinfo=tzutc())
+    ## NOTE: number of 100ns intervals between 01/01/1601 and 01/01/1970
+    UNIX_EPOCH_OFFSET = 116444736000000000
+    ## NOTE: range of FILETIME values representable as int64 nanoseconds since 01/01/1970
+    _MIN_NS_FILETIME = max(0, UNIX_EPOCH_OFFSET - (2 ** 63 - 1) // 100)
+    _MAX_NS_FILETIME = UNIX_EPOCH_OFFSET + (2 ** 63 - 1) // 100
+
     @classmethod
     def parse_filetime(cls, filetime=None, dw_low_datetime=None, dw_high_datetime=None):
         '''
         @WindowsTime.parse
         '''
         return cls(filetime, dw_low_datetime, dw_high_datetime).parse()
+    @classmethod
+    def to_filetime(cls, value):
+        '''
+        Args:
+            value: DateTime => timestamp to convert (naive timestamps are assumed UTC)
+        Returns:
+            Integer
+            FILETIME value of timestamp
+        Preconditions:
+            value is of type DateTime
+        '''
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=tzutc())
+        delta = value - cls.EPOCH
+        return (delta.days * 86400 + delta.seconds) * 10000000 + delta.microseconds * 10
+    @classmethod
+    def _to_datetime(cls, value):
+        '''
+        Args:
+            value: Integer  => FILETIME value
+        Returns:
+            Python DateTime object (UTC) of FILETIME value rounded to the 
+            nearest microsecond (ties to even) if no error thrown, None otherwise
+        Preconditions:
+            value is of type Integer
+        '''
+        ## NOTE: rounds like datetime.fromtimestamp, but on the exact integer 
+        ## value instead of a float number of seconds since 01/01/1970 (which 
+        ## cannot represent recent timestamps to the microsecond)
+        microseconds, remainder = divmod(value, 10)
+        if remainder > 5 or (remainder == 5 and microseconds % 2 == 1):
+            microseconds += 1
+        try:
+            return cls.EPOCH + timedelta(microseconds=microseconds)
+        except:
+            return None
+    @classmethod
+    def _to_array(cls, filetimes):
+        '''
+        Args:
+            filetimes: Iterable<Integer>|Bytes  => FILETIME values
+        Returns:
+            NumPy uint64 array if NumPy is available, array.array of type 'Q'
+            or list of Integer otherwise
+            FILETIME values, where bytes-like objects are interpreted as packed
+            little-endian 64-bit integers
+        Preconditions:
+            filetimes is an iterable of Integer or a bytes-like object
+        '''
+        if isinstance(filetimes, (bytes, bytearray, memoryview)):
+            if np is not None:
+                return np.frombuffer(filetimes, dtype='<u8').astype(np.uint64, copy=False)
+            values = array('Q')
+            values.frombytes(filetimes)
+            if byteorder != 'little':
+                values.byteswap()
+            return values
+        if np is not None:
+            return np.asarray(filetimes, dtype=np.uint64)
+        if isinstance(filetimes, array):
+            return filetimes
+        return list(map(int, filetimes))
+    @classmethod
+    def parse_many(cls, filetimes, output='datetime64'):
+        '''
+        Args:
+            filetimes: Iterable<Integer>|Bytes  => FILETIME values (see WindowsTime._to_array)
+            output: String                      => one of:
+                datetime64:     NumPy datetime64[ns] array (exact to 100ns, invalid 
+                                values are NaT), requires NumPy
+                nanoseconds:    nanoseconds since 01/01/1970 as NumPy int64 array 
+                                if NumPy is available (invalid values are the NaT
+                                sentinel), list of Integer otherwise (invalid 
+                                values are None), exact to 100ns
+                datetime:       list of Python DateTime objects (UTC, invalid values are None)
+                lazy:           WindowsTimeSequence that builds Python DateTime 
+                                objects on access
+        Returns:
+            Any
+            Converted FILETIME values (see output)
+        Preconditions:
+            output is one of datetime64, nanoseconds, datetime, lazy
+        '''
+        assert output in ('datetime64', 'nanoseconds', 'datetime', 'lazy')
+        values = cls._to_array(filetimes)
+        if output == 'lazy':
+            return WindowsTimeSequence(values)
+        elif output == 'datetime':
+            return list(map(cls._to_datetime, map(int, values)))
+        elif np is not None:
+            valid = (values >= cls._MIN_NS_FILETIME) & (values <= cls._MAX_NS_FILETIME)
+            nanoseconds = (
+                values.astype(np.int64, casting='unsafe') - np.int64(cls.UNIX_EPOCH_OFFSET)
+            ) * np.int64(100)
+            if output == 'nanoseconds':
+                return np.where(valid, nanoseconds, np.iinfo(np.int64).min)
+            result = nanoseconds.view('datetime64[ns]')
+            result[~valid] = np.datetime64('NaT')
+            return result
+        elif output == 'datetime64':
+            raise ImportError('NumPy is required for datetime64 output')
+        return [
+            (value - cls.UNIX_EPOCH_OFFSET) * 100 \
+            if cls._MIN_NS_FILETIME <= value <= cls._MAX_NS_FILETIME else None \
+            for value in map(int, values)
+        ]
 
     def __init__(self, filetime=None, dw_low_datetime=None, dw_high_datetime=None):
         assert (\
@@ -62,52 +184,194 @@ class WindowsTime(object):
             N/A
         Returns:
             Python DateTime object of converted NTFSFILETIME if no error thrown,
-            None otherwise
+            None otherwise (see WindowsTime._to_datetime).  A FILETIME of 0 
+            converts to 01/01/1601 00:00:00 UTC, as it did when the value was 
+            passed to datetime.fromtimestamp on platforms that accept negative 
+            timestamps (on Windows, which does not, it used to convert to None)
+        Preconditions:
+            N/A
+        '''
+        return self._to_datetime((self._high << 32) | self._low)
+
+class WindowsTimeSequence(Sequence):
+    '''
+    Read-only sequence over FILETIME values that converts each value
+    to a Python DateTime object (see WindowsTime._to_datetime) only
+    when it is accessed.
+    '''
+    def __init__(self, values):
+        self._values = values
+    def __len__(self):
+        return len(self._values)
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return WindowsTimeSequence(self._values[idx])
+        return WindowsTime._to_datetime(int(self._values[idx]))
+    def __repr__(self):
+        return '%s(<%d values>)'%(type(self).__name__, len(self))
+
+class FileHasher(object):
+    '''
+    Class for computing one or more digests of a file in a single pass.
+    The file is read once in chunks of chunk_size bytes into a reusable
+    buffer, and each chunk is fed to every requested digest.  Since hashlib
+    releases the GIL when updating on large buffers, hashing can optionally
+    be run on a worker thread (see FileHasher.submit) so that it overlaps
+    with parsing.
+    '''
+    DEFAULT_ALGORITHMS = ('md5', 'sha1', 'sha256')
+    DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, algorithms=None, chunk_size=None):
+        self.algorithms = self.DEFAULT_ALGORITHMS if algorithms is None else algorithms
+        self.chunk_size = self.DEFAULT_CHUNK_SIZE if chunk_size is None else chunk_size
+    @property
+    def algorithms(self):
+        '''
+        Getter for algorithms
+        '''
+        return self.__algorithms
+    @algorithms.setter
+    def algorithms(self, value):
+        '''
+        Setter for algorithms
+        '''
+        assert isinstance(value, (list, tuple, set, frozenset))
+        assert len(value) > 0 and all(isinstance(algorithm, str) for algorithm in value)
+        self.__algorithms = tuple(OrderedDict.fromkeys(value))
+    @property
+    def chunk_size(self):
+        '''
+        Getter for chunk_size
+        '''
+        return self.__chunk_size
+    @chunk_size.setter
+    def chunk_size(self, value):
+        '''
+        Setter for chunk_size
+        '''
+        assert isinstance(value, int) and value > 0
+        self.__chunk_size = value
+    def _create_digests(self):
+        '''
+        Args:
+            N/A
+        Returns:
+            OrderedDict<String, Any>
+            New hashlib digest objects for each algorithm that is
+            available, algorithms that are not available map to None
         Preconditions:
             N/A
         '''
+        digests = OrderedDict()
+        for algorithm in self.algorithms:
+            try:
+                digests[algorithm] = hashlib.new(algorithm)
+            except Exception as e:
+                Logger.error('Unable to obtain %s hash of file (%s)'%(algorithm, str(e)))
+                digests[algorithm] = None
+        return digests
+    def hash_stream(self, stream):
+        '''
+        Args:
+            stream: BufferedReader  => readable binary stream to hash
+        Returns:
+            OrderedDict<String, String>
+            Hex digest of the remaining contents of stream for each algorithm
+            (None for algorithms that could not be created)
+        Preconditions:
+            stream implements readinto
+        '''
+        digests = self._create_digests()
+        updaters = [digest.update for digest in digests.values() if digest is not None]
+        buffer = bytearray(self.chunk_size)
+        view = memoryview(buffer)
         try:
-            return datetime.fromtimestamp(
-                ( float(self._high) * 2 ** 32 + self._low ) * 1e-7 - 11644473600,
-                tz=tzutc()
-            )
-        except:
-            return None
+            read = stream.readinto(buffer)
+            while read:
+                chunk = view if read == len(buffer) else view[:read]
+                for update in updaters:
+                    update(chunk)
+                read = stream.readinto(buffer)
+        finally:
+            view.release()
+        return OrderedDict(
+            (algorithm, None if digest is None else digest.hexdigest()) \
+            for algorithm, digest in digests.items()
+        )
+    def hash_file(self, filepath):
+        '''
+        Args:
+            filepath: String    => path to file to hash
+        Returns:
+            OrderedDict<String, String>
+            Hex digest of file for each algorithm
+        Preconditions:
+            filepath is of type String
+        '''
+        assert isinstance(filepath, str)
+        with open(filepath, 'rb', buffering=0) as hashfile:
+            return self.hash_stream(hashfile)
+    def submit(self, filepath):
+        '''
+        Args:
+            filepath: String    => path to file to hash
+        Returns:
+            Future<OrderedDict<String, String>>
+            Future that resolves to the result of FileHasher.hash_file,
+            computed on a daemon worker thread
+        Preconditions:
+            filepath is of type String
+        '''
+        assert isinstance(filepath, str)
+        future = Future()
+        def worker():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self.hash_file(filepath))
+            except Exception as e:
+                future.set_exception(e)
+        Thread(target=worker, name='FileHasher(%s)'%filepath, daemon=True).start()
+        return future
 
 class FileMetadataMixin(object):
     '''
     Mixin class to provide functions for retrieving file metadata (including hashes).
     '''
-    @staticmethod
-    def __hash_file(filepath, algorithm):
+    _METADATA_HASHES = OrderedDict([
+        ('md5hash', 'md5'),
+        ('sha1hash', 'sha1'),
+        ('sha2hash', 'sha256')
+    ])
+    _METADATA_CHUNK_SIZE = FileHasher.DEFAULT_CHUNK_SIZE
+
+    @classmethod
+    def __hash_file(cls, filepath):
         '''
         Args:
             filepath: String    => path to file to hash
-            algorithm: String   => hash algorithm to use
         Returns:
-            String
-            Hex digest of hash of prefetch file
+            Dict<String, String>
+            Hex digests of file keyed by metadata field (see _METADATA_HASHES),
+            computed in a single pass over the file
         Preconditions:
             filepath is of type String
-            algorithm is of type String
         '''
         assert isinstance(filepath, str)
-        assert isinstance(algorithm, str)
+        hasher = FileHasher(
+            list(cls._METADATA_HASHES.values()), 
+            cls._METADATA_CHUNK_SIZE
+        )
         try:
-            hash = getattr(hashlib, algorithm)
+            digests = hasher.hash_file(filepath)
         except Exception as e:
-            Logger.error('Unable to obtain %s hash of file (%s)'%(algorithm, str(e)))
-            return None
-        else:
-            hashfile = open(filepath, 'rb')
-            try:
-                chunk = hashfile.read(4096)
-                while chunk != b'':
-                    hash.update(chunk)
-                return hash.hexdigest()
-            finally:
-                hashfile.close()
-                hashfile = None
+            Logger.error('Unable to hash file %s (%s)'%(filepath, str(e)))
+            digests = dict()
+        return {
+            field: digests.get(algorithm) \
+            for field, algorithm in cls._METADATA_HASHES.items()
+        }
     @classmethod
     def __get_metadata(cls, filepath):
         '''
@@ -129,13 +393,10 @@ class FileMetadataMixin(object):
             filepath is not None and points to a valid file (assumed True)
         '''
         try:
-            return dict(
+            metadata = dict(
                 file_name=path.basename(filepath),
                 file_path=path.abspath(filepath),
                 file_size=path.getsize(filepath),
-                md5hash=cls.__hash_file(filepath, 'md5'),
-                sha1hash=cls.__hash_file(filepath, 'sha1'),
-                sha2hash=cls.__hash_file(filepath, 'sha256'),
                 modify_time=datetime.fromtimestamp(
                     path.getmtime(filepath), 
                     tzlocal()
@@ -149,6 +410,8 @@ class FileMetadataMixin(object):
                     tzlocal()
                 ).astimezone(tzutc())
             )
+            metadata.update(cls.__hash_file(filepath))
+            return metadata
         except Exception as e:
             Logger.error('Failed to retrieve metadata for file %s (%s)'%(filepath, str(e)))
 
@@ -157,17 +420,43 @@ class FileMetadataMixin(object):
         '''
         Getter for metadata
         '''
-        if not hasattr(self.source) or not path.exists(self.source):
+        source = getattr(self, 'source', None)
+        if not isinstance(source, str) or not path.exists(source):
             return None
-        elif not hasattr(self.__metadatadata) or self.__metadatadata is None:
-            self.__metadatadata = self.__get_metadatadata(self.source)
-        return self.__metadatadata
+        elif getattr(self, '_FileMetadataMixin__metadata', None) is None:
+            self.__metadata = self.__get_metadata(source)
+        return self.__metadata
     @metadata.setter
     def metadata(self, value):
         '''
         Setter for metadata
         '''
         raise AttributeError('Cannot set dynamic attribute metadata')
+    def _clear_metadata(self):
+        '''
+        Args:
+            N/A
+        Procedure:
+            Discard cached metadata so it is recomputed on next access
+        Preconditions:
+            N/A
+        '''
+        self.__metadata = None
+    async def ametadata(self, executor=None):
+        '''
+        Args:
+            executor: Executor  => executor to hash in (default executor of the
+                                   running event loop if None)
+        Returns:
+            Dict<String, Any>
+            self.metadata, computed in executor so that hashing does not
+            stall the event loop
+        Preconditions:
+            Called from a coroutine running in an event loop
+        '''
+        ## NOTE: see BaseParser.aparse
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(executor, lambda: self.metadata)
 
 class StructureProperty(object):
     '''
@@ -190,6 +479,7 @@ class StructureProperty(object):
         self.name = name
         self.deps = deps
         self.dynamic = dynamic
+        self.__descriptor = None
     @property
     def idx(self):
         '''
@@ -204,6 +494,15 @@ class StructureProperty(object):
         assert isinstance(value, int)
         self.__idx = value
     @property
+    def descriptor(self):
+        '''
+        Getter for descriptor (the property installed on parser classes
+        for this structure, created once and shared by subclasses)
+        '''
+        if self.__descriptor is None:
+            self.__descriptor = property(self.get_property, self.set_property)
+        return self.__descriptor
+    @property
     def name(self):
         '''
         Getter for name
@@ -253,6 +552,16 @@ class StructureProperty(object):
         '''
         if self.deps is None:
             return True
+        masks = getattr(obj, '_DEPENDENCY_MASKS', None)
+        if masks is not None:
+            mask = masks.get(self.name, 0)
+            if (obj._satisfied & mask) != mask:
+                return False
+            properties = obj._PROPERTIES
+            return all(
+                (hasattr(obj, dep) and getattr(obj, dep) is not None) \
+                for dep in self.deps if dep != self.name and not (dep in properties)
+            )
         return all([(hasattr(obj, dep) and getattr(obj, dep) is not None) for dep in self.deps if dep != self.name])
     def get_property(self, obj):
         '''
@@ -269,7 +578,9 @@ class StructureProperty(object):
             raise AttributeError('no object to retrieve property from')
         elif not (hasattr(obj, '_PROPERTIES') and self.name in obj._PROPERTIES):
             raise AttributeError('object of type %s does not have property %s'%(type(obj), self.name))
-        elif not self._check_dependencies(obj):
+        if getattr(obj, 'lazy', False) and getattr(obj, prop, None) is None:
+            obj._parse_lazy(self.name)
+        if not self._check_dependencies(obj):
             raise AttributeError('dependencies not met for property %s (%s)'%(self.name, ', '.join(self.deps)))
         if self.dynamic:
             return obj.parse_structure(self.name)
@@ -288,6 +599,12 @@ class StructureProperty(object):
             raise AttributeError('property %s is read-only'%self.name)
         try:
             setattr(obj, '__%s'%self.name, value)
+            bits = getattr(obj, '_PROPERTY_BITS', None)
+            if bits is not None:
+                if value is None:
+                    obj._satisfied &= ~bits.get(self.name)
+                else:
+                    obj._satisfied |= bits.get(self.name)
         except Exception as e:
             raise AttributeError('failed to set value on property %s (%s)'%(self.name, str(e)))
     def __repr__(self):